@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+from tools.logger import Logger, Type
+from tools.capacity_report import generate_capacity_test_report, generate_fleet_report, reconstruct_capacity_tests
+from tools.fleet_index import FleetIndex
+from tools.exporter import export_session, COMPRESSIONS
+from tools.logger import Action
+from global_consts import Config
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import argparse
+import os
+import sys
+import traceback
+
+###########################################
+# Command line tools for the station
+# Usage: cli.py <command> [options]
+###########################################
+
+# Worker processes don't share the parent's loaded config
+def _init_worker(config):
+    Config.config = config
+
+# Rebuild the report of the last completed capacity test in a log
+# Returns (log path, report folder, error)
+def regenerate_report(log_path, reports_folder=None):
+    try:
+        logger = Logger.from_file(log_path)
+        tests = reconstruct_capacity_tests(logger)
+        if not tests:
+            return log_path, None, "No completed capacity test found"
+        capacity, report_data = tests[-1]
+        report_folder = generate_capacity_test_report(logger, logger.id, capacity, report_data, reports_folder)
+        return log_path, report_folder, None
+    except Exception:
+        return log_path, None, traceback.format_exc()
+
+def regenerate_command(args):
+    log_files = Logger.find_log_files(args.logs)
+    if not log_files:
+        print("No battery logs found")
+        return 1
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker, initargs=(Config.config,)) as executor:
+        futures = [executor.submit(regenerate_report, f, args.reports_folder) for f in log_files]
+        for future in as_completed(futures):
+            log_path, report_folder, err = future.result()
+            if err is None:
+                print(f"{log_path} -> {report_folder}")
+            else:
+                failed += 1
+                print(f"{log_path}: {err}", file=sys.stderr)
+
+    Logger.get_sys_logger().log(Type.GENERAL, f"Regenerated {len(log_files) - failed}/{len(log_files)} reports")
+    return 1 if failed else 0
+
+def index_rebuild_command(args):
+    count = FleetIndex.get_index().rebuild(args.logs_folder, args.jobs)
+    print(f"Indexed {count} battery logs")
+    return 0
+
+def index_query_command(args):
+    index = FleetIndex.get_index()
+    if args.sessions:
+        for row in index.find_sessions(args.sn, args.start, args.end):
+            print(f"{row['started_at']}\t{row['serial_num']}\t{row['log_file']}")
+    else:
+        for row in index.find_tests(args.sn, args.start, args.end, args.min_cap, args.max_cap):
+            print(f"{row['completed_at']}\t{row['serial_num']}\t{row['capacity']}mAh\t{row['log_file']}")
+    return 0
+
+def fleet_report_command(args):
+    threshold = args.threshold if args.threshold is not None else Config.config[Config.PASS_CAPACITY_KEY]
+    report_folder = generate_fleet_report(FleetIndex.get_index(), threshold, args.start, args.end, args.sn, args.reports_folder)
+    if report_folder is None:
+        print("No capacity tests found")
+        return 1
+    print(report_folder)
+    return 0
+
+def export_command(args):
+    log_files = Logger.find_log_files(args.logs)
+    os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for log_path in log_files:
+        try:
+            logger = Logger.from_file(log_path)
+            file_name = os.path.splitext(logger.file_name)[0] + ".csv"
+            print(export_session(logger, args.output, args.compression, file_name))
+        except Exception as err:
+            failed += 1
+            print(f"{log_path}: {err}", file=sys.stderr)
+    return 1 if failed else 0
+
+# Channels are numbered from 1 on the command line, like the batteries in the GUI
+def station_command(args):
+    # Imported here, the other commands run without the station's hardware libraries
+    from tools.control import send_request
+    request = {'command': args.station_command}
+    if 'battery' in args:
+        request['channel'] = args.battery - 1
+    if 'sn' in args:
+        request['serial_num'] = args.sn
+    if 'action' in args:
+        request['action'] = args.action
+    try:
+        answer = send_request(request)
+    except OSError as e:
+        print(f"No station listening on {Config.config[Config.CONTROL_SOCKET_KEY]}: {e}", file=sys.stderr)
+        return 1
+    if not answer['ok']:
+        print(answer['error'], file=sys.stderr)
+        return 1
+
+    if args.station_command == 'status':
+        for channel in answer['channels']:
+            if channel['connected']:
+                print(f"Battery {channel['index'] + 1}\t{channel['serial_num']}\t{channel['action']}\t{channel['state']}\t"
+                      f"{channel['voltage']}V\t{channel['charge']}mAh\t{channel['warning']}")
+            elif channel['awaiting_sn']:
+                print(f"Battery {channel['index'] + 1}\tWAITING FOR SN")
+            else:
+                print(f"Battery {channel['index'] + 1}\tNOT CONNECTED")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Battery Recertification Station tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    regenerate_parser = subparsers.add_parser('regenerate', help="Rebuild capacity test reports from existing battery logs")
+    regenerate_parser.add_argument('logs', nargs='+', help="Battery log files or folders containing them")
+    regenerate_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of worker processes (default: all cores)")
+    regenerate_parser.add_argument('-o', '--reports-folder', default=None, help="Reports folder (default: configured reports folder)")
+    regenerate_parser.set_defaults(func=regenerate_command)
+
+    index_parser = subparsers.add_parser('index', help="Query or rebuild the fleet history index")
+    index_subparsers = index_parser.add_subparsers(dest='index_command', required=True)
+
+    rebuild_parser = index_subparsers.add_parser('rebuild', help="Rebuild the index by scanning the battery logs")
+    rebuild_parser.add_argument('logs_folder', nargs='?', default=None, help="Logs folder (default: configured logs folder)")
+    rebuild_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of worker processes (default: all cores)")
+    rebuild_parser.set_defaults(func=index_rebuild_command)
+
+    query_parser = index_subparsers.add_parser('query', help="Look up capacity tests or sessions")
+    query_parser.add_argument('--sn', default=None, help="Battery serial number")
+    query_parser.add_argument('--start', type=datetime.fromisoformat, default=None, help="Earliest date (ISO format)")
+    query_parser.add_argument('--end', type=datetime.fromisoformat, default=None, help="Latest date (ISO format)")
+    query_parser.add_argument('--min-cap', type=float, default=None, help="Minimum capacity (mAh)")
+    query_parser.add_argument('--max-cap', type=float, default=None, help="Maximum capacity (mAh)")
+    query_parser.add_argument('--sessions', action='store_true', help="List sessions instead of capacity tests")
+    query_parser.set_defaults(func=index_query_command)
+
+    fleet_parser = subparsers.add_parser('fleet-report', help="Create a summary report across many batteries")
+    fleet_parser.add_argument('--sn', nargs='+', default=None, help="Battery serial numbers (default: all)")
+    fleet_parser.add_argument('--start', type=datetime.fromisoformat, default=None, help="Earliest test date (ISO format)")
+    fleet_parser.add_argument('--end', type=datetime.fromisoformat, default=None, help="Latest test date (ISO format)")
+    fleet_parser.add_argument('--threshold', type=float, default=None, help="Pass capacity in mAh (default: configured pass capacity)")
+    fleet_parser.add_argument('-o', '--reports-folder', default=None, help="Reports folder (default: configured reports folder)")
+    fleet_parser.set_defaults(func=fleet_report_command)
+
+    export_parser = subparsers.add_parser('export', help="Export full resolution battery log data to CSV")
+    export_parser.add_argument('logs', nargs='+', help="Battery log files or folders containing them")
+    export_parser.add_argument('-o', '--output', default='.', help="Output folder (default: current folder)")
+    export_parser.add_argument('-c', '--compression', choices=[c for c in COMPRESSIONS if c is not None], default=None, help="Compress the CSV")
+    export_parser.set_defaults(func=export_command)
+
+    station_parser = subparsers.add_parser('station', help="Control a headless station started with daemon.py")
+    station_subparsers = station_parser.add_subparsers(dest='station_command', required=True)
+    station_subparsers.add_parser('status', help="Show every channel")
+    enroll_parser = station_subparsers.add_parser('enroll', help="Set up a newly connected battery")
+    enroll_parser.add_argument('battery', type=int, help="Battery number")
+    enroll_parser.add_argument('sn', help="Battery serial number")
+    action_parser = station_subparsers.add_parser('action', help="Start an action on a battery")
+    action_parser.add_argument('battery', type=int, help="Battery number")
+    action_parser.add_argument('action', choices=[a.name for a in Action], help="Action to start")
+    sn_parser = station_subparsers.add_parser('serial_num', help="Change a battery's serial number")
+    sn_parser.add_argument('battery', type=int, help="Battery number")
+    sn_parser.add_argument('sn', help="New serial number")
+    logs_parser = station_subparsers.add_parser('toggle_logs', help="Turn a battery's logging on or off")
+    logs_parser.add_argument('battery', type=int, help="Battery number")
+    station_subparsers.add_parser('stop', help="Stop the station")
+    station_parser.set_defaults(func=station_command)
+
+    args = parser.parse_args(argv)
+    Config.load_config()
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+
+from tools.collector import CollectorIndex, CollectorServer
+import argparse
+import sys
+
+###########################################
+# Collector for a bank of stations, see tools/collector.py
+# Stations send to it once collector_url is set in their config.json
+# Usage: collector.py [--host HOST] [--port PORT] [--db DB]
+###########################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect telemetry and capacity results from many stations")
+    parser.add_argument('--host', default='0.0.0.0', help="Address to listen on (default: all)")
+    parser.add_argument('--port', type=int, default=8090, help="Port to listen on (default: 8090)")
+    parser.add_argument('--db', default='~/collector.db', help="Consolidated index (default: ~/collector.db)")
+    args = parser.parse_args(argv)
+
+    index = CollectorIndex(args.db)
+    server = CollectorServer(index, args.host, args.port)
+    print(f"Collecting on {args.host}:{args.port} into {index.db_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        index.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+from tools.logger import Logger, Type
+from tools.async_station import AsyncStation
+from tools.control import ControlServer
+from tools.telemetry_server import TelemetryPublisher, TelemetryServer
+from tools.uplink import StationUplink
+from tools.metrics import MetricsReporter
+from global_consts import Config
+import asyncio
+import signal
+import sys
+import traceback
+
+###########################################
+# Headless station, for boards without a screen
+# Runs every channel without loading Qt, controlled with cli.py station <command>
+# Usage: daemon.py
+###########################################
+
+async def run():
+    publisher = TelemetryPublisher.get_publisher()
+    station = AsyncStation(on_snapshot=lambda snapshot: publisher.publish([snapshot]))
+    server = ControlServer(station)
+    telemetry_server = TelemetryServer.start_configured()
+    uplink = StationUplink.start_configured()
+    metrics_reporter = MetricsReporter.start_configured()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, station.stop)
+    try:
+        await server.start()
+        await station.run()
+    finally:
+        await server.close()
+        if metrics_reporter is not None:
+            metrics_reporter.stop()
+        if uplink is not None:
+            uplink.stop()
+        if telemetry_server is not None:
+            telemetry_server.stop()
+        station.cleanup()
+        Logger.get_sys_logger().log(Type.GENERAL, "Objects Cleaned Up")
+
+def main():
+    Logger.get_sys_logger().log(Type.GENERAL, "START HEADLESS")
+    Config.load_config()
+    Logger.compact_logs()
+    try:
+        asyncio.run(run())
+    except Exception:
+        Logger.get_sys_logger().log(Type.ERROR, traceback.format_exc())
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
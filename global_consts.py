@@ -10,6 +10,7 @@ class Consts:
     BUS = 0
     LTC_I2C_ADDRESS = 0x64
     TCA_I2C_ADDRESS = 0x70
+    TCA_RESET_PIN = 6
 
 
 ##########################################
@@ -23,8 +24,45 @@ class Config:
     MIN_VOLTAGE_KEY = 'min_voltage'
     MAX_CHARGE_TIME_KEY = 'max_charge_time'
     MAX_DISCHARGE_TIME_KEY = 'max_discharge_time'
+    MIN_REST_TIME_KEY = 'min_rest_time'
+    MAX_REST_TIME_KEY = 'max_rest_time'
+    REST_VOLTAGE_SLOPE_KEY = 'rest_voltage_slope'
+    PASS_CAPACITY_KEY = 'pass_capacity'
+    PREDICTIVE_DISCHARGE_KEY = 'predictive_discharge'
+    PREDICTION_TOLERANCE_KEY = 'prediction_tolerance'
+    RECONDITION_MIN_VOLTAGE_KEY = 'recondition_min_voltage'
+    RECONDITION_MIN_GAIN_KEY = 'recondition_min_gain'
+    RECONDITION_MAX_CYCLES_KEY = 'recondition_max_cycles'
+    CHARGE_POWER_KEY = 'charge_power'
+    DISCHARGE_POWER_KEY = 'discharge_power'
+    CHARGE_POWER_BUDGET_KEY = 'charge_power_budget'
+    DISCHARGE_POWER_BUDGET_KEY = 'discharge_power_budget'
+    PHASE_STAGGER_KEY = 'phase_stagger'
+    CHANNELS_KEY = 'channels'
+    DASHBOARD_KEY = 'dashboard'
+    PRESENCE_SCAN_TIME_KEY = 'presence_scan_time'
+    CHANNEL_PROCESSES_KEY = 'channel_processes'
+    ASYNC_ENGINE_KEY = 'async_engine'
+    CONTROL_SOCKET_KEY = 'control_socket'
+    TELEMETRY_HOST_KEY = 'telemetry_host'
+    TELEMETRY_PORT_KEY = 'telemetry_port'
+    COLLECTOR_URL_KEY = 'collector_url'
+    STATION_ID_KEY = 'station_id'
+    UPLINK_SPOOL_KEY = 'uplink_spool'
+    METRICS_PORT_KEY = 'metrics_port'
+    METRICS_LOG_INTERVAL_KEY = 'metrics_log_interval'
     LOGS_FOLDER_KEY = 'logs_folder'
     REPORTS_FOLDER_KEY = 'reports_folder'
+    INDEX_FILE_KEY = 'index_file'
+    LOG_MAX_SIZE_KEY = 'log_max_size'
+    LOG_MAX_AGE_KEY = 'log_max_age'
+    LOG_COMPRESSION_KEY = 'log_compression'
+    LOG_RETENTION_KEY = 'log_retention'
+    VOLTAGE_DEADBAND_KEY = 'voltage_deadband'
+    CHARGE_DEADBAND_KEY = 'charge_deadband'
+    LOG_HEARTBEAT_KEY = 'log_heartbeat'
+    RESUME_MAX_AGE_KEY = 'resume_max_age'
+    EXPORT_COMPRESSION_KEY = 'export_compression'
 
     DEFAULT_CONFIG = {
             UPDATE_TIME_KEY: 5,
@@ -34,42 +72,85 @@ class Config:
             MIN_VOLTAGE_KEY: 22,
             MAX_CHARGE_TIME_KEY: 28800,     # 8hrs
             MAX_DISCHARGE_TIME_KEY: 19800,  # 5.5hrs
+            MIN_REST_TIME_KEY: 60,          # 1 min
+            MAX_REST_TIME_KEY: 1800,        # 30 mins
+            REST_VOLTAGE_SLOPE_KEY: 0.0001, # V/s
+            PASS_CAPACITY_KEY: 2000,        # mAh
+            PREDICTIVE_DISCHARGE_KEY: False,    # Stop capacity test discharges once the capacity can be predicted
+            PREDICTION_TOLERANCE_KEY: 0.02,     # Confidence interval half width, as a fraction of the predicted capacity
+            RECONDITION_MIN_VOLTAGE_KEY: 20,    # Deep discharge voltage while reconditioning
+            RECONDITION_MIN_GAIN_KEY: 20,       # mAh, stop reconditioning once a cycle gains less than this
+            RECONDITION_MAX_CYCLES_KEY: 5,
+            CHARGE_POWER_KEY: 30,               # W drawn by one charging channel
+            DISCHARGE_POWER_KEY: 25,            # W dissipated by one discharging channel
+            CHARGE_POWER_BUDGET_KEY: 0,         # W, 0 for no limit
+            DISCHARGE_POWER_BUDGET_KEY: 0,      # W, 0 for no limit
+            PHASE_STAGGER_KEY: 10,              # s between channels starting to charge (or discharge)
+
+            # One entry per battery channel: I2C bus, TCA9548 mux address (0x70-0x77)
+            # and output (0-7), and the relay and LED GPIO pins. Requires restart
+            CHANNELS_KEY: [
+                {'bus': 0, 'mux_address': 0x70, 'mux_channel': 0, 'charge_pin': 21, 'discharge_pin': 22, 'led_pin': 12},
+                {'bus': 0, 'mux_address': 0x70, 'mux_channel': 1, 'charge_pin': 23, 'discharge_pin': 26, 'led_pin': 13},
+                {'bus': 0, 'mux_address': 0x70, 'mux_channel': 2, 'charge_pin': 24, 'discharge_pin': 27, 'led_pin': 14},
+            ],
+            DASHBOARD_KEY: 'auto',              # 'panels', 'table', or 'auto' for a table on large stations. Requires restart
+            PRESENCE_SCAN_TIME_KEY: 1,          # s between sweeps for connected and removed batteries
+            CHANNEL_PROCESSES_KEY: False,       # Run each channel in its own supervised process, shown in the table dashboard. Requires restart
+            ASYNC_ENGINE_KEY: False,            # Update the channels from asyncio coroutines, shown in the table dashboard. Requires restart
+            CONTROL_SOCKET_KEY: '/tmp/battery_station.sock',    # Unix socket the headless station is controlled through
+            TELEMETRY_HOST_KEY: '127.0.0.1',    # Address the telemetry server listens on, '0.0.0.0' for other machines
+            TELEMETRY_PORT_KEY: 8080,           # Port of the telemetry server, 0 to disable. Requires restart
+            COLLECTOR_URL_KEY: '',              # Collector to send telemetry and results to, e.g. 'http://collector:8090', '' to disable. Requires restart
+            STATION_ID_KEY: '',                 # Name of the station at the collector, the hostname if ''
+            UPLINK_SPOOL_KEY: '~/Logs/uplink_spool.db',     # Records waiting to be sent to the collector
+            METRICS_PORT_KEY: 9108,             # Localhost port serving Prometheus metrics, 0 to disable. Requires restart
+            METRICS_LOG_INTERVAL_KEY: 3600,     # s between metrics summaries in the system log, 0 to disable. Requires restart
 
             LOGS_FOLDER_KEY: '~/Logs',
             REPORTS_FOLDER_KEY: '~/Reports',
+            INDEX_FILE_KEY: '~/Logs/fleet_index.db',
+            LOG_MAX_SIZE_KEY: 5000000,      # bytes, 0 to disable
+            LOG_MAX_AGE_KEY: 86400,         # 1 day, 0 to disable
+            LOG_COMPRESSION_KEY: 'gzip',    # None, 'gzip' or 'xz'
+            LOG_RETENTION_KEY: 0,           # days, 0 to keep forever
+            VOLTAGE_DEADBAND_KEY: 0.01,     # V, 0 to log every reading
+            CHARGE_DEADBAND_KEY: 1,         # mAh, 0 to log every reading
+            LOG_HEARTBEAT_KEY: 60,          # s
+            RESUME_MAX_AGE_KEY: 3600,       # 1hr, interrupted tests older than this start over
+            EXPORT_COMPRESSION_KEY: None,   # None, 'gzip' or 'xz'
         }
 
-    config = DEFAULT_CONFIG
+    config = dict(DEFAULT_CONFIG)   # Copied so changes never alter the defaults
 
+    # Keys missing from the file, e.g. ones added since it was saved, keep their defaults
     def load_config():
-        global config
         try:
             if os.path.exists(Config.CONFIG_FILE) and os.path.getsize(Config.CONFIG_FILE) > 0:
                 with open(Config.CONFIG_FILE, 'r') as f:
-                    config = json.load(f)
+                    Config.config = {**Config.DEFAULT_CONFIG, **json.load(f)}
             else:
-                config = Config.DEFAULT_CONFIG
+                Config.config = dict(Config.DEFAULT_CONFIG)
             Logger.get_sys_logger().log(Type.GENERAL, "Config Loaded")
         except:
-            config = Config.DEFAULT_CONFIG
+            Config.config = dict(Config.DEFAULT_CONFIG)
             Logger.get_sys_logger().log(Type.ERROR, f"ERROR LOADING CONFIG: {traceback.format_exc()}")
 
     def save_config():
         try:
             with open(Config.CONFIG_FILE, "w") as f:
-                json.dump(config, f)
+                json.dump(Config.config, f)
             Logger.get_sys_logger().log(Type.GENERAL, "Config Saved")
         except:
             Logger.get_sys_logger().log(Type.ERROR, f"ERROR SAVING CONFIG: {traceback.format_exc()}")
         
     def restore_config():
-        global config
         try:
             if os.path.exists(Config.CONFIG_FILE):
                 os.remove(Config.CONFIG_FILE)
-            config = Config.DEFAULT_CONFIG
+            Config.config = dict(Config.DEFAULT_CONFIG)
             Logger.get_sys_logger().log(Type.GENERAL, "Config Restored")
         except:
-            config = Config.DEFAULT_CONFIG
+            Config.config = dict(Config.DEFAULT_CONFIG)
             Logger.get_sys_logger().log(Type.ERROR, f"ERROR RESTORING CONFIG: {traceback.format_exc()}")
 
@@ -1,6 +1,9 @@
 #!/usr/bin/python3
 
 from tools.logger import Logger, Type
+from tools.telemetry_server import TelemetryServer
+from tools.uplink import StationUplink
+from tools.metrics import MetricsReporter
 from global_consts import Config
 from ui.main_window import MainWindow
 from PyQt5.QtWidgets import QApplication
@@ -8,17 +11,25 @@ import sys
 import traceback
 import atexit
 
+telemetry_server = None
+uplink = None
+metrics_reporter = None
+
 def main():
-        global window
+        global window, telemetry_server, uplink, metrics_reporter
         try:
                 atexit.register(cleanup)
                 Logger.get_sys_logger().log(Type.GENERAL, "START")
                 Config.load_config()
+                Logger.compact_logs()
 
                 app = QApplication(sys.argv)
                 window = MainWindow()
                 window.show()
                 window.start_threads()
+                telemetry_server = TelemetryServer.start_configured()
+                uplink = StationUplink.start_configured()
+                metrics_reporter = MetricsReporter.start_configured()
                 app.exec()
         except Exception:
                 handle_error(traceback.format_exc())
@@ -31,6 +42,12 @@ def handle_error(err):
 
 # Cleanup on program exit
 def cleanup():
+        if metrics_reporter is not None:
+                metrics_reporter.stop()
+        if uplink is not None:
+                uplink.stop()
+        if telemetry_server is not None:
+                telemetry_server.stop()
         window.cleanup()
         Logger.get_sys_logger().log(Type.GENERAL, "Objects Cleaned Up")
 
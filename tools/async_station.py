@@ -0,0 +1,157 @@
+from tools.station import Station
+from tools.channel import empty_snapshot
+from tools.logger import Logger, Type
+from tools.metrics import Metrics
+from global_consts import Config
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import queue
+import threading
+import time
+import traceback
+
+###########################################
+# AsyncStation Class
+# Responsible for:
+#   - Updating every channel from its own coroutine, on its own schedule
+#   - Running the blocking I2C and GPIO calls on a single executor thread,
+#     each bus guarded by an asyncio.Lock
+#   - Waiting out relay switches without holding up the other channels
+#   - Running standalone with run(), or in a background thread behind the
+#     same wait()/update() interface as Station for the GUI
+###########################################
+class AsyncStation(Station):
+    # on_snapshot: called with a channel's snapshot from the event loop after every update of it
+    def __init__(self, on_connect=None, on_disconnect=None, channels=None, on_snapshot=None):
+        super().__init__(on_connect, on_disconnect, channels)
+        self.on_snapshot = on_snapshot
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="I2C")
+        self.channel_commands = {i: queue.Queue() for i in self.controllers}
+        self.snapshots = {i: empty_snapshot(i) for i in self.controllers}
+        self.updated = threading.Event()        # Set when a channel published a new snapshot
+        self.loop = None
+        self.wakes = {}                         # channel -> asyncio.Event, set to update it before its next scheduled update
+        self.stopping = False
+        self.thread = None
+        for controller in self.controllers.values():
+            controller.defer_relay_switch = True
+
+    # Run every channel until stop() is called, cleanup() once it returns
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakes = {i: asyncio.Event() for i in self.controllers}
+        bus_locks = {}
+        for controller in self.controllers.values():
+            bus_locks.setdefault(controller.channel.bus, asyncio.Lock())
+        tasks = [self._run_channel(controller, bus_locks[controller.channel.bus])
+                 for controller in self.controllers.values()]
+        await asyncio.gather(*tasks)
+
+    # Run the event loop in a background thread, for callers without one
+    def start(self):
+        if self.thread is None and self.loop is None:
+            self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="Station", daemon=True)
+            self.thread.start()
+
+    # Thread safe, channels finish the update they are in first
+    def stop(self):
+        self.stopping = True
+        for index in self.controllers:
+            self._wake(index)
+
+    def post(self, index, fn, *args):
+        self.channel_commands[index].put((fn, args))
+        self._wake(index)
+
+    # Sleep until the timeout or a channel published a snapshot
+    # Returns True if woken early
+    def wait(self, timeout):
+        return self.updated.wait(timeout)
+
+    # The latest snapshot of every channel, the engine is started by the first call
+    def update(self):
+        self.start()
+        self.updated.clear()
+        return [self.snapshots[i] for i in self.controllers]
+
+    def cleanup(self):
+        self.stop()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown()
+        for index in self.controllers:
+            self._run_channel_commands(index)
+        super().cleanup()
+
+    async def _run_channel(self, controller, bus_lock):
+        wake = self.wakes[controller.index]
+        scheduled = None            # When this update was due, None if woken early
+        while not self.stopping:
+            wake.clear()
+            update_time = Config.config[Config.UPDATE_TIME_KEY]
+            if scheduled is not None:
+                Metrics.get_metrics().tick('async_channel', self.loop.time() - scheduled, update_time)
+            next_update = self.loop.time() + update_time
+            async with bus_lock:
+                await self._call(self._update_channel, controller)
+
+            battery = controller.battery
+            if battery is not None and battery.relay_switch is not None:
+                await asyncio.sleep(max(0, battery.relay_switch[0] - time.time()))
+                async with bus_lock:
+                    await self._call(battery.finish_relay_switch)
+            self._publish(await self._call(self._snapshot, controller))
+
+            try:
+                await asyncio.wait_for(wake.wait(), max(0, next_update - self.loop.time()))
+                scheduled = None
+            except asyncio.TimeoutError:
+                scheduled = next_update
+
+    # Run a blocking call on the executor thread
+    async def _call(self, fn, *args):
+        return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    def _update_channel(self, controller):
+        self._run_channel_commands(controller.index)
+        try:
+            self._update_connection(controller)
+            controller.update()
+        except Exception:
+            Logger.get_sys_logger().log(Type.ERROR, f"ERROR UPDATING CHANNEL {controller.index}: {traceback.format_exc()}")
+
+    def _run_channel_commands(self, index):
+        commands = self.channel_commands[index]
+        while True:
+            try:
+                fn, args = commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                fn(self.controllers[index], *args)
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR RUNNING CHANNEL {index} COMMAND: {traceback.format_exc()}")
+
+    def _publish(self, snapshot):
+        self.snapshots[snapshot.index] = snapshot
+        self.updated.set()
+        if self.on_snapshot is not None:
+            try:
+                self.on_snapshot(snapshot)
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR PUBLISHING CHANNEL {snapshot.index} SNAPSHOT: {traceback.format_exc()}")
+
+    # Wake a channel's coroutine from any thread
+    def _wake(self, index):
+        loop = self.loop
+        if loop is None or index not in self.wakes:
+            return
+        try:
+            loop.call_soon_threadsafe(self.wakes[index].set)
+        except RuntimeError:
+            # The loop already closed
+            pass
+
+    def _on_presence_change(self, index, present):
+        if index in self.controllers:
+            self._wake(index)
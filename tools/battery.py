@@ -1,14 +1,16 @@
 from tools.logger import Logger, Type, State, Action, Warning
 from tools.ltc2944 import LTC2944
-from ui.plot_window import PlotWindow
-from ui.report_pdf import PDF
+from tools.capacity_report import generate_capacity_test_report, generate_recondition_report, PREDICTED_CAPACITY_MSG_PREFIX
+from tools.fleet_index import FleetIndex
+from tools.checkpoint import save_checkpoint, load_checkpoint, delete_checkpoint
+from tools.discharge_predictor import DischargePredictor
+from tools.scheduler import PowerBudget, TestQueue
+from tools.eta import EtaEstimator
+from tools.metrics import Metrics
 from datetime import datetime, timedelta
 from global_consts import Config
 import Odroid.GPIO as GPIO
-import matplotlib.pyplot as plt
-import matplotlib.transforms as mt
 import time
-import os
 import traceback
 
 ########################################
@@ -16,8 +18,8 @@ import traceback
 ########################################
 
 VOLTAGE_QUEUE_SIZE = 15
-CAPACITY_REST_TIME = 120 # 2 mins
 REST_TIME_BETWEEN_CHARGE_SWITCH = 0.2
+CHECKPOINT_INTERVAL = 60 # 1 min
 
 # These need to be properly determined and set
 CHARGE_VOLTAGE_SLOPE_THRESHOLD = -1
@@ -41,7 +43,11 @@ class Battery:
         self.charge_pin = charge_pin
         self.discharge_pin = discharge_pin
         self.led_pin = led_pin
-        self.logger = Logger(self.serial_num)
+        self.channel = channel
+
+        # Continue the log of an interrupted action on this battery, if there is one
+        checkpoint = self._get_resumable_checkpoint()
+        self.logger = Logger(self.serial_num, file_name=checkpoint['log_file'] if checkpoint else None)
         try:
             self.ltc2944 = LTC2944(channel)
         except:
@@ -61,13 +67,26 @@ class Battery:
         self.last_action_time = 0       # Time battery last started resting, charging, or discharging
         self.run_capacity_test = False  # Flag to run capacity test
         self.cap_test_done = False      # Flag that sets to true when cap test is done
+        self.run_recondition = False    # Flag to run reconditioning cycles
+        self.recondition_done = False   # Flag that sets to true when reconditioning is done
         self.capacity = -1              # Battery capacity
         self.warning = Warning.NONE     # Flag used to signal warnings
         self.report_data = {}
         self.report_folder = ""
-        self.reset_coulomb_counter()
+        self.cleaned_up = False         # Cleanup runs on disconnect and again on deletion
+        self.last_checkpoint_time = 0   # Time the battery state was last checkpointed
+        self.discharge_predictor = None # Predicts the capacity during a capacity test discharge
+        self.queued = False             # Flag set while waiting in the capacity test queue
+        self.waiting_for_power = False  # Flag set while the power budget holds back a charge/discharge
+        self.eta = EtaEstimator(self.serial_num)    # Predicts when the phase and capacity test end
+        self.relay_switch = None        # (time, charge, discharge) of a relay switch waiting for the relays to open
+        self.defer_relay_switch = False # Leave relay switches to finish_relay_switch() instead of sleeping
 
         self.logger.log(Type.GENERAL, "Connected")
+        if checkpoint:
+            self._resume(checkpoint)
+        else:
+            self.reset_coulomb_counter()
 
     def __del__(self):
         self.cleanup()
@@ -85,7 +104,7 @@ class Battery:
                 first_key = next(iter(self.voltage_readings))
                 self.voltage_readings.pop(first_key)
 
-            self.logger.log(Type.VOLTAGE, self.voltage)
+            self.logger.log_telemetry(Type.VOLTAGE, self.voltage)
         except:
             self.voltage = -1
             self.logger.log(Type.ERROR, "Could not read Voltage")
@@ -94,18 +113,85 @@ class Battery:
     def get_mAh_charge(self):
         try:
             self.accum_charge = self.ltc2944.get_mAh_charge()
-            self.logger.log(Type.CHARGE, self.accum_charge)
+            self.logger.log_telemetry(Type.CHARGE, self.accum_charge)
         except:
             self.accum_charge = -1
             self.logger.log(Type.ERROR, "Could not read accumulated charge")
         return self.accum_charge
 
     def cleanup(self):
+        if self.cleaned_up:
+            return
+        self.cleaned_up = True
+        # Checkpoint before leaving the queue, so the place is taken again on resume
         self._set_state(State.RESTING)
+        self._leave_test_queue()
         GPIO.output(self.led_pin, 0)
         self.logger.log(Type.GENERAL, "Disconnected")
+        self.logger.close()
         return
 
+    # Save the state needed to continue the current action after a crash or restart
+    # Nothing needs saving once the battery is idle and not waiting for a capacity test
+    def save_state(self):
+        self.last_checkpoint_time = time.time()
+        if self.action == Action.REST and not self.run_capacity_test and not self.run_recondition and not self.queued:
+            delete_checkpoint(self.serial_num)
+            return
+        save_checkpoint(self.serial_num, {
+            'channel': self.channel,
+            'log_file': self.logger.file_name,
+            'saved_at': datetime.now(),
+            'action': self.action.name,
+            'action_elapsed': time.time() - self.last_action_time,
+            'run_capacity_test': self.run_capacity_test,
+            'run_recondition': self.run_recondition,
+            'queued': self.queued,
+            'capacity': self.capacity,
+            'report_data': self.report_data,
+        })
+
+    # A checkpoint can only be resumed on the same channel, since the
+    # accumulated charge lives in that channel's coulomb counter
+    def _get_resumable_checkpoint(self):
+        checkpoint = load_checkpoint(self.serial_num)
+        if checkpoint is None:
+            return None
+        age = (datetime.now() - checkpoint['saved_at']).total_seconds()
+        if checkpoint['channel'] != self.channel or age > Config.config[Config.RESUME_MAX_AGE_KEY]:
+            delete_checkpoint(self.serial_num)
+            return None
+        return checkpoint
+
+    # Restore a checkpointed action without resetting the coulomb counter
+    # Time spent while the program was down is not counted towards the action
+    def _resume(self, checkpoint):
+        self.action = Action[checkpoint['action']]
+        self.last_action_time = time.time() - checkpoint['action_elapsed']
+        self.run_capacity_test = checkpoint['run_capacity_test']
+        self.run_recondition = checkpoint.get('run_recondition', False)
+        self.capacity = checkpoint['capacity']
+        self.report_data = checkpoint['report_data']
+        self.logger.log(Type.GENERAL, f"Resumed {self.action} after {round(checkpoint['action_elapsed'])}s")
+        # The queue lives in memory, so take our place in it again
+        if checkpoint.get('queued', False):
+            self.queue_capacity_test()
+
+        # Switch the relays straight back, _set_state would reset the coulomb counter
+        # The power is already being drawn, so it is taken regardless of the budget
+        if self.action in (Action.CHARGE_FULL, Action.CHARGE_PARTIAL):
+            self.state = State.CHARGING
+            PowerBudget.get_budget().acquire(self.channel, self.state, force=True)
+            GPIO.output(self.discharge_pin, 0)
+            GPIO.output(self.charge_pin, 1)
+        elif self.action in (Action.DISCHARGE_FULL, Action.DISCHARGE_PARTIAL):
+            self.state = State.DISCHARGING
+            PowerBudget.get_budget().acquire(self.channel, self.state, force=True)
+            GPIO.output(self.charge_pin, 0)
+            GPIO.output(self.discharge_pin, 1)
+        self.logger.log(Type.STATUS, self.state)
+        self.save_state()
+
     def reset_coulomb_counter(self):
         try:
             self.ltc2944.reset_coulomb_counter()
@@ -116,25 +202,13 @@ class Battery:
     # Turn on charger relay, turn off load relay
     # Reset time and voltage variables
     def _start_charging(self):
-        self._start_charge_rest()
-        time.sleep(REST_TIME_BETWEEN_CHARGE_SWITCH)
-
-        GPIO.output(self.discharge_pin, 0)
-        GPIO.output(self.charge_pin, 1)
-
-        self.voltage_readings.clear()
-        self.reset_coulomb_counter()
+        self._switch_relays(1, 0)
         return
 
     # Turn on load relay, turn off charger relay
     # Reset time and voltage variables
     def _start_discharging(self):
-        self._start_charge_rest()
-        time.sleep(REST_TIME_BETWEEN_CHARGE_SWITCH)
-
-        GPIO.output(self.charge_pin, 0)
-        GPIO.output(self.discharge_pin, 1)
-        self.reset_coulomb_counter()
+        self._switch_relays(0, 1)
         return
     
     # Turn off load and charger relays
@@ -142,8 +216,31 @@ class Battery:
     def _start_charge_rest(self):
         GPIO.output(self.charge_pin, 0)
         GPIO.output(self.discharge_pin, 0)
+        self.voltage_readings.clear()
+        self.relay_switch = None
         return
 
+    # Open both relays, then close the requested one once they had time to open
+    # With defer_relay_switch set, the caller waits and calls finish_relay_switch()
+    def _switch_relays(self, charge, discharge):
+        self._start_charge_rest()
+        self.relay_switch = (time.time() + REST_TIME_BETWEEN_CHARGE_SWITCH, charge, discharge)
+        if not self.defer_relay_switch:
+            time.sleep(REST_TIME_BETWEEN_CHARGE_SWITCH)
+            self.finish_relay_switch()
+
+    # Close the relay of a pending switch and reset the coulomb counter
+    def finish_relay_switch(self):
+        if self.relay_switch is None:
+            return
+        _, charge, discharge = self.relay_switch
+        self.relay_switch = None
+        GPIO.output(self.charge_pin, charge)
+        GPIO.output(self.discharge_pin, discharge)
+
+        self.voltage_readings.clear()
+        self.reset_coulomb_counter()
+
     def _calculate_voltage_slope(self):
         if len(self.voltage_readings) < VOLTAGE_QUEUE_SIZE:
             return None
@@ -154,10 +251,10 @@ class Battery:
         denominator = 0
         first_time = next(iter(self.voltage_readings))
 
-        for time, volt in self.voltage_readings.items():
+        for i, (time, volt) in enumerate(self.voltage_readings.items()):
             time = time - first_time   # Normalize time so we don't get huge numbers
-            yavg += (volt - yavg) / (time + 1)
-            xavg += (time - xavg) / (time + 1)
+            yavg += (volt - yavg) / (i + 1)
+            xavg += (time - xavg) / (i + 1)
 
         for time, volt in self.voltage_readings.items():
             time = time - first_time   # Normalize time so we don't get huge numbers
@@ -185,11 +282,27 @@ class Battery:
     # Stop discharging battery if
     #   Max discharge time is reached (timeout) or
     #   Voltage reaches minimum discharge voltage
+    #   (the lower deep discharge voltage while reconditioning)
     def check_full_discharge_complete(self, voltage):
+        min_voltage = Config.config[Config.RECONDITION_MIN_VOLTAGE_KEY if self.run_recondition else Config.MIN_VOLTAGE_KEY]
         end = self.time_since_last_action() >= Config.config[Config.MAX_DISCHARGE_TIME_KEY]
-        end = end or voltage <= Config.config[Config.MIN_VOLTAGE_KEY]
+        end = end or voltage <= min_voltage
         return end
 
+    # End the capacity test rest once the voltage has relaxed:
+    #   Min rest time is reached and the voltage slope stays within the bound
+    #   over the whole voltage window, or
+    #   Max rest time is reached (timeout)
+    def check_rest_complete(self):
+        rest_time = self.time_since_last_action()
+        if rest_time < Config.config[Config.MIN_REST_TIME_KEY]:
+            return False
+        if rest_time >= Config.config[Config.MAX_REST_TIME_KEY]:
+            return True
+
+        voltage_slope = self._calculate_voltage_slope()
+        return voltage_slope is not None and abs(voltage_slope) <= Config.config[Config.REST_VOLTAGE_SLOPE_KEY]
+
     def _on_capacity_test_complete(self):
         self.logger.log(Type.GENERAL, "Capacity Test Done!")
         self.logger.log(Type.GENERAL, f"Capacity = {self.capacity}mAh")
@@ -197,50 +310,81 @@ class Battery:
         self.cap_test_done = True
         GPIO.output(self.led_pin, 1)
 
+        FleetIndex.get_index().record_capacity(self.serial_num, self.logger.file_name, self.capacity, self.report_data['cp_et'])
+        EtaEstimator.forget_history(self.serial_num)
         self._generate_capacity_test_report()
         return
     
-    def _generate_capacity_test_report(self):
+    # Stop reconditioning once a cycle gains less capacity than the threshold
+    # over the cycle before it, or the max number of cycles has run
+    def check_recondition_converged(self):
+        cycles = self.report_data['cycles']
+        if len(cycles) >= Config.config[Config.RECONDITION_MAX_CYCLES_KEY]:
+            return True
+        if len(cycles) < 2:
+            return False
+        return cycles[-1]['cap'] - cycles[-2]['cap'] < Config.config[Config.RECONDITION_MIN_GAIN_KEY]
+
+    def _on_recondition_cycle_complete(self):
+        cycles = self.report_data['cycles']
+        cycle = cycles[-1]
+        cycle['d_et'] = datetime.now()
+        cycle['d_c'] = round(self.accum_charge)
+        cycle['cap'] = abs(round(self.accum_charge))
+        self.capacity = cycle['cap']
+
+        msg = f"Recondition cycle {len(cycles)}: {cycle['cap']}mAh"
+        if len(cycles) > 1:
+            msg += f" ({cycle['cap'] - cycles[-2]['cap']:+d}mAh)"
+        self.logger.log(Type.GENERAL, msg)
+
+        # Leave the battery partially charged once done, like after a capacity test
+        if self.check_recondition_converged():
+            # The last allowed cycle may have converged too
+            self.report_data['converged'] = (len(cycles) > 1 and
+                                             cycles[-1]['cap'] - cycles[-2]['cap'] < Config.config[Config.RECONDITION_MIN_GAIN_KEY])
+            return Action.CHARGE_PARTIAL
+        cycles.append({'c_st': datetime.now()})
+        return Action.CHARGE_FULL
+
+    def _on_recondition_complete(self):
+        self.logger.log(Type.GENERAL, f"Reconditioning Done! {len(self.report_data['cycles'])} cycles")
+        self.run_recondition = False
+        self.recondition_done = True
+        GPIO.output(self.led_pin, 1)
         try:
-            # Create Reports folder
-            parent_directory = os.path.expanduser(Config.config[Config.REPORTS_FOLDER_KEY])
-            file_name = os.path.splitext(self.logger.file_name)[0]
-            report_folder = os.path.join(parent_directory, file_name)
-            self.report_folder = report_folder
-            os.makedirs(report_folder, exist_ok=True)
-
-            # Save Battery logs
-            self.logger.save_copy(report_folder)
-
-            # Save Voltage Data
-            plot_window = PlotWindow()
-            x, y, charge_times, discharge_times, rest_times = self.logger.get_data(Type.VOLTAGE)
-            plot_window.set_battery_data(x, y, charge_times, discharge_times, rest_times, Type.VOLTAGE, self.serial_num)
-            v_plot_path = plot_window.save_plot(report_folder)
-            plot_window.save_csv(report_folder)
-
-            # Save Charge Data
-            x, y, charge_times, discharge_times, rest_times = self.logger.get_data(Type.CHARGE)
-            plot_window.set_battery_data(x, y, charge_times, discharge_times, rest_times, Type.CHARGE, self.serial_num)
-            c_plot_path = plot_window.save_plot(report_folder)
-            plot_window.save_csv(report_folder)
-
-            # Save Test Summary PDF
-            pdf_path = os.path.join(report_folder, "Capacity_Test_Report.pdf")
-            self.report_data['sn'] = self.serial_num
-            self.report_data['cap'] = self.capacity
-
-            pdf = PDF(data=self.report_data)
-            pdf.add_summary_table()
-            pdf.add_plots([v_plot_path, c_plot_path])
-            pdf.output(pdf_path, 'F')
+            with Metrics.get_metrics().phase('recondition_report'):
+                self.report_folder = generate_recondition_report(self.logger, self.serial_num, self.report_data)
+            self.logger.log(Type.GENERAL, "Report generated!")
+        except:
+            self.logger.log(Type.ERROR, f"Unable to generate recondition report: {traceback.format_exc()}")
 
+    def _generate_capacity_test_report(self):
+        try:
+            with Metrics.get_metrics().phase('capacity_report'):
+                self.report_folder = generate_capacity_test_report(self.logger, self.serial_num, self.capacity, self.report_data)
             self.logger.log(Type.GENERAL, "Report generated!")
         except:
             self.logger.log(Type.ERROR, f"Unable to generate capacity test report: {traceback.format_exc()}")
 
     # Set the battery's state (internal function)
+    # Charging and discharging wait, with the relays off, until the station
+    # power budget allows them. Returns True if the state was set
     def _set_state(self, state):
+        if not PowerBudget.get_budget().acquire(self.channel, state):
+            if self.state != State.RESTING:
+                self._set_state(State.RESTING)
+            if not self.waiting_for_power:
+                self.waiting_for_power = True
+                self.logger.log(Type.GENERAL, f"Waiting for power budget to start {state}")
+            return False
+
+        # Time spent waiting doesn't count towards the action
+        if self.waiting_for_power and state != State.RESTING:
+            self.logger.log(Type.GENERAL, f"Power budget available after {self.time_since_last_action()}s")
+            self.last_action_time = time.time()
+        self.waiting_for_power = False
+
         if state == State.RESTING:
             self._start_charge_rest()
         elif state == State.CHARGING:
@@ -250,23 +394,54 @@ class Battery:
 
         self.state = state
         self.logger.log(Type.STATUS, state)
-        return
+        self.save_state()
+        return True
 
     # Set an action for the battery to perform
     def set_action(self, action, internal=False):
         self.action = action
         self.last_action_time = time.time()
+        self.discharge_predictor = None
+        self.waiting_for_power = False
         self.logger.log(Type.ACTION, action)
 
-        # Reset cap_test flag if a new action is set by the user and not by us
+        # Any action chosen by the user replaces a queued capacity test
+        if not internal:
+            self._leave_test_queue()
+
+        # Reset cap_test and recondition flags if a new action is set by the user and not by us
         if not internal and action is not Action.CAPACITY_TEST:
             self.run_capacity_test = False
+        if not internal and action is not Action.RECONDITION:
+            self.run_recondition = False
+        self.save_state()
+
+    # Wait in the station queue for a capacity test
+    # The current action keeps running until the test starts
+    def queue_capacity_test(self):
+        test_queue = TestQueue.get_queue()
+        test_queue.add(self.channel)
+        self.queued = True
+        self.logger.log(Type.GENERAL, f"Capacity test queued, position {test_queue.position(self.channel)}")
+        self.save_state()
+
+    def queue_position(self):
+        return TestQueue.get_queue().position(self.channel)
+
+    def _leave_test_queue(self):
+        if self.queued:
+            TestQueue.get_queue().remove(self.channel)
+            self.queued = False
 
     def set_serial_num(self, sn):
         self.logger.log(Type.GENERAL, f"New SN: {sn}")
+        delete_checkpoint(self.serial_num)
         self.serial_num = sn
+        self.eta = EtaEstimator(self.serial_num)
+        self.logger.close()
         self.logger.set_id(self.serial_num)
         self.logger.log(Type.GENERAL, f"New SN: {sn}")
+        self.save_state()
 
     def toggle_do_logs(self):
         # Ensure the log toggle always gets logged
@@ -285,7 +460,10 @@ class Battery:
         self.get_mAh_charge()
         if self.voltage < 0:
             self.set_action(Action.REST, True)
-    
+        elif self.queued and TestQueue.get_queue().try_start(self.channel):
+            self.queued = False
+            self.set_action(Action.CAPACITY_TEST)
+
         if self.action == Action.REST:
             self._rest_action_update()
         elif self.action == Action.CHARGE_FULL:
@@ -298,8 +476,15 @@ class Battery:
             self._discharge_partial_action_update()
         elif self.action == Action.CAPACITY_TEST:
             self._capacity_test_action_update()
+        elif self.action == Action.RECONDITION:
+            self._recondition_action_update()
 
         self.update_warning_flag()
+        self.eta.update(self)
+
+        # Keep the checkpointed action time close to the real one
+        if time.time() - self.last_checkpoint_time >= CHECKPOINT_INTERVAL:
+            self.save_state()
         return
 
     def update_warning_flag(self):
@@ -307,7 +492,9 @@ class Battery:
         time = self.time_since_last_action()
 
         # Warn if the battery is supposed to be charging or discharging but the accumulated charge is not increasing
-        if (self.action == Action.CHARGE_FULL or self.action == Action.CHARGE_PARTIAL) and self.accum_charge == 0 and time > WARNING_WAIT_TIME:
+        if self.waiting_for_power:
+            self.warning = Warning.WAITING_FOR_POWER
+        elif (self.action == Action.CHARGE_FULL or self.action == Action.CHARGE_PARTIAL) and self.accum_charge == 0 and time > WARNING_WAIT_TIME:
             self.warning = Warning.CHECK_CHARGER
         elif (self.action == Action.DISCHARGE_FULL or self.action == Action.DISCHARGE_PARTIAL) and self.accum_charge == 0 and time > WARNING_WAIT_TIME:
             self.warning = Warning.CHECK_LOAD
@@ -323,9 +510,21 @@ class Battery:
         GPIO.output(self.led_pin, 0)
         self.set_action(Action.CHARGE_FULL, True)
 
+    # Repeat full charge, rest and deep discharge cycles until the
+    # capacity stops improving, see check_recondition_converged
+    def _recondition_action_update(self):
+        self.capacity = -1
+        self.run_capacity_test = False
+        self.run_recondition = True
+        self.recondition_done = False
+        self.report_data = {'cycles': [{'c_st': datetime.now()}],
+                            'min_voltage': Config.config[Config.RECONDITION_MIN_VOLTAGE_KEY]}
+        GPIO.output(self.led_pin, 0)
+        self.set_action(Action.CHARGE_FULL, True)
+
     def _discharge_partial_action_update(self):
-        if self.state != State.DISCHARGING:
-            self._set_state(State.DISCHARGING)
+        if self.state != State.DISCHARGING and not self._set_state(State.DISCHARGING):
+            return
         if self.voltage <= Config.config[Config.PARTIAL_VOLTAGE_KEY]:
             self.logger.log(Type.GENERAL, f"Partially Discharged in {self.time_since_last_action()}s, {round(self.accum_charge)}mAh")
                 
@@ -333,48 +532,83 @@ class Battery:
             self.set_action(next_action, True)
 
     def _discharge_full_action_update(self):
-        if self.state != State.DISCHARGING:
-            self._set_state(State.DISCHARGING)
+        if self.state != State.DISCHARGING and not self._set_state(State.DISCHARGING):
+            return
         if self.check_full_discharge_complete(self.voltage):
             self.logger.log(Type.GENERAL, f"Fully Discharged in {self.time_since_last_action()}s, {round(self.accum_charge)}mAh")
 
             if self.run_capacity_test:
                 self.capacity = abs(self.accum_charge)
-                next_action = Action.CHARGE_PARTIAL
-                self.report_data['df-cp_t'] = datetime.now()
-                self.report_data['df_c'] = round(self.accum_charge)
-            else:
-                next_action = Action.REST
-            self.set_action(next_action, True)
+            self._end_full_discharge()
+        elif self.run_capacity_test and self.check_capacity_predicted():
+            predictor = self.discharge_predictor
+            self.capacity = round(predictor.estimate)
+            self.report_data['cap_predicted'] = True
+            self.report_data['cap_ci'] = [round(predictor.ci[0]), round(predictor.ci[1])]
+            self.logger.log(Type.GENERAL, f"{PREDICTED_CAPACITY_MSG_PREFIX}{self.capacity}mAh ({self.report_data['cap_ci'][0]}-{self.report_data['cap_ci'][1]}mAh)")
+            self._end_full_discharge()
+
+    # In predictive mode, feed the discharge curve to the predictor and
+    # stop once the predicted capacity's confidence interval is tight enough
+    def check_capacity_predicted(self):
+        if not Config.config[Config.PREDICTIVE_DISCHARGE_KEY] or self.voltage < 0 or self.accum_charge == -1:
+            return False
+        if self.discharge_predictor is None:
+            self.discharge_predictor = DischargePredictor(Config.config[Config.MIN_VOLTAGE_KEY])
+        self.discharge_predictor.add_sample(self.accum_charge, self.voltage)
+        return self.discharge_predictor.is_confident(Config.config[Config.PREDICTION_TOLERANCE_KEY])
+
+    def _end_full_discharge(self):
+        if self.run_capacity_test:
+            next_action = Action.CHARGE_PARTIAL
+            self.report_data['df-cp_t'] = datetime.now()
+            self.report_data['df_c'] = round(self.accum_charge)
+        elif self.run_recondition:
+            next_action = self._on_recondition_cycle_complete()
+        else:
+            next_action = Action.REST
+        self.set_action(next_action, True)
 
     def _charge_partial_action_update(self):
-        if self.state != State.CHARGING:
-            self._set_state(State.CHARGING)
+        if self.state != State.CHARGING and not self._set_state(State.CHARGING):
+            return
         if self.voltage >= Config.config[Config.PARTIAL_VOLTAGE_KEY]:
             self.logger.log(Type.GENERAL, f"Partially Charged in {self.time_since_last_action()}s, {round(self.accum_charge)}mAh")
             if self.run_capacity_test:
                 self.report_data['cp_et'] = datetime.now()
                 self.report_data['cp_c'] = round(self.accum_charge)
                 self._on_capacity_test_complete()
+            elif self.run_recondition:
+                self.report_data['cp_et'] = datetime.now()
+                self.report_data['cp_c'] = round(self.accum_charge)
+                self._on_recondition_complete()
 
             next_action = Action.REST
             self.set_action(next_action, True)
 
     def _charge_full_action_update(self):
-        if self.state != State.CHARGING:
-            self._set_state(State.CHARGING)
+        if self.state != State.CHARGING and not self._set_state(State.CHARGING):
+            return
         if self.check_full_charge_complete(self.voltage):
             self.logger.log(Type.GENERAL, f"Fully Charged in {self.time_since_last_action()}s, {round(self.accum_charge)}mAh")
 
-            self.report_data['cf_et'] = datetime.now()
-            self.report_data['cf_c'] = round(self.accum_charge)
+            if self.run_recondition:
+                self.report_data['cycles'][-1]['c_et'] = datetime.now()
+                self.report_data['cycles'][-1]['c_c'] = round(self.accum_charge)
+            else:
+                self.report_data['cf_et'] = datetime.now()
+                self.report_data['cf_c'] = round(self.accum_charge)
             next_action = Action.REST
             self.set_action(next_action, True)
 
     def _rest_action_update(self):
         if self.state != State.RESTING:
             self._set_state(State.RESTING)
-        if self.run_capacity_test and self.time_since_last_action() >= CAPACITY_REST_TIME:
-            self.report_data['df_st'] = datetime.now()
+        if (self.run_capacity_test or self.run_recondition) and self.check_rest_complete():
+            self.logger.log(Type.GENERAL, f"Rested in {self.time_since_last_action()}s")
+            if self.run_recondition:
+                self.report_data['cycles'][-1]['d_st'] = datetime.now()
+            else:
+                self.report_data['df_st'] = datetime.now()
             next_action = Action.DISCHARGE_FULL
             self.set_action(next_action, True)
\ No newline at end of file
@@ -0,0 +1,173 @@
+from tools.logger import Type, Action
+from tools.fleet_stats import compute_fleet_stats
+from tools.exporter import export_session
+from ui.plot_renderer import PlotRenderer, FleetPlotRenderer, ReconditionPlotRenderer
+from ui.report_pdf import PDF
+from ui.fleet_report_pdf import FleetPDF
+from ui.recondition_report_pdf import ReconditionPDF
+from global_consts import Config
+from datetime import datetime
+import os
+
+########################################
+# Constants
+########################################
+REPORT_FILE_NAME = "Capacity_Test_Report.pdf"
+FLEET_REPORT_FILE_NAME = "Fleet_Summary_Report.pdf"
+RECONDITION_REPORT_FILE_NAME = "Recondition_Report.pdf"
+CAPACITY_MSG_PREFIX = "Capacity = "
+PREDICTED_CAPACITY_MSG_PREFIX = "Predicted Capacity = "
+
+# Actions a capacity test moves through after it is started, with the
+# report_data keys set when each action begins: (action, time key, charge key)
+# The charge key stores the accumulated charge of the phase that just ended
+CAPACITY_TEST_SEQUENCE = [
+    (Action.CHARGE_FULL, 'cf_st', None),
+    (Action.REST, 'cf_et', 'cf_c'),
+    (Action.DISCHARGE_FULL, 'df_st', None),
+    (Action.CHARGE_PARTIAL, 'df-cp_t', 'df_c'),
+    (Action.REST, 'cp_et', 'cp_c'),
+]
+
+# Create the report folder for a battery log and fill it with
+# the log copy, plots, full resolution data CSV and the capacity test summary PDF
+# Returns the report folder path, raises on failure
+def generate_capacity_test_report(logger, serial_num, capacity, report_data, reports_folder=None):
+    report_folder, plots = _save_battery_report_data(logger, serial_num, reports_folder)
+
+    # Save Test Summary PDF
+    pdf_path = os.path.join(report_folder, REPORT_FILE_NAME)
+    report_data['sn'] = serial_num
+    report_data['cap'] = capacity
+
+    pdf = PDF(data=report_data)
+    pdf.add_summary_table()
+    pdf.add_plots(plots)
+    pdf.output(pdf_path, 'F')
+    return report_folder
+
+# Same as the capacity test report, with a multi-page PDF of the
+# capacity of every reconditioning cycle instead of the test summary
+# Returns the report folder path, raises on failure
+def generate_recondition_report(logger, serial_num, report_data, reports_folder=None):
+    report_folder, plots = _save_battery_report_data(logger, serial_num, reports_folder)
+    cycle_plot = ReconditionPlotRenderer(report_data['cycles']).save_capacity_plot(report_folder)
+
+    report_data['sn'] = serial_num
+    pdf = ReconditionPDF(data=report_data)
+    pdf.add_summary_table()
+    pdf.add_cycle_table()
+    pdf.add_plots(plots)
+    if cycle_plot is not None:
+        pdf.add_cycle_plot(cycle_plot)
+    pdf.output(os.path.join(report_folder, RECONDITION_REPORT_FILE_NAME), 'F')
+    return report_folder
+
+# Create the report folder for a battery log and save the log copy,
+# voltage and charge plots and full resolution data CSV in it
+# Returns the report folder path and the plot paths
+def _save_battery_report_data(logger, serial_num, reports_folder=None):
+    # Create Reports folder
+    if reports_folder is None:
+        reports_folder = Config.config[Config.REPORTS_FOLDER_KEY]
+    parent_directory = os.path.expanduser(reports_folder)
+    file_name = os.path.splitext(logger.file_name)[0]
+    report_folder = os.path.join(parent_directory, file_name)
+    os.makedirs(report_folder, exist_ok=True)
+
+    # Save Battery logs
+    logger.save_copy(report_folder)
+
+    # Save Voltage Data
+    renderer = PlotRenderer()
+    x, y, charge_times, discharge_times, rest_times = logger.get_data(Type.VOLTAGE)
+    renderer.set_battery_data(x, y, charge_times, discharge_times, rest_times, Type.VOLTAGE, serial_num)
+    v_plot_path = renderer.save_plot(report_folder)
+
+    # Save Charge Data
+    x, y, charge_times, discharge_times, rest_times = logger.get_data(Type.CHARGE)
+    renderer.set_battery_data(x, y, charge_times, discharge_times, rest_times, Type.CHARGE, serial_num)
+    c_plot_path = renderer.save_plot(report_folder)
+
+    # Save full resolution data of all series
+    export_session(logger, report_folder, Config.config[Config.EXPORT_COMPRESSION_KEY])
+    return report_folder, [v_plot_path, c_plot_path]
+
+# Create a fleet summary report from the capacity results in the fleet index
+# for a date range and/or a list of serial numbers
+# Returns the report folder path, or None if no tests matched
+def generate_fleet_report(index, threshold, start=None, end=None, serial_nums=None, reports_folder=None):
+    if serial_nums:
+        # A SN given twice must not count its battery twice
+        tests = [t for sn in dict.fromkeys(serial_nums) for t in index.find_tests(sn, start, end)]
+    else:
+        tests = index.find_tests(None, start, end)
+
+    stats = compute_fleet_stats(tests, threshold)
+    if stats is None:
+        return None
+
+    if reports_folder is None:
+        reports_folder = Config.config[Config.REPORTS_FOLDER_KEY]
+    folder_name = f"Fleet_{datetime.now().replace(microsecond=0).isoformat()}"
+    report_folder = os.path.join(os.path.expanduser(reports_folder), folder_name)
+    os.makedirs(report_folder, exist_ok=True)
+
+    renderer = FleetPlotRenderer(stats)
+    plots = [renderer.save_distribution_plot(report_folder),
+             renderer.save_throughput_plot(report_folder),
+             renderer.save_trend_plot(report_folder)]
+
+    pdf = FleetPDF(stats=stats)
+    pdf.add_summary_table()
+    pdf.add_plots([p for p in plots if p is not None])
+    pdf.add_battery_table()
+    pdf.output(os.path.join(report_folder, FLEET_REPORT_FILE_NAME), 'F')
+    return report_folder
+
+# Rebuild the report_data timeline of every completed capacity test
+# in a battery log from its ACTION, CHARGE and GENERAL records
+# Predicted capacities keep their confidence interval
+# Returns a list of (capacity, report_data), oldest first
+def reconstruct_capacity_tests(logger):
+    tests = []
+    report_data = None
+    step = 0
+    last_charge = 0
+    capacity = None
+
+    for t, id, type, msg in logger.read_records():
+        if type == Type.CHARGE:
+            last_charge = float(msg)
+        elif type == Type.GENERAL and msg.startswith(CAPACITY_MSG_PREFIX):
+            capacity = float(msg[len(CAPACITY_MSG_PREFIX):].rstrip('mAh'))
+        elif type == Type.GENERAL and msg.startswith(PREDICTED_CAPACITY_MSG_PREFIX) and report_data is not None:
+            # e.g. "Predicted Capacity = 2100mAh (2060-2140mAh)"
+            ci = msg[msg.index('(') + 1:msg.index(')')].rstrip('mAh').split('-')
+            report_data['cap_predicted'] = True
+            report_data['cap_ci'] = [float(ci[0]), float(ci[1])]
+        elif type == Type.ACTION:
+            action = Action[msg]
+            if action == Action.CAPACITY_TEST:
+                report_data = {}
+                step = 0
+                capacity = None
+                continue
+            if report_data is None:
+                continue
+
+            # Any action outside the expected sequence means the test was aborted
+            expected_action, time_key, charge_key = CAPACITY_TEST_SEQUENCE[step]
+            if action != expected_action:
+                report_data = None
+                continue
+
+            report_data[time_key] = t
+            if charge_key is not None:
+                report_data[charge_key] = round(last_charge)
+            step += 1
+
+            if step == len(CAPACITY_TEST_SEQUENCE):
+                tests.append((capacity if capacity is not None else abs(report_data['df_c']), report_data))
+                report_data = None
+    return tests
@@ -0,0 +1,137 @@
+from tools.battery import Battery
+from tools.logger import Logger, Type
+from tools.telemetry_ring import TelemetryRing
+from tools.metrics import Metrics
+from tools.topology import get_channel
+from tools.presence import PresenceScanner
+from collections import namedtuple
+from datetime import datetime
+from enum import Enum
+import string
+import time
+
+########################################
+# Constants
+########################################
+SAFE_FILE_CHARS = set(string.ascii_letters + string.digits + '~-_.')
+
+# Display values of a channel at one update, connected is False when no battery is set up
+# and awaiting_sn is True while a detected battery waits for its SN
+ChannelSnapshot = namedtuple('ChannelSnapshot', [
+    'index', 'connected', 'serial_num', 'state', 'action', 'voltage', 'charge', 'capacity',
+    'elapsed', 'phase_eta', 'test_eta', 'warning', 'queue_position',
+    'run_capacity_test', 'run_recondition', 'done', 'report_folder', 'log_file', 'do_logs', 'awaiting_sn',
+], defaults=(None, False, False))
+
+###########################################
+# ChannelController Class
+# Responsible for:
+#   - Tracking whether a battery is on one channel of the station
+#   - Creating and cleaning up the channel's Battery
+#   - Reporting the channel's state without any UI
+#   - Writing the channel's telemetry to its shared memory ring
+###########################################
+class ChannelController:
+    # create_ring: create the channel's telemetry ring, instead of opening the one
+    # created by a supervising process
+    def __init__(self, index, create_ring=True):
+        self.index = index
+        self.channel = get_channel(index)
+        self.scanner = PresenceScanner.get_scanner()
+        self.battery = None
+        self.ring = TelemetryRing(index, create=create_ring)
+        self.owns_ring = create_ring
+        self.defer_relay_switch = False     # Set on new batteries, see Battery.finish_relay_switch()
+
+    @property
+    def connected(self):
+        return self.battery is not None
+
+    # Whether the presence scanner last found the channel's LTC2944 on the I2C bus
+    def is_present(self):
+        return self.scanner.is_present(self.index)
+
+    def connect(self, serial_num):
+        self.battery = Battery(serial_num,
+                               self.channel.charge_pin,
+                               self.channel.discharge_pin,
+                               self.channel.led_pin,
+                               self.index)
+        self.battery.defer_relay_switch = self.defer_relay_switch
+        Logger.get_sys_logger().log(Type.GENERAL, f"Battery object created with SN={serial_num}")
+        try:
+            session_start = Logger.parse_file_name(self.battery.logger.file_name)[1].timestamp()
+        except ValueError:
+            session_start = time.time()
+        self.ring.start_session(session_start)
+
+    def disconnect(self):
+        Logger.get_sys_logger().log(Type.GENERAL, f"Battery disconnected at channel {self.index}")
+        battery = self.battery
+        self.battery = None
+        battery.cleanup()
+
+    def update(self):
+        if self.battery is not None:
+            with Metrics.get_metrics().phase('battery_update'):
+                self.battery.update()
+            self.ring.append(self.battery.voltage, self.battery.accum_charge, self.battery.state)
+
+    def cleanup(self):
+        if self.battery is not None:
+            self.battery.cleanup()
+        self.ring.close()
+        if self.owns_ring:
+            self.ring.unlink()
+
+    def snapshot(self):
+        battery = self.battery
+        if battery is None:
+            return empty_snapshot(self.index)
+        return ChannelSnapshot(
+            index=self.index,
+            connected=True,
+            serial_num=battery.serial_num,
+            state=battery.state,
+            action=battery.action,
+            voltage=battery.voltage,
+            charge=battery.accum_charge,
+            capacity=battery.capacity,
+            elapsed=battery.time_since_last_action(),
+            phase_eta=battery.eta.phase_eta(),
+            test_eta=battery.eta.test_eta(),
+            warning=battery.warning,
+            queue_position=battery.queue_position() if battery.queued else 0,
+            run_capacity_test=battery.run_capacity_test,
+            run_recondition=battery.run_recondition,
+            done=battery.cap_test_done or battery.recondition_done,
+            report_folder=battery.report_folder,
+            log_file=battery.logger.file_path,
+            do_logs=battery.logger.do_logs,
+        )
+
+
+# Snapshot of a channel without a battery
+def empty_snapshot(index):
+    return ChannelSnapshot(index, False, None, None, None, None, None, None,
+                           None, None, None, None, 0, False, False, False, None)
+
+# Snapshot as plain JSON types, enums by name and times in ISO format
+def snapshot_to_dict(snapshot):
+    values = {}
+    for field, value in snapshot._asdict().items():
+        if isinstance(value, Enum):
+            value = value.name
+        elif isinstance(value, datetime):
+            value = value.isoformat(timespec='seconds')
+        values[field] = value
+    return values
+
+# Serial numbers name the battery's log files
+# Returns an error message for an invalid serial number, None if it is valid
+def check_serial_num(serial_num):
+    if not serial_num:
+        return "Serial number cannot be empty!"
+    if not set(serial_num) <= SAFE_FILE_CHARS:
+        return "Serial number must only consist of letters, numbers, and following characters: '~-_.'"
+    return None
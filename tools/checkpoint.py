@@ -0,0 +1,71 @@
+from global_consts import Config
+from datetime import datetime
+import json
+import os
+import traceback
+
+########################################
+# Constants
+########################################
+CHECKPOINT_FOLDER_NAME = "checkpoints"
+CHECKPOINT_EXTENSION = ".json"
+TMP_EXTENSION = ".tmp"
+DATETIME_KEY = '__datetime__'
+
+###########################################
+# Checkpoint functions
+# Responsible for:
+#   - Atomically saving a battery's in-progress state to disk
+#   - Loading it back when the same battery reconnects
+###########################################
+
+def _checkpoint_path(serial_num):
+    folder = os.path.join(os.path.expanduser(Config.config[Config.LOGS_FOLDER_KEY]), CHECKPOINT_FOLDER_NAME)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, serial_num + CHECKPOINT_EXTENSION)
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {DATETIME_KEY: obj.isoformat()}
+    raise TypeError(f"Cannot checkpoint {type(obj)}")
+
+def _decode(obj):
+    if DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[DATETIME_KEY])
+    return obj
+
+# Write to a temporary file and rename it over the old checkpoint,
+# so a crash mid-write always leaves a complete checkpoint behind
+def save_checkpoint(serial_num, data):
+    try:
+        path = _checkpoint_path(serial_num)
+        tmp_path = path + TMP_EXTENSION
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, default=_encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        print(f"ERROR SAVING CHECKPOINT: {traceback.format_exc()}")
+        return True
+    return False
+
+def load_checkpoint(serial_num):
+    try:
+        path = _checkpoint_path(serial_num)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f, object_hook=_decode)
+    except:
+        print(f"ERROR LOADING CHECKPOINT: {traceback.format_exc()}")
+    return None
+
+def delete_checkpoint(serial_num):
+    try:
+        path = _checkpoint_path(serial_num)
+        if os.path.exists(path):
+            os.remove(path)
+    except:
+        print(f"ERROR DELETING CHECKPOINT: {traceback.format_exc()}")
+        return True
+    return False
@@ -0,0 +1,245 @@
+from tools.fleet_index import FleetIndex
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+
+########################################
+# Constants
+########################################
+MAX_BATCH_BYTES = 50000000  # Largest batch a station may send
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stations (
+    station     TEXT PRIMARY KEY,
+    last_seen   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spools (
+    spool_id    TEXT PRIMARY KEY,
+    station     TEXT NOT NULL,
+    last_id     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    station     TEXT NOT NULL,
+    channel     INTEGER NOT NULL,
+    time        TEXT NOT NULL,
+    snapshot    TEXT NOT NULL,
+    PRIMARY KEY (station, channel)
+);
+CREATE TABLE IF NOT EXISTS telemetry (
+    station     TEXT NOT NULL,
+    channel     INTEGER NOT NULL,
+    time        TEXT NOT NULL,
+    serial_num  TEXT,
+    state       TEXT,
+    voltage     REAL,
+    charge      REAL
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    station     TEXT NOT NULL,
+    channel     INTEGER NOT NULL,
+    time        TEXT NOT NULL,
+    serial_num  TEXT,
+    field       TEXT NOT NULL,
+    old         TEXT,
+    new         TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    station     TEXT NOT NULL,
+    log_file    TEXT NOT NULL,
+    serial_num  TEXT NOT NULL,
+    started_at  TEXT NOT NULL,
+    PRIMARY KEY (station, log_file)
+);
+CREATE TABLE IF NOT EXISTS tests (
+    station         TEXT NOT NULL,
+    log_file        TEXT NOT NULL,
+    serial_num      TEXT NOT NULL,
+    completed_at    TEXT NOT NULL,
+    capacity        REAL NOT NULL,
+    PRIMARY KEY (station, log_file, completed_at)
+);
+CREATE INDEX IF NOT EXISTS telemetry_sn_idx ON telemetry (serial_num, time);
+CREATE INDEX IF NOT EXISTS telemetry_station_idx ON telemetry (station, channel, time);
+CREATE INDEX IF NOT EXISTS transitions_sn_idx ON transitions (serial_num, time);
+CREATE INDEX IF NOT EXISTS sessions_sn_idx ON sessions (serial_num, started_at);
+CREATE INDEX IF NOT EXISTS tests_sn_idx ON tests (serial_num, completed_at);
+CREATE INDEX IF NOT EXISTS tests_time_idx ON tests (completed_at);
+CREATE INDEX IF NOT EXISTS tests_cap_idx ON tests (capacity);
+"""
+
+###########################################
+# CollectorIndex Class
+# Responsible for:
+#   - Storing the telemetry and results of every station in one database
+#   - Ingesting each station batch once, even when a station resends it
+#     after losing the collector's answer
+#   - Looking up channels, battery history and results across stations
+###########################################
+class CollectorIndex:
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Store a batch of spooled records from a station in one transaction
+    # Returns the id of the last record stored, which the station may forget
+    def ingest(self, station, spool_id, records):
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT last_id FROM spools WHERE spool_id = ?", (spool_id,)).fetchone()
+            last_id = row[0] if row is not None else 0
+            for record in records:
+                if record['id'] <= last_id:
+                    continue    # Already stored
+                self._store(station, record)
+                last_id = record['id']
+            self.conn.execute("INSERT OR REPLACE INTO spools VALUES (?, ?, ?)", (spool_id, station, last_id))
+            self.conn.execute("INSERT OR REPLACE INTO stations VALUES (?, ?)", (station, datetime.now().isoformat()))
+        return last_id
+
+    def _store(self, station, record):
+        kind, time, data = record['kind'], record['time'], record['data']
+        if kind == 'telemetry':
+            self.conn.execute("INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?)",
+                              (station, data['index'], time, json.dumps(data)))
+            if data['connected']:
+                self.conn.execute("INSERT INTO telemetry VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (station, data['index'], time, data['serial_num'], data['state'], data['voltage'], data['charge']))
+        elif kind == 'transition':
+            self.conn.execute("INSERT INTO transitions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (station, data['index'], data['time'], data['serial_num'], data['field'],
+                               json.dumps(data['from']), json.dumps(data['to'])))
+        elif kind == 'session':
+            self.conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                              (station, data['log_file'], data['serial_num'], data['started_at']))
+        elif kind == 'capacity':
+            self.conn.execute("INSERT OR REPLACE INTO tests VALUES (?, ?, ?, ?, ?)",
+                              (station, data['log_file'], data['serial_num'], data['completed_at'], data['capacity']))
+        else:
+            raise ValueError(f"Unknown record kind: {kind}")
+
+    # Every station with the time it last sent something
+    def find_stations(self):
+        return self._select("SELECT * FROM stations ORDER BY station", [])
+
+    # Latest snapshot of every channel, optionally of one station
+    def find_channels(self, station=None):
+        where, params = ("WHERE station = ?", [station]) if station is not None else ("", [])
+        rows = self._select(f"SELECT station, time, snapshot FROM channels {where} ORDER BY station, channel", params)
+        return [dict(json.loads(row['snapshot']), station=row['station'], time=row['time']) for row in rows]
+
+    # Same filters as FleetIndex, across every station
+    def find_sessions(self, serial_num=None, start=None, end=None):
+        where, params = FleetIndex._filters(serial_num, start, end, 'started_at')
+        return self._select("SELECT * FROM sessions" + where + " ORDER BY started_at", params)
+
+    def find_tests(self, serial_num=None, start=None, end=None, min_capacity=None, max_capacity=None):
+        where, params = FleetIndex._filters(serial_num, start, end, 'completed_at', min_capacity, max_capacity)
+        return self._select("SELECT * FROM tests" + where + " ORDER BY completed_at", params)
+
+    # A battery's readings and transitions, wherever it was tested
+    def find_telemetry(self, serial_num, start=None, end=None):
+        where, params = FleetIndex._filters(serial_num, start, end, 'time')
+        return self._select("SELECT * FROM telemetry" + where + " ORDER BY time", params)
+
+    def find_transitions(self, serial_num=None, start=None, end=None):
+        where, params = FleetIndex._filters(serial_num, start, end, 'time')
+        return self._select("SELECT * FROM transitions" + where + " ORDER BY time", params)
+
+    def _select(self, query, params):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params)]
+
+
+###########################################
+# CollectorServer Class
+# Responsible for:
+#   - Taking batches from the stations' uplinks over HTTP
+#       POST /ingest    {"station", "spool_id", "records": [{"id", "kind", "time", "data"}]}
+#                       answered with {"ok": true, "last_id"}
+#   - Answering queries across the whole bank of stations
+#       GET /stations, /channels[?station=]
+#       GET /sessions, /tests, /transitions [?sn=&start=&end=], /tests also [&min_cap=&max_cap=]
+#       GET /telemetry?sn=[&start=&end=]
+###########################################
+class CollectorServer:
+    def __init__(self, index, host, port):
+        self.httpd = ThreadingHTTPServer((host, port), _CollectorHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.index = index
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != '/ingest':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length > MAX_BATCH_BYTES:
+                self._send_json(413, {'ok': False, 'error': "Batch too large"})
+                return
+            batch = json.loads(self.rfile.read(length))
+            last_id = self.server.index.ingest(batch['station'], batch['spool_id'], batch['records'])
+            self._send_json(200, {'ok': True, 'last_id': last_id})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'ok': False, 'error': f"Bad batch: {e!r}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        index = self.server.index
+        try:
+            serial_num = query.get('sn')
+            start = datetime.fromisoformat(query['start']) if 'start' in query else None
+            end = datetime.fromisoformat(query['end']) if 'end' in query else None
+            if url.path == '/stations':
+                rows = index.find_stations()
+            elif url.path == '/channels':
+                rows = index.find_channels(query.get('station'))
+            elif url.path == '/sessions':
+                rows = index.find_sessions(serial_num, start, end)
+            elif url.path == '/tests':
+                min_capacity = float(query['min_cap']) if 'min_cap' in query else None
+                max_capacity = float(query['max_cap']) if 'max_cap' in query else None
+                rows = index.find_tests(serial_num, start, end, min_capacity, max_capacity)
+            elif url.path == '/transitions':
+                rows = index.find_transitions(serial_num, start, end)
+            elif url.path == '/telemetry' and serial_num is not None:
+                rows = index.find_telemetry(serial_num, start, end)
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self._send_json(400, {'ok': False, 'error': str(e)})
+            return
+        self._send_json(200, rows)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests are not worth a line in the log
+    def log_message(self, format, *args):
+        pass
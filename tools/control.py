@@ -0,0 +1,126 @@
+from tools.channel import check_serial_num, snapshot_to_dict
+from tools.logger import Logger, Type, Action
+from global_consts import Config
+import asyncio
+import json
+import os
+import socket
+import traceback
+
+########################################
+# Constants
+########################################
+CLIENT_TIMEOUT = 10     # s a client waits for the station to answer
+
+# Requests are one JSON object per line, {"command": <name>, ...}, and each gets a
+# one line answer, {"ok": true, ...} or {"ok": false, "error": <message>}
+# status                                  channel snapshots and batteries waiting for a SN
+# enroll {channel, serial_num}            set up a newly connected battery
+# action {channel, action}                start an Action, by name, on a battery
+# serial_num {channel, serial_num}        change a battery's SN
+# toggle_logs {channel}                   turn a battery's logging on or off
+# stop                                    stop the station
+
+###########################################
+# ControlServer Class
+# Responsible for:
+#   - Serving a station's state and commands on a local Unix socket,
+#     from the station's event loop
+###########################################
+class ControlServer:
+    def __init__(self, station, path=None):
+        self.station = station
+        self.path = path if path is not None else Config.config[Config.CONTROL_SOCKET_KEY]
+        self.server = None
+        self.clients = {}           # Task serving each connected client -> its writer
+
+    async def start(self):
+        # A crashed station leaves its socket behind
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, self.path)
+        Logger.get_sys_logger().log(Type.GENERAL, f"Control socket listening on {self.path}")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        # Let the clients' tasks finish instead of having them cancelled with the loop
+        for writer in self.clients.values():
+            writer.close()
+        await asyncio.gather(*self.clients, return_exceptions=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self.clients[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(self.handle(line)).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            del self.clients[task]
+
+    # Answer one request line
+    def handle(self, line):
+        try:
+            request = json.loads(line)
+            command = request['command']
+            if command == 'status':
+                return {'ok': True,
+                        'channels': [snapshot_to_dict(s) for s in self.station.update()],
+                        'pending': self.station.enrollment.pending()}
+            if command == 'stop':
+                self.station.stop()
+                return {'ok': True}
+
+            channel = request['channel']
+            if channel not in self.station.controllers:
+                raise ValueError(f"No battery {channel + 1}")
+            if command == 'enroll' or command == 'serial_num':
+                error = check_serial_num(request['serial_num'])
+                if error:
+                    raise ValueError(error)
+                if command == 'enroll':
+                    self.station.enroll(channel, request['serial_num'])
+                else:
+                    self.station.command(channel, 'set_serial_num', request['serial_num'])
+            elif command == 'action':
+                action = Action[request['action']]
+                if action == Action.CAPACITY_TEST:
+                    self.station.command(channel, 'queue_capacity_test')
+                else:
+                    self.station.command(channel, 'set_action', action)
+            elif command == 'toggle_logs':
+                self.station.command(channel, 'toggle_do_logs')
+            else:
+                raise ValueError(f"Unknown command: {command}")
+            return {'ok': True}
+        except KeyError as e:
+            return {'ok': False, 'error': f"Missing or unknown value: {e}"}
+        except (ValueError, TypeError) as e:
+            return {'ok': False, 'error': str(e)}
+        except Exception:
+            Logger.get_sys_logger().log(Type.ERROR, f"ERROR HANDLING CONTROL REQUEST: {traceback.format_exc()}")
+            return {'ok': False, 'error': "Internal error, see the system log"}
+
+
+# Send one request to a running station and return its answer
+# Raises OSError if no station is listening
+def send_request(request, path=None):
+    if path is None:
+        path = Config.config[Config.CONTROL_SOCKET_KEY]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CLIENT_TIMEOUT)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as answer:
+            return json.loads(answer.readline())
@@ -0,0 +1,110 @@
+import numpy as np
+
+########################################
+# Constants
+########################################
+SLOPE_WINDOW = 10           # Samples used for the recent voltage slope
+KNEE_SLOPE_RATIO = 3        # Knee is where dV/dq gets this many times steeper than the plateau
+MIN_FIT_POINTS = 10         # Samples past the knee needed before predicting
+NUM_CI_SAMPLES = 500        # Parameter samples drawn for the confidence interval
+CI_PERCENTILES = [2.5, 97.5]
+
+###########################################
+# DischargePredictor Class
+# Responsible for:
+#   - Detecting the knee of a full discharge curve
+#   - Predicting the charge at which the minimum voltage is reached,
+#     with a 95% confidence interval
+###########################################
+class DischargePredictor:
+    def __init__(self, min_voltage):
+        self.min_voltage = min_voltage
+        self.charge = []            # Discharged charge (mAh, positive)
+        self.voltage = []
+        self.knee_idx = None        # Index of the first sample past the knee
+        self.estimate = None        # Predicted capacity (mAh)
+        self.ci = None              # (low, high) confidence interval (mAh)
+        self.rng = np.random.default_rng(0)
+
+    def add_sample(self, charge, voltage):
+        self.charge.append(abs(charge))
+        self.voltage.append(voltage)
+
+        if self.knee_idx is None:
+            self._detect_knee()
+        if self.knee_idx is not None:
+            self._fit()
+
+    # True once the confidence interval half width is within the given
+    # fraction of the estimate
+    def is_confident(self, tolerance):
+        if self.estimate is None:
+            return False
+        return (self.ci[1] - self.ci[0]) / 2 <= tolerance * self.estimate
+
+    # Compare the slope of the latest samples to the slope of the plateau
+    # before them. Both are negative while discharging
+    def _detect_knee(self):
+        n = len(self.charge)
+        if n < 3 * SLOPE_WINDOW:
+            return
+
+        q = np.array(self.charge)
+        v = np.array(self.voltage)
+        plateau_slope = self._slope(q[SLOPE_WINDOW:n - SLOPE_WINDOW], v[SLOPE_WINDOW:n - SLOPE_WINDOW])
+        recent_slope = self._slope(q[n - SLOPE_WINDOW:], v[n - SLOPE_WINDOW:])
+        if plateau_slope is None or recent_slope is None:
+            return
+        if recent_slope < 0 and recent_slope < KNEE_SLOPE_RATIO * min(plateau_slope, 0):
+            self.knee_idx = n - SLOPE_WINDOW
+
+    @staticmethod
+    def _slope(q, v):
+        if np.ptp(q) == 0:
+            return None
+        return np.polyfit(q, v, 1)[0]
+
+    # Fit V(q) = a*q^2 + b*q + c past the knee and solve for V = min voltage
+    # The interval comes from drawing parameters from the fit covariance
+    def _fit(self):
+        q = np.array(self.charge[self.knee_idx:])
+        v = np.array(self.voltage[self.knee_idx:])
+        if len(q) < MIN_FIT_POINTS or np.ptp(q) == 0:
+            return
+
+        # Normalize charge so the fit stays well conditioned
+        q0 = q[0]
+        scale = max(np.ptp(q), 1)
+        try:
+            params, cov = np.polyfit((q - q0) / scale, v, 2, cov=True)
+        except (ValueError, np.linalg.LinAlgError):
+            return
+
+        current = (q[-1] - q0) / scale
+        estimate = self._solve(params[np.newaxis, :], current)[0]
+        if np.isnan(estimate) or not np.all(np.isfinite(cov)):
+            self.estimate = None
+            return
+
+        roots = self._solve(self.rng.multivariate_normal(params, cov, NUM_CI_SAMPLES), current)
+        roots = roots[~np.isnan(roots)]
+        if len(roots) < NUM_CI_SAMPLES / 2:
+            self.estimate = None
+            return
+
+        low, high = np.percentile(roots, CI_PERCENTILES)
+        self.estimate = q0 + estimate * scale
+        self.ci = (q0 + low * scale, q0 + high * scale)
+
+    # Smallest charge past the current one where each fitted curve reaches min voltage
+    # params: (n, 3) array of [a, b, c], returns n charges with nan where there is none
+    def _solve(self, params, current):
+        a, b, c = params[:, 0], params[:, 1], params[:, 2] - self.min_voltage
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sqrt_disc = np.sqrt(b * b - 4 * a * c)
+            roots = np.stack([(-b - sqrt_disc) / (2 * a), (-b + sqrt_disc) / (2 * a), -c / b])
+        # Fall back to the linear root when the curve has no quadratic term
+        roots[:2, a == 0] = np.nan
+        roots[2, a != 0] = np.nan
+        roots[~(roots >= current)] = np.nan
+        return np.fmin(np.fmin(roots[0], roots[1]), roots[2])
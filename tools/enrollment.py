@@ -0,0 +1,49 @@
+import threading
+import time
+
+###########################################
+# EnrollmentQueue Class
+# Responsible for:
+#   - Holding newly connected batteries until the operator gives their SN
+#   - Letting the SN be typed in without holding up the update loop
+###########################################
+class EnrollmentQueue:
+    enrollment_queue = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}          # channel -> time the battery was detected, in detection order
+        self.version = 0            # Changes whenever the queue does, so views know when to redraw
+
+    # Returns True if the channel was not waiting yet
+    def add(self, channel):
+        with self.lock:
+            if channel in self.channels:
+                return False
+            self.channels[channel] = time.time()
+            self.version += 1
+            return True
+
+    def remove(self, channel):
+        with self.lock:
+            if self.channels.pop(channel, None) is not None:
+                self.version += 1
+
+    # Waiting channels with their detection time, oldest first
+    def pending(self):
+        with self.lock:
+            return list(self.channels.items())
+
+    def __contains__(self, channel):
+        with self.lock:
+            return channel in self.channels
+
+    def __len__(self):
+        with self.lock:
+            return len(self.channels)
+
+    @staticmethod
+    def get_queue():
+        if EnrollmentQueue.enrollment_queue == None:
+            EnrollmentQueue.enrollment_queue = EnrollmentQueue()
+        return EnrollmentQueue.enrollment_queue
@@ -0,0 +1,244 @@
+from tools.logger import Logger, Action, State
+from tools.fleet_index import FleetIndex
+from global_consts import Config
+from datetime import datetime, timedelta
+import threading
+import traceback
+import time
+import os
+
+########################################
+# Constants
+########################################
+RATE_SMOOTHING = 0.2        # Weight of the newest sample in the rate averages
+PARTIAL_CHARGE_FRACTION = 0.5   # Share of the capacity a partial charge puts back without history
+
+# Capacity test phases left after each action, in order
+# REST only appears once in the test while the capacity test flag is still set
+REMAINING_TEST_PHASES = {
+    Action.CAPACITY_TEST:  [Action.CHARGE_FULL, Action.REST, Action.DISCHARGE_FULL, Action.CHARGE_PARTIAL],
+    Action.CHARGE_FULL:    [Action.REST, Action.DISCHARGE_FULL, Action.CHARGE_PARTIAL],
+    Action.REST:           [Action.DISCHARGE_FULL, Action.CHARGE_PARTIAL],
+    Action.DISCHARGE_FULL: [Action.CHARGE_PARTIAL],
+    Action.CHARGE_PARTIAL: [],
+}
+
+# Start/end time and charge keys of each phase in capacity test report_data
+HISTORY_PHASE_KEYS = {
+    Action.CHARGE_FULL:    ('cf_st', 'cf_et', 'cf_c'),
+    Action.REST:           ('cf_et', 'df_st', None),
+    Action.DISCHARGE_FULL: ('df_st', 'df-cp_t', 'df_c'),
+    Action.CHARGE_PARTIAL: ('df-cp_t', 'cp_et', 'cp_c'),
+}
+
+###########################################
+# EtaEstimator Class
+# Responsible for:
+#   - Tracking a battery's charge rate and voltage slope as it updates
+#   - Predicting when the current phase and the whole capacity test will end,
+#     using the battery's last capacity test when there is one
+###########################################
+class EtaEstimator:
+    # SN -> {'history': phase (duration s, charge mAh), 'capacity': mAh} of the battery's
+    # last capacity test, loaded once and shared by every estimator of that battery
+    histories = {}
+    histories_lock = threading.Lock()
+
+    def __init__(self, serial_num):
+        self.serial_num = serial_num
+        self.rates = {}                 # State -> average |charge rate| (mAh/s)
+        self.voltage_slope = None       # Average voltage slope (V/s) of the current phase
+        self.last_sample = None         # (time, action, state, voltage, charge)
+        self.phase_remaining = None     # Seconds left in the current phase
+        self.test_remaining = None      # Seconds left in the capacity test
+
+        with EtaEstimator.histories_lock:
+            self.last_test = EtaEstimator.histories.get(serial_num)
+            load = self.last_test is None
+            if load:
+                self.last_test = EtaEstimator.histories[serial_num] = {'history': None, 'capacity': None}
+        # Reading the old log can take a moment, so it is done in the background
+        if load:
+            threading.Thread(target=self._load_history, daemon=True).start()
+
+    # Phase (duration s, charge mAh) of the last capacity test, None until loaded or without one
+    @property
+    def history(self):
+        return self.last_test['history']
+
+    # Last measured capacity (mAh)
+    @property
+    def capacity(self):
+        return self.last_test['capacity']
+
+    # Have the next estimator of a battery load its newest capacity test
+    @staticmethod
+    def forget_history(serial_num):
+        with EtaEstimator.histories_lock:
+            EtaEstimator.histories.pop(serial_num, None)
+
+    # Update the averages with the latest reading and recompute the ETAs
+    def update(self, battery):
+        now = time.time()
+        action = battery.action
+        if battery.voltage < 0 or battery.accum_charge == -1:
+            self.phase_remaining = self.test_remaining = None
+            return
+
+        # The charge is read before the update switches the state, and the coulomb counter
+        # is reset when a charge or discharge starts, so the first reading of a new state
+        # is not used for rates and its phase is taken to start from no charge
+        state_changed = self.last_sample is not None and self.last_sample[2] != battery.state
+        charge = None if state_changed else battery.accum_charge
+
+        # Rates are only measured between readings of the same running phase
+        same_phase = self.last_sample is not None and self.last_sample[1:3] == (action, battery.state)
+        if same_phase and battery.state != State.RESTING:
+            t, _, _, last_voltage, last_charge = self.last_sample
+            dt = now - t
+            if dt > 0:
+                if last_charge is not None:
+                    rate = abs(battery.accum_charge - last_charge) / dt
+                    self.rates[battery.state] = EtaEstimator._smooth(self.rates.get(battery.state), rate)
+                slope = (battery.voltage - last_voltage) / dt
+                self.voltage_slope = EtaEstimator._smooth(self.voltage_slope, slope)
+        elif not same_phase:
+            self.voltage_slope = None
+        self.last_sample = (now, action, battery.state, battery.voltage, charge)
+
+        self.phase_remaining = self._phase_remaining(battery, 0 if charge is None else abs(charge))
+        self.test_remaining = None
+        if battery.run_capacity_test and self.phase_remaining is not None and action in REMAINING_TEST_PHASES:
+            remaining = [self._phase_duration(a) for a in REMAINING_TEST_PHASES[action]]
+            if None not in remaining:
+                self.test_remaining = self.phase_remaining + sum(remaining)
+
+    # Estimated finish time of the current phase, None if unknown
+    def phase_eta(self):
+        return EtaEstimator._eta(self.phase_remaining)
+
+    # Estimated finish time of the capacity test, None if unknown or not running one
+    def test_eta(self):
+        return EtaEstimator._eta(self.test_remaining)
+
+    # charge: mAh moved so far in the phase
+    def _phase_remaining(self, battery, charge):
+        action = battery.action
+        elapsed = battery.time_since_last_action()
+
+        if action == Action.CHARGE_FULL:
+            estimate = self._charge_time(State.CHARGING, self._phase_charge(action), charge)
+            if estimate is None:
+                estimate = self._voltage_time(Config.config[Config.MAX_VOLTAGE_KEY], battery.voltage)
+            if estimate is None:
+                estimate = self._history_time(action, elapsed)
+            return EtaEstimator._bounded(estimate, Config.config[Config.MAX_CHARGE_TIME_KEY] - elapsed)
+        elif action == Action.DISCHARGE_FULL:
+            estimate = self._charge_time(State.DISCHARGING, self._phase_charge(action), charge)
+            if estimate is None:
+                estimate = self._voltage_time(Config.config[Config.MIN_VOLTAGE_KEY], battery.voltage)
+            if estimate is None:
+                estimate = self._history_time(action, elapsed)
+            return EtaEstimator._bounded(estimate, Config.config[Config.MAX_DISCHARGE_TIME_KEY] - elapsed)
+        elif action == Action.CHARGE_PARTIAL:
+            estimate = self._voltage_time(Config.config[Config.PARTIAL_VOLTAGE_KEY], battery.voltage)
+            if estimate is None:
+                estimate = self._charge_time(State.CHARGING, self._phase_charge(action), charge)
+            return estimate
+        elif action == Action.DISCHARGE_PARTIAL:
+            return self._voltage_time(Config.config[Config.PARTIAL_VOLTAGE_KEY], battery.voltage)
+        elif action == Action.REST and battery.run_capacity_test:
+            return max(self._phase_duration(Action.REST) - elapsed, 0)
+        return None
+
+    # Expected length of a whole capacity test phase, from the last test
+    # of this battery or else from its capacity and charge rates
+    def _phase_duration(self, action):
+        if self.history is not None:
+            return self.history[action][0]
+        if action == Action.REST:
+            return Config.config[Config.MIN_REST_TIME_KEY]
+        state = State.DISCHARGING if action == Action.DISCHARGE_FULL else State.CHARGING
+        return self._charge_time(state, self._phase_charge(action), 0)
+
+    # Charge expected to flow during a phase (mAh)
+    def _phase_charge(self, action):
+        if self.history is not None:
+            return self.history[action][1]
+        capacity = self.capacity if self.capacity is not None else Config.config[Config.PASS_CAPACITY_KEY]
+        if action == Action.CHARGE_PARTIAL:
+            return capacity * PARTIAL_CHARGE_FRACTION
+        return capacity
+
+    # Time left in a phase if it lasts as long as in the last test
+    def _history_time(self, action, elapsed):
+        if self.history is None:
+            return None
+        return max(self.history[action][0] - elapsed, 0)
+
+    def _charge_time(self, state, expected_charge, charge):
+        rate = self.rates.get(state)
+        if not rate or expected_charge is None:
+            return None
+        return max(expected_charge - charge, 0) / rate
+
+    # Time for the voltage to reach the target at the current slope
+    def _voltage_time(self, target, voltage):
+        if not self.voltage_slope or (target - voltage) / self.voltage_slope < 0:
+            return None
+        return (target - voltage) / self.voltage_slope
+
+    # Get the phase lengths and charges of the battery's last capacity test
+    def _load_history(self):
+        # Imported here, the capacity report module pulls in the plotting stack
+        from tools.capacity_report import reconstruct_capacity_tests
+        try:
+            tests = FleetIndex.get_index().find_tests(self.serial_num)
+            if not tests:
+                return
+            self.last_test['capacity'] = tests[-1]['capacity']
+
+            log_path = os.path.join(os.path.expanduser(Config.config[Config.LOGS_FOLDER_KEY]), tests[-1]['log_file'])
+            tests = reconstruct_capacity_tests(Logger.from_file(log_path))
+            if not tests:
+                return
+            report_data = tests[-1][1]
+            self.last_test['history'] = {action: ((report_data[end] - report_data[start]).total_seconds(),
+                                     abs(report_data[charge]) if charge else 0)
+                            for action, (start, end, charge) in HISTORY_PHASE_KEYS.items()}
+        except Exception:
+            print(f"ERROR LOADING ETA HISTORY: {traceback.format_exc()}")
+
+    @staticmethod
+    def _smooth(average, value):
+        return value if average is None else average + RATE_SMOOTHING * (value - average)
+
+    @staticmethod
+    def _bounded(estimate, timeout):
+        timeout = max(timeout, 0)
+        return timeout if estimate is None else min(estimate, timeout)
+
+    @staticmethod
+    def _eta(remaining):
+        return None if remaining is None else datetime.now() + timedelta(seconds=remaining)
+
+
+# Projected time each channel becomes free, soonest first
+# Idle channels are free now and channels with an unknown ETA are left out
+# snapshots: ChannelSnapshot of each channel
+# Returns a list of (free time, channel, serial number)
+def station_timeline(snapshots):
+    now = datetime.now()
+    timeline = []
+    for snapshot in snapshots:
+        if not snapshot.connected:
+            continue
+        if snapshot.run_capacity_test:
+            free_at = snapshot.test_eta
+        elif snapshot.action == Action.REST and not snapshot.run_recondition:
+            free_at = now
+        else:
+            free_at = snapshot.phase_eta
+        if free_at is not None:
+            timeline.append((free_at, snapshot.index, snapshot.serial_num))
+    return sorted(timeline)
@@ -0,0 +1,79 @@
+from tools.logger import Type
+import csv
+import gzip
+import lzma
+import os
+
+########################################
+# Constants
+########################################
+EXPORT_FILE_NAME = "SESSION_DATA.csv"
+CHUNK_SIZE = 1000   # Rows buffered before each write
+HEADER = ["Time", "Voltage (V)", "Charge (mAH)", "State"]
+
+# File extension and opener for each supported compression
+COMPRESSIONS = {
+    None:   ('', open),
+    'gzip': ('.gz', gzip.open),
+    'xz':   ('.xz', lzma.open),
+}
+
+# Stream every voltage/charge sample in a battery log into one wide CSV
+# Values are held between records so each row has the latest voltage,
+# charge and state. The log is read one line at a time and rows are
+# written in fixed size chunks, so memory use doesn't grow with the log
+# Returns the exported file path
+def export_session(logger, path, compression=None, file_name=EXPORT_FILE_NAME):
+    extension, opener = COMPRESSIONS[compression]
+    file_path = os.path.join(path, file_name + extension)
+
+    try:
+        with opener(file_path, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            for chunk in _session_chunks(logger.read_records()):
+                writer.writerows(chunk)
+    except:
+        # Don't leave a partial export behind
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return file_path
+
+# A row is emitted once per sample, i.e. when a value that is already
+# pending in the current row is read again or the state changes
+def _session_chunks(records):
+    voltage = ''
+    charge = ''
+    state = ''
+    pending_time = None
+    pending_types = set()
+    chunk = []
+
+    for t, id, type, msg in records:
+        if type != Type.VOLTAGE and type != Type.CHARGE and type != Type.STATUS:
+            continue
+
+        if type in pending_types or (type == Type.STATUS and pending_types):
+            chunk.append([pending_time.isoformat(), voltage, charge, state])
+            pending_types.clear()
+            if len(chunk) >= CHUNK_SIZE:
+                yield chunk
+                chunk = []
+
+        if type == Type.STATUS:
+            state = msg
+            continue
+
+        if not pending_types:
+            pending_time = t
+        pending_types.add(type)
+        if type == Type.VOLTAGE:
+            voltage = msg
+        else:
+            charge = msg
+
+    if pending_types:
+        chunk.append([pending_time.isoformat(), voltage, charge, state])
+    if chunk:
+        yield chunk
@@ -0,0 +1,155 @@
+from tools.logger import Logger
+from global_consts import Config
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import sqlite3
+import threading
+import traceback
+import os
+
+########################################
+# Constants
+########################################
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    log_file    TEXT PRIMARY KEY,
+    serial_num  TEXT NOT NULL,
+    started_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    log_file        TEXT NOT NULL,
+    serial_num      TEXT NOT NULL,
+    completed_at    TEXT NOT NULL,
+    capacity        REAL NOT NULL,
+    PRIMARY KEY (log_file, completed_at)
+);
+CREATE INDEX IF NOT EXISTS sessions_sn_idx ON sessions (serial_num, started_at);
+CREATE INDEX IF NOT EXISTS tests_sn_idx ON tests (serial_num, completed_at);
+CREATE INDEX IF NOT EXISTS tests_time_idx ON tests (completed_at);
+CREATE INDEX IF NOT EXISTS tests_cap_idx ON tests (capacity);
+"""
+
+# Scan a battery log for its session and completed capacity tests
+# Runs in a worker process during a rebuild
+def scan_log_file(log_path):
+    # Imported here so plain index updates don't pull in the plotting stack
+    from tools.capacity_report import reconstruct_capacity_tests
+    try:
+        serial_num, started_at = Logger.parse_file_name(log_path)
+        tests = reconstruct_capacity_tests(Logger.from_file(log_path))
+        return (os.path.basename(log_path), serial_num, started_at,
+                [(report_data['cp_et'], capacity) for capacity, report_data in tests])
+    except Exception:
+        print(f"ERROR SCANNING LOG {log_path}: {traceback.format_exc()}")
+        return None
+
+###########################################
+# FleetIndex Class
+# Responsible for:
+#   - Storing every battery session and capacity result
+#   - Looking up battery history by SN, date and capacity
+###########################################
+class FleetIndex:
+    fleet_index = None
+
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # New sessions and results are also forwarded to the collector, if one is configured
+    def add_session(self, serial_num, log_file, started_at):
+        # Imported here, the uplink pulls in the station modules that import this one
+        from tools.uplink import UplinkSpool, SESSION
+        UplinkSpool.record(SESSION, {'serial_num': serial_num, 'log_file': log_file, 'started_at': started_at.isoformat()})
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                                  (log_file, serial_num, started_at.isoformat()))
+        except:
+            print(f"ERROR INDEXING SESSION: {traceback.format_exc()}")
+            return True
+        return False
+
+    def record_capacity(self, serial_num, log_file, capacity, completed_at):
+        from tools.uplink import UplinkSpool, CAPACITY
+        UplinkSpool.record(CAPACITY, {'serial_num': serial_num, 'log_file': log_file, 'capacity': capacity,
+                                      'completed_at': completed_at.isoformat()})
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO tests VALUES (?, ?, ?, ?)",
+                                  (log_file, serial_num, completed_at.isoformat(), capacity))
+        except:
+            print(f"ERROR INDEXING CAPACITY: {traceback.format_exc()}")
+            return True
+        return False
+
+    # Find sessions, optionally filtered by SN and start date range
+    def find_sessions(self, serial_num=None, start=None, end=None):
+        query = "SELECT * FROM sessions"
+        where, params = FleetIndex._filters(serial_num, start, end, 'started_at')
+        return self._select(query + where + " ORDER BY started_at", params)
+
+    # Find capacity test results, optionally filtered by SN,
+    # completion date range and capacity band
+    def find_tests(self, serial_num=None, start=None, end=None, min_capacity=None, max_capacity=None):
+        query = "SELECT * FROM tests"
+        where, params = FleetIndex._filters(serial_num, start, end, 'completed_at', min_capacity, max_capacity)
+        return self._select(query + where + " ORDER BY completed_at", params)
+
+    # Rebuild the index from scratch by scanning the battery logs in parallel
+    def rebuild(self, logs_folder=None, jobs=None):
+        if logs_folder is None:
+            logs_folder = Config.config[Config.LOGS_FOLDER_KEY]
+        log_files = Logger.find_log_files([logs_folder])
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = [r for r in executor.map(scan_log_file, log_files, chunksize=16) if r is not None]
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions")
+            self.conn.execute("DELETE FROM tests")
+            self.conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                                  [(log_file, sn, started_at.isoformat()) for log_file, sn, started_at, tests in results])
+            self.conn.executemany("INSERT OR REPLACE INTO tests VALUES (?, ?, ?, ?)",
+                                  [(log_file, sn, completed_at.isoformat(), capacity)
+                                   for log_file, sn, started_at, tests in results
+                                   for completed_at, capacity in tests])
+        return len(results)
+
+    def _select(self, query, params):
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params)]
+
+    @staticmethod
+    def _filters(serial_num, start, end, time_column, min_capacity=None, max_capacity=None):
+        clauses = []
+        params = []
+        if serial_num is not None:
+            clauses.append("serial_num = ?")
+            params.append(serial_num)
+        if start is not None:
+            clauses.append(f"{time_column} >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            clauses.append(f"{time_column} <= ?")
+            params.append(end.isoformat())
+        if min_capacity is not None:
+            clauses.append("capacity >= ?")
+            params.append(min_capacity)
+        if max_capacity is not None:
+            clauses.append("capacity <= ?")
+            params.append(max_capacity)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def get_index():
+        if FleetIndex.fleet_index == None:
+            FleetIndex.fleet_index = FleetIndex(Config.config[Config.INDEX_FILE_KEY])
+        return FleetIndex.fleet_index
@@ -0,0 +1,63 @@
+import numpy as np
+
+########################################
+# Constants
+########################################
+DEFAULT_NUM_BINS = 20
+
+# Aggregate capacity test results from the fleet index
+# tests: rows from FleetIndex.find_tests()
+# Returns a dict of numpy arrays and summary values, None if there are no tests
+def compute_fleet_stats(tests, threshold, num_bins=DEFAULT_NUM_BINS):
+    if not tests:
+        return None
+
+    serial_nums = np.array([t['serial_num'] for t in tests])
+    capacities = np.array([t['capacity'] for t in tests], dtype=float)
+    completed = np.array([t['completed_at'] for t in tests], dtype='datetime64[us]').astype('datetime64[s]')
+    passed = capacities >= threshold
+
+    # Capacity distribution
+    hist_counts, hist_edges = np.histogram(capacities, bins=num_bins)
+
+    # Group tests by battery, ordered by completion time within each battery
+    order = np.lexsort((completed, serial_nums))
+    serial_nums, capacities, completed, passed = serial_nums[order], capacities[order], completed[order], passed[order]
+    batteries, first_idx, test_counts = np.unique(serial_nums, return_index=True, return_counts=True)
+    last_idx = first_idx + test_counts - 1
+    trends = {sn: (completed[i:i + n], capacities[i:i + n]) for sn, i, n in zip(batteries, first_idx, test_counts)}
+
+    # Station throughput, including days with no completed tests
+    days = completed.astype('datetime64[D]')
+    test_days, day_counts = np.unique(days, return_counts=True)
+    all_days = np.arange(test_days[0], test_days[-1] + 1)
+    tests_per_day = np.zeros(len(all_days), dtype=int)
+    tests_per_day[(test_days - test_days[0]).astype(int)] = day_counts
+
+    return {
+        'threshold': threshold,
+        'num_tests': len(capacities),
+        'num_batteries': len(batteries),
+        'mean_cap': float(np.mean(capacities)),
+        'median_cap': float(np.median(capacities)),
+        'std_cap': float(np.std(capacities)),
+        'min_cap': float(np.min(capacities)),
+        'max_cap': float(np.max(capacities)),
+        'tests_passed': int(np.count_nonzero(passed)),
+        'tests_failed': int(np.count_nonzero(~passed)),
+        # A battery passes if its most recent test passes
+        'batteries_passed': int(np.count_nonzero(passed[last_idx])),
+        'batteries_failed': int(np.count_nonzero(~passed[last_idx])),
+        'start': completed.min().astype(object),
+        'end': completed.max().astype(object),
+        'hist_counts': hist_counts,
+        'hist_edges': hist_edges,
+        'batteries': batteries,
+        'battery_tests': test_counts,
+        'battery_first_cap': capacities[first_idx],
+        'battery_last_cap': capacities[last_idx],
+        'battery_passed': passed[last_idx],
+        'trends': trends,
+        'days': all_days,
+        'tests_per_day': tests_per_day,
+    }
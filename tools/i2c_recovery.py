@@ -0,0 +1,145 @@
+from tools.logger import Logger, Type
+from tools.topology import Channel, get_buses
+from tools.metrics import Metrics
+from tools.presence import PresenceScanner
+from global_consts import Consts
+import Odroid.GPIO as GPIO
+import threading
+import time
+
+########################################
+# Constants
+########################################
+I2C_RETRIES = 3             # Retries of a failed transaction before the muxes are reset
+I2C_BACKOFF = 0.002         # s before the first retry, doubled on each retry after it
+RESET_PULSE_TIME = 0.001    # s the TCA9548 reset line is held low
+RESET_HOLDOFF = 5           # s after a reset before another may be pulsed
+ERROR_WINDOW = 10           # s within which errors on different channels point at the muxes
+
+###########################################
+# I2CRecovery Class
+# Responsible for:
+#   - Retrying failed I2C transactions with exponential backoff
+#   - Pulsing the TCA9548 reset line and having SMBus handles reopened
+#     when retries don't help and the muxes look at fault
+#   - Not resetting the muxes over a battery that was unplugged
+#   - Counting I2C transactions and errors per channel
+###########################################
+class I2CRecovery:
+    i2c_recovery = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0         # Incremented on every reset, SMBus handles older than this are reopened
+        self.last_reset = 0
+        self.reset_pin_ready = False
+        self.counters = {}          # channel -> {'errors', 'retried', 'recovered', 'failed'}
+        self.last_errors = {}       # channel -> time of its last I2C error
+        for key, name in (('errors', 'i2c_errors_total'), ('retried', 'i2c_retries_total'),
+                          ('recovered', 'i2c_recoveries_total'), ('failed', 'i2c_failures_total')):
+            Metrics.get_metrics().add_callback(name, 'counter', lambda key=key: self._metric_counts(key))
+
+    # Run fn(smbus), which talks to the channel's LTC2944, with the channel's bus locked and routed
+    # get_bus(generation) returns the SMBus handle to use, reopening it if the generation changed
+    # The bus is unlocked while backing off, so other channels keep going meanwhile
+    # The muxes are only reset when selecting the channel failed, or other channels
+    # are failing too, since one LTC2944 failing is no fault of the muxes.
+    # Nor are they reset when the presence scanner has seen the battery go
+    # Raises the last error if the transaction still fails after retrying
+    def run(self, channel, get_bus, fn):
+        Metrics.get_metrics().increment('i2c_transactions_total', channel=channel.index)
+        attempt = 0
+        reset = False
+        while True:
+            selected = False
+            try:
+                with channel.lock():
+                    smbus = get_bus(self.generation)
+                    channel.select(smbus)
+                    selected = True
+                    result = fn(smbus)
+                if attempt:
+                    self._count(channel.index, 'recovered')
+                    Logger.get_sys_logger().log(Type.GENERAL, f"I2C on channel {channel.index} recovered after {attempt} retries")
+                return result
+            except OSError:
+                # A failed read leaves the mux in an unknown state too
+                with channel.lock():
+                    Channel.deselect_all(channel.bus)
+                self._count(channel.index, 'errors')
+                if attempt == I2C_RETRIES and not reset:
+                    # An unplugged battery NACKs until it is cleaned up, which is no fault of the muxes
+                    if not selected or (not I2CRecovery._unplugged(channel.index)
+                                        and self._other_channels_failing(channel.index)):
+                        reset = True
+                        self.reset(f"repeated errors on channel {channel.index}")
+                if (attempt >= I2C_RETRIES and not reset) or attempt > I2C_RETRIES:
+                    self._count(channel.index, 'failed')
+                    Logger.get_sys_logger().log(Type.ERROR, f"I2C on channel {channel.index} failed after {attempt} retries")
+                    raise
+                time.sleep(I2C_BACKOFF * 2**attempt)
+                attempt += 1
+                self._count(channel.index, 'retried')
+
+    # Pulse the TCA9548 reset line, which switches off every mux output
+    # Holding every bus lock keeps the pulse from landing in the middle of a transaction
+    def reset(self, reason):
+        with self.lock:
+            if time.time() - self.last_reset < RESET_HOLDOFF:
+                return
+            self.last_reset = time.time()
+
+        locks = [Channel.bus_lock(bus) for bus in get_buses()]
+        for lock in locks:
+            lock.acquire()
+        try:
+            if not self.reset_pin_ready:
+                GPIO.setup(Consts.TCA_RESET_PIN, GPIO.OUT, initial=1)
+                self.reset_pin_ready = True
+            GPIO.output(Consts.TCA_RESET_PIN, 0)
+            time.sleep(RESET_PULSE_TIME)
+            GPIO.output(Consts.TCA_RESET_PIN, 1)
+            for bus in get_buses():
+                Channel.deselect_all(bus)
+            self.generation += 1
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        Logger.get_sys_logger().log(Type.ERROR, f"I2C muxes reset: {reason}")
+
+    # Whether the presence scanner has found the channel's LTC2944 gone
+    # Debounced, so one missed probe doesn't count
+    @staticmethod
+    def _unplugged(channel):
+        scanner = PresenceScanner.presence_scanner
+        return scanner is not None and scanner.presence(channel) is False
+
+    # Whether a channel with a battery still connected had an error recently
+    def _other_channels_failing(self, channel):
+        now = time.time()
+        with self.lock:
+            failing = [c for c, t in self.last_errors.items() if c != channel and now - t < ERROR_WINDOW]
+        return any(not I2CRecovery._unplugged(c) for c in failing)
+
+    # I2C error counts of a channel
+    def counts(self, channel):
+        with self.lock:
+            return dict(self.counters.get(channel, {}))
+
+    # One of the counts of every channel, labelled for Metrics
+    def _metric_counts(self, key):
+        with self.lock:
+            return {(('channel', channel),): counters[key] for channel, counters in self.counters.items()}
+
+    def _count(self, channel, key):
+        with self.lock:
+            counters = self.counters.setdefault(channel, {'errors': 0, 'retried': 0, 'recovered': 0, 'failed': 0})
+            counters[key] += 1
+            if key == 'errors':
+                self.last_errors[channel] = time.time()
+
+    @staticmethod
+    def get_recovery():
+        if I2CRecovery.i2c_recovery == None:
+            I2CRecovery.i2c_recovery = I2CRecovery()
+        return I2CRecovery.i2c_recovery
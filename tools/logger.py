@@ -1,14 +1,30 @@
+from tools.metrics import Metrics
 from enum import Enum
 from datetime import datetime
 import traceback
 import os
+import glob
+import gzip
+import lzma
+import queue
 import shutil
+import tempfile
+import threading
 
 ########################################
 # Constants
 ########################################
 SEP = "\t"
 MAX_DATA_POINTS = 1000
+LOG_EXTENSION = ".log"
+SYS_LOGGER_ID = "System"
+TMP_EXTENSION = ".tmp"
+HOLD_GAP_FACTOR = 1.5   # Gaps longer than this many update times are step-held
+
+# Rotated log segments are named {file_name}.{n}, oldest first,
+# and {file_name}.{n}.gz or .xz once compressed
+SEGMENT_EXTENSIONS = {'gzip': '.gz', 'xz': '.xz'}
+SEGMENT_OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
 
 ########################################
 # Enums
@@ -43,7 +59,7 @@ class Action(Enum):
     DISCHARGE_FULL = 4
     DISCHARGE_PARTIAL = 5
     CAPACITY_TEST = 6
-    RECONDITION = 7 # TODO
+    RECONDITION = 7
 
     def __str__(self):
         return self.name
@@ -53,6 +69,7 @@ class Warning(Enum):
     NONE = 1
     CHECK_CHARGER = 2
     CHECK_LOAD = 3
+    WAITING_FOR_POWER = 4
 
     def __str__(self):
         return self.name
@@ -62,6 +79,8 @@ class Warning(Enum):
             return "Please check charger"
         elif self == Warning.CHECK_LOAD:
             return "Please check load"
+        elif self == Warning.WAITING_FOR_POWER:
+            return "Waiting for power budget"
         return self.name
 
 
@@ -74,22 +93,128 @@ class Warning(Enum):
 class Logger:
     sys_logger = None
 
-    def __init__(self, id, do_logs = True, add_date_to_filename = True):
+    def __init__(self, id, do_logs = True, add_date_to_filename = True, file_name = None):
         self.set_do_logs(do_logs)
-        self.set_id(id, add_date_to_filename)
+        self.do_rotate = True       # Only one process may rotate a log that several processes write
+        self.set_id(id, add_date_to_filename, file_name)
 
     def log(self, type, msg):
         if not self.do_logs:
             return
+        # Make sure the latest telemetry is on record before any state change
+        if type == Type.STATUS or type == Type.ACTION:
+            self.flush_telemetry()
         try:
-            dt_string = datetime.now().isoformat()
-            msg_formatted = f"{dt_string}{SEP}{self.id}{SEP}{type}{SEP}{msg}"
-            with open(self.file_path, 'a') as f:
-                f.write(msg_formatted + '\n')
-            print(msg_formatted)
+            with Metrics.get_metrics().phase('log_write'):
+                now = datetime.now()
+                msg_formatted = f"{now.isoformat()}{SEP}{self.id}{SEP}{type}{SEP}{msg}"
+                with open(self.file_path, 'a') as f:
+                    f.write(msg_formatted + '\n')
+                    size = f.tell()
+                print(msg_formatted)
+
+                if self.segment_start is None:
+                    self.segment_start = now
+                self._check_rotation(size, now)
         except:
             print(f"ERROR LOGGING {traceback.format_exc()}")
 
+    # Log a VOLTAGE or CHARGE reading only when it moved by at least the
+    # deadband since the last logged value, or the heartbeat interval passed
+    # Suppressed readings are held so they can be flushed before the next event
+    def log_telemetry(self, type, value):
+        # Have to do this import here due to circular dependency issue
+        from global_consts import Config
+        deadband = Config.config[Config.VOLTAGE_DEADBAND_KEY if type == Type.VOLTAGE else Config.CHARGE_DEADBAND_KEY]
+        heartbeat = Config.config[Config.LOG_HEARTBEAT_KEY]
+
+        now = datetime.now()
+        last = self.last_telemetry.get(type)
+        if last is None or abs(value - last[1]) >= deadband or (now - last[0]).total_seconds() >= heartbeat:
+            self.pending_telemetry.pop(type, None)
+            self.last_telemetry[type] = (now, value)
+            self.log(type, value)
+        else:
+            self.pending_telemetry[type] = value
+
+    def flush_telemetry(self):
+        pending = self.pending_telemetry
+        self.pending_telemetry = {}
+        for type, value in pending.items():
+            self.last_telemetry[type] = (datetime.now(), value)
+            self.log(type, value)
+
+    # Rotate the log once it gets too big or too old
+    def _check_rotation(self, size, now):
+        if not self.do_rotate:
+            return
+        # Have to do this import here due to circular dependency issue
+        from global_consts import Config
+        max_size = Config.config[Config.LOG_MAX_SIZE_KEY]
+        max_age = Config.config[Config.LOG_MAX_AGE_KEY]
+        if (max_size and size >= max_size) or (max_age and (now - self.segment_start).total_seconds() >= max_age):
+            self.rotate()
+
+    # Close the current log segment and queue it for background compression
+    def rotate(self):
+        try:
+            if not os.path.exists(self.file_path):
+                return False
+            last_segment = max([n for n, path in self._segments()], default=0)
+            segment_path = f"{self.file_path}.{last_segment + 1}"
+            os.replace(self.file_path, segment_path)
+            self.segment_start = None
+            LogCompressor.get_compressor().add(segment_path)
+        except:
+            print(f"ERROR ROTATING LOG: {traceback.format_exc()}")
+            return True
+        return False
+
+    # Called when a battery session ends so its log gets compacted
+    def close(self):
+        self.flush_telemetry()
+        return self.rotate()
+
+    # Rotated segments of this log as (n, path), oldest first
+    def _segments(self):
+        segments = {}
+        prefix = self.file_path + '.'
+        for path in glob.glob(glob.escape(self.file_path) + '.*'):
+            n, ext = os.path.splitext(path[len(prefix):])
+            if not n.isdigit() or (ext and ext not in SEGMENT_OPENERS):
+                continue
+            # A segment is briefly on disk twice while it's being compressed
+            if int(n) not in segments or not ext:
+                segments[int(n)] = path
+        return sorted(segments.items())
+
+    # All files holding this log, oldest first
+    def _log_paths(self):
+        paths = [path for n, path in self._segments()]
+        if os.path.exists(self.file_path):
+            paths.append(self.file_path)
+        return paths
+
+    @staticmethod
+    def _open_segment(path, mode='rt'):
+        opener = SEGMENT_OPENERS.get(os.path.splitext(path)[1], open)
+        return opener(path, mode)
+
+    # Write the whole log, across all segments, as one plain file
+    def _write_combined(self, new_file_path):
+        with open(new_file_path, 'wb') as dst:
+            for path in self._log_paths():
+                with Logger._open_segment(path, 'rb') as src:
+                    shutil.copyfileobj(src, dst)
+
+    def _read_segment_start(self):
+        try:
+            with open(self.file_path, 'r') as f:
+                record = Logger.parse_line(f.readline())
+                return record[0] if record is not None else None
+        except OSError:
+            return None
+
     # Parse log file and retrieve the specified data type
     def get_data(self, type, start_time: float = 0, end_time: float = float('inf')):
         time = []
@@ -102,28 +227,35 @@ class Logger:
             return time, data, charge_times, discharge_times, rest_times
 
         try:
-            with open(self.file_path, 'r') as f:
-                lines = f.readlines()
+            # Have to do this import here due to circular dependency issue
+            from global_consts import Config
+            # Telemetry is only logged when it changes, so hold the previous
+            # value across gaps longer than a normal update
+            hold_gap = HOLD_GAP_FACTOR * Config.config[Config.UPDATE_TIME_KEY]
+            last_t = None
 
             # Parse and store time and data values, if within time range
-            for line in lines:
-                line = line.split(SEP)
-                if len(line) > 3: #and int(line[0]) >= start_time and int(line[0]) <= end_time:
-                    curr_log_type = line[2]
-                    t = datetime.fromisoformat(line[0])
-                    if curr_log_type == str(type):
-                        value = float(line[3].rstrip())
+            for t, id, log_type, msg in self.read_records():
+                last_t = t
+                if log_type == type:
+                    if time and (t - time[-1]).total_seconds() > hold_gap:
                         time.append(t)
-                        data.append(value)
-                        
-                    if curr_log_type == str(Type.STATUS):
-                        status = State[line[3].rstrip()]
-                        if status == State.CHARGING:
-                            charge_times.append(t)
-                        elif status == State.DISCHARGING:
-                            discharge_times.append(t)
-                        else:
-                            rest_times.append(t)
+                        data.append(data[-1])
+                    time.append(t)
+                    data.append(float(msg))
+
+                if log_type == Type.STATUS:
+                    status = State[msg]
+                    if status == State.CHARGING:
+                        charge_times.append(t)
+                    elif status == State.DISCHARGING:
+                        discharge_times.append(t)
+                    else:
+                        rest_times.append(t)
+
+            if time and (last_t - time[-1]).total_seconds() > hold_gap:
+                time.append(last_t)
+                data.append(data[-1])
             
             # Remove excess points - for faster plotting
             num_excess_points = len(time) - MAX_DATA_POINTS
@@ -135,14 +267,41 @@ class Logger:
             print(f"ERROR PARSING DATA: {traceback.format_exc()}")
         return time, data, charge_times, discharge_times, rest_times
 
-    def set_id(self, id, add_date_to_filename = True):
+    # Iterate over the log one record at a time, across rotated and compressed segments
+    # Yields (time, id, type, msg) and skips lines that can't be parsed
+    def read_records(self):
+        for path in self._log_paths():
+            with Logger._open_segment(path) as f:
+                for line in f:
+                    record = Logger.parse_line(line)
+                    if record is not None:
+                        yield record
+
+    @staticmethod
+    def parse_line(line):
+        line = line.rstrip('\n').split(SEP, 3)
+        if len(line) < 4:
+            return None
+        try:
+            return datetime.fromisoformat(line[0]), line[1], Type[line[2]], line[3].rstrip()
+        except (ValueError, KeyError):
+            return None
+
+    # file_name continues an existing log (e.g. a resumed session) instead of starting a new one
+    def set_id(self, id, add_date_to_filename = True, file_name = None):
         self.id = id
+        self.last_telemetry = {}        # Type -> (time, value) of the last logged reading
+        self.pending_telemetry = {}     # Type -> value of the latest suppressed reading
 
-        if add_date_to_filename:
-            dt_string = datetime.now().replace(microsecond=0).isoformat()
-            self.file_name = f"{self.id}_{dt_string}.log"
+        if file_name is not None:
+            self.file_name = file_name
+            add_date_to_filename = False
+        elif add_date_to_filename:
+            started_at = datetime.now().replace(microsecond=0)
+            dt_string = started_at.isoformat()
+            self.file_name = f"{self.id}_{dt_string}{LOG_EXTENSION}"
         else:
-            self.file_name = f"{self.id}.log"
+            self.file_name = f"{self.id}{LOG_EXTENSION}"
 
         try:
             # Have to do this import here due to circular dependency issue
@@ -153,23 +312,41 @@ class Logger:
             os.makedirs(LOGS_FOLDER, exist_ok=True)
         except:
             print(f"ERROR CREATING FOLDER: {traceback.format_exc()}")
+        self.segment_start = self._read_segment_start()
+
+        # Record the new battery session in the fleet index
+        if add_date_to_filename:
+            try:
+                from tools.fleet_index import FleetIndex
+                FleetIndex.get_index().add_session(self.id, self.file_name, started_at)
+            except:
+                print(f"ERROR INDEXING SESSION: {traceback.format_exc()}")
 
     def set_do_logs(self, do_logs):
         self.do_logs = do_logs
 
     def view(self):
         try:
-            if os.path.exists(self.file_path):
+            paths = self._log_paths()
+            if paths == [self.file_path]:
                 os.system(f"pluma {self.file_path}")
                 return False
+            elif paths:
+                # Rotated logs are viewed from a combined, uncompressed copy
+                view_path = os.path.join(tempfile.gettempdir(), self.file_name)
+                self._write_combined(view_path)
+                os.system(f"pluma {view_path}")
+                return False
         except:
             print(f"ERROR OPENING FILE: {traceback.format_exc()}")
         return True
 
     def delete(self):
         try:
-            if os.path.exists(self.file_path):
-                os.remove(self.file_path)
+            paths = self._log_paths()
+            if paths:
+                for path in paths:
+                    os.remove(path)
                 return False
         except:
             print(f"ERROR DELETING FILE: {traceback.format_exc()}")
@@ -178,13 +355,153 @@ class Logger:
     def save_copy(self, new_folder):
         try:
             new_file_path = os.path.join(new_folder, self.file_name)
-            shutil.copyfile(self.file_path, new_file_path)
+            self._write_combined(new_file_path)
             return False
         except:
             print(f"ERROR COPYING FILE: {traceback.format_exc()}")
         return True
     
+    # Open an existing log file, e.g. to rebuild reports from it
+    # Logging is disabled so the original file is never modified
+    @staticmethod
+    def from_file(file_path):
+        file_name = os.path.basename(file_path)
+        id = os.path.splitext(file_name)[0].rsplit('_', 1)[0]
+        logger = Logger(id, do_logs=False, add_date_to_filename=False)
+        logger.file_name = file_name
+        logger.file_path = file_path
+        return logger
+
+    # Expand the given files and folders into a list of battery log paths
+    # Logs that only exist as rotated segments are listed by their original path
+    @staticmethod
+    def find_log_files(paths):
+        log_files = []
+        for path in paths:
+            path = os.path.expanduser(path)
+            if os.path.isdir(path):
+                files = glob.glob(os.path.join(path, '*' + LOG_EXTENSION + '*'))
+                log_files.extend(sorted(set(Logger._base_log_path(f) for f in files) - {None}))
+            else:
+                log_files.append(Logger._base_log_path(path) or path)
+        return [f for f in log_files if os.path.basename(f) != SYS_LOGGER_ID + LOG_EXTENSION]
+
+    # Map a log or log segment path to the log's original path
+    @staticmethod
+    def _base_log_path(path):
+        base, sep, suffix = path.rpartition(LOG_EXTENSION)
+        n, ext = os.path.splitext(suffix[1:])
+        if not sep:
+            return None
+        if not suffix or (suffix[0] == '.' and n.isdigit() and (not ext or ext in SEGMENT_OPENERS)):
+            return base + LOG_EXTENSION
+        return None
+
+    # Compact the logs folder on startup: compress segments left uncompressed
+    # and rotate battery logs that haven't been written to for a while
+    @staticmethod
+    def compact_logs(folder=None):
+        from global_consts import Config
+        if folder is None:
+            folder = Config.config[Config.LOGS_FOLDER_KEY]
+        max_age = Config.config[Config.LOG_MAX_AGE_KEY]
+        now = datetime.now().timestamp()
+        try:
+            for log_path in Logger.find_log_files([folder]):
+                logger = Logger.from_file(log_path)
+                for n, path in logger._segments():
+                    if not os.path.splitext(path)[1] in SEGMENT_OPENERS:
+                        LogCompressor.get_compressor().add(path)
+                if max_age and os.path.exists(log_path) and now - os.path.getmtime(log_path) >= max_age:
+                    logger.rotate()
+        except:
+            print(f"ERROR COMPACTING LOGS: {traceback.format_exc()}")
+
+    # Split a battery log file name into its id and session start time
+    @staticmethod
+    def parse_file_name(file_name):
+        id, dt_string = os.path.splitext(os.path.basename(file_name))[0].rsplit('_', 1)
+        return id, datetime.fromisoformat(dt_string)
+
     def get_sys_logger():
         if Logger.sys_logger == None:
-            Logger.sys_logger = Logger("System", add_date_to_filename=False)
-        return Logger.sys_logger
\ No newline at end of file
+            Logger.sys_logger = Logger(SYS_LOGGER_ID, add_date_to_filename=False)
+        return Logger.sys_logger
+
+
+###########################################
+# LogCompressor Class
+# Responsible for:
+#   - Compressing closed log segments in the background
+#   - Deleting segments older than the retention period
+###########################################
+class LogCompressor:
+    compressor = None
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, segment_path):
+        self.queue.put(segment_path)
+
+    def _run(self):
+        while True:
+            segment_path = self.queue.get()
+            try:
+                self._compress(segment_path)
+                self._apply_retention(os.path.dirname(segment_path))
+            except:
+                print(f"ERROR COMPRESSING LOG: {traceback.format_exc()}")
+
+    def _compress(self, segment_path):
+        from global_consts import Config
+        ext = SEGMENT_EXTENSIONS.get(Config.config[Config.LOG_COMPRESSION_KEY])
+        if ext is None or not os.path.exists(segment_path):
+            return
+
+        # Compress to a temporary file first so readers never see a partial segment
+        tmp_path = segment_path + ext + TMP_EXTENSION
+        with open(segment_path, 'rb') as src, SEGMENT_OPENERS[ext](tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, segment_path + ext)
+        os.remove(segment_path)
+
+    def _apply_retention(self, folder):
+        from global_consts import Config
+        retention_days = Config.config[Config.LOG_RETENTION_KEY]
+        if not retention_days:
+            return
+
+        cutoff = datetime.now().timestamp() - retention_days * 86400
+        logs = {}       # Base log path -> every file holding that log
+        for path in glob.glob(os.path.join(folder, '*' + LOG_EXTENSION + '*')):
+            base = Logger._base_log_path(path[:-len(TMP_EXTENSION)] if path.endswith(TMP_EXTENSION) else path)
+            if base is not None:
+                logs.setdefault(base, []).append(path)
+
+        for base, paths in logs.items():
+            # Old segments of the system log go on their own, it is never closed
+            if os.path.basename(base) == SYS_LOGGER_ID + LOG_EXTENSION:
+                paths = [p for p in paths if p != base and not p.endswith(TMP_EXTENSION) and os.path.getmtime(p) < cutoff]
+            # A battery log goes as a whole or not at all, as reports are regenerated from it,
+            # and not while one of its segments is being compressed
+            elif any(p.endswith(TMP_EXTENSION) or os.path.getmtime(p) >= cutoff for p in paths):
+                continue
+            for path in paths:
+                os.remove(path)
+
+    # Segments waiting to be compressed
+    @staticmethod
+    def queue_depth():
+        compressor = LogCompressor.compressor
+        return compressor.queue.qsize() if compressor is not None else 0
+
+    def get_compressor():
+        if LogCompressor.compressor == None:
+            LogCompressor.compressor = LogCompressor()
+        return LogCompressor.compressor
+
+
+Metrics.get_metrics().add_callback('log_queue_depth', 'gauge', LogCompressor.queue_depth)
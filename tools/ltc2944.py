@@ -1,6 +1,8 @@
 from smbus2 import SMBus
 from global_consts import Consts
-import time
+from tools.topology import get_channel
+from tools.i2c_recovery import I2CRecovery
+from tools.metrics import Metrics
 
 # Registers
 STATUS_REG                      = 0x00
@@ -67,24 +69,28 @@ CHARGE_REG_INIT_VAL_LSB = 0xFF
 #   - Reading and writing to LTC2944 chip 
 ###########################################
 class LTC2944:
+    # channel: index of the channel in the station topology
     def __init__(self, channel):
-        self.channel = channel
-        self.ltc_bus = SMBus(Consts.BUS)
+        self.channel = get_channel(channel)
+        self.recovery = I2CRecovery.get_recovery()
+        self.ltc_bus = None
+        self.bus_generation = None
 
-        self._select_channel()
         LTC2944_mode = AUTOMATIC_MODE | PRESCALAR_M_1024 | DISABLE_ALCC_PIN
-        self.ltc_bus.write_byte_data(Consts.LTC_I2C_ADDRESS, CONTROL_REG, LTC2944_mode)
+        self._transaction(lambda bus: bus.write_byte_data(Consts.LTC_I2C_ADDRESS, CONTROL_REG, LTC2944_mode))
 
     def __del__(self):
         self.close()
 
     def close(self):
-        self.ltc_bus.close()
+        if self.ltc_bus is not None:
+            self.ltc_bus.close()
 
     def read_battery_voltage(self):
-        self._select_channel()
-        voltage_adc_msb = self.ltc_bus.read_byte_data(Consts.LTC_I2C_ADDRESS, VOLTAGE_MSB_REG)
-        voltage_adc_lsb = self.ltc_bus.read_byte_data(Consts.LTC_I2C_ADDRESS, VOLTAGE_LSB_REG)
+        with Metrics.get_metrics().phase('ltc2944_read'):
+            voltage_adc_msb, voltage_adc_lsb = self._transaction(lambda bus: (
+                bus.read_byte_data(Consts.LTC_I2C_ADDRESS, VOLTAGE_MSB_REG),
+                bus.read_byte_data(Consts.LTC_I2C_ADDRESS, VOLTAGE_LSB_REG)))
 
         voltage_adc = voltage_adc_msb << 8 | voltage_adc_lsb
         voltage = (voltage_adc/(65535))*FULLSCALE_VOLTAGE
@@ -95,19 +101,29 @@ class LTC2944:
         RESISTOR = 0.01
         PRESCALAR = 1024
 
-        self._select_channel()
-        mAh_charge_adc_msb = self.ltc_bus.read_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_MSB_REG)
-        mAh_charge_adc_lsb = self.ltc_bus.read_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_LSB_REG)
+        with Metrics.get_metrics().phase('ltc2944_read'):
+            mAh_charge_adc_msb, mAh_charge_adc_lsb = self._transaction(lambda bus: (
+                bus.read_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_MSB_REG),
+                bus.read_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_LSB_REG)))
 
         mAh_charge_adc = (mAh_charge_adc_msb << 8 | mAh_charge_adc_lsb) -  CHARGE_REG_INIT_VAL
         mAh_charge = 1000 * (mAh_charge_adc * CHARGE_lsb * PRESCALAR * 50E-3) / (RESISTOR * 4096)
         return round(mAh_charge, 2)
 
     def reset_coulomb_counter(self):
-        self._select_channel()
-        self.ltc_bus.write_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_MSB_REG, CHARGE_REG_INIT_VAL_MSB)
-        self.ltc_bus.write_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_LSB_REG, CHARGE_REG_INIT_VAL_LSB)
-
-    def _select_channel(self):
-        self.ltc_bus.write_byte(Consts.TCA_I2C_ADDRESS, 1 << self.channel)
-        time.sleep(0.1)
\ No newline at end of file
+        def write(bus):
+            bus.write_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_MSB_REG, CHARGE_REG_INIT_VAL_MSB)
+            bus.write_byte_data(Consts.LTC_I2C_ADDRESS, ACCUM_CHARGE_LSB_REG, CHARGE_REG_INIT_VAL_LSB)
+        self._transaction(write)
+
+    # Run fn(bus) on the channel's routed bus, retrying and recovering the bus on I2C errors
+    def _transaction(self, fn):
+        return self.recovery.run(self.channel, self._get_bus, fn)
+
+    # The SMBus handle is reopened after the muxes are reset
+    def _get_bus(self, generation):
+        if self.ltc_bus is None or self.bus_generation != generation:
+            self.close()
+            self.ltc_bus = SMBus(self.channel.bus)
+            self.bus_generation = generation
+        return self.ltc_bus
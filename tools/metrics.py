@@ -0,0 +1,281 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+import bisect
+import copy
+import multiprocessing
+import threading
+import time
+
+########################################
+# Constants
+########################################
+METRICS_PREFIX = 'battery_station_'
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)  # s
+METRICS_HOST = '127.0.0.1'      # Metrics are only served to this machine
+
+# Help text of every metric, by name without METRICS_PREFIX
+METRIC_HELP = {
+    'phase_seconds': "Time spent in each phase of the update loop",
+    'scheduler_jitter_seconds': "How late update loops started their scheduled updates",
+    'missed_deadlines_total': "Update periods skipped because an update ran late",
+    'i2c_transactions_total': "LTC2944 transactions run, including retried ones once",
+    'i2c_errors_total': "Failed I2C attempts",
+    'i2c_retries_total': "I2C attempts retried after an error",
+    'i2c_recoveries_total': "Transactions that succeeded after retrying",
+    'i2c_failures_total': "Transactions that still failed after retrying",
+    'log_queue_depth': "Log segments waiting for background compression",
+    'uplink_spool_records': "Records waiting to be sent to the collector",
+}
+
+###########################################
+# Histogram Class
+# Responsible for:
+#   - Counting observations into fixed buckets, like a Prometheus histogram
+###########################################
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)      # Last one counts values above every bucket
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Upper bound of the bucket holding the q quantile, no more than the largest value
+    def quantile(self, q):
+        seen = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bucket, self.max)
+        return self.max
+
+
+###########################################
+# Metrics Class
+# Responsible for:
+#   - Collecting latency histograms and counters from any thread
+#   - Reading gauges and counters kept elsewhere when they are exported
+#   - Exporting metrics to send to another process, and rendering the
+#     ones other processes sent along with its own
+#   - Rendering everything in the Prometheus text format and as a
+#     one line summary for the system log
+###########################################
+class Metrics:
+    metrics = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}        # (name, labels) -> Histogram
+        self.counters = {}          # (name, labels) -> value
+        self.callbacks = {}         # name -> (kind, fn), fn returns {labels: value}
+        self.remote = {}            # source -> (labels, export()) sent by another process
+
+    # labels are keyword arguments, e.g. observe('phase_seconds', 0.1, phase='battery_update')
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Export a value kept elsewhere, fn returns {labels tuple: value}, or a single value
+    # kind: 'gauge' or 'counter'
+    def add_callback(self, name, kind, fn):
+        with self.lock:
+            self.callbacks[name] = (kind, fn)
+
+    # Time the body of a with statement as a phase of the update loop
+    @contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('phase_seconds', time.perf_counter() - start, phase=phase)
+
+    # Record how late a loop started an update scheduled every period seconds
+    def tick(self, loop, lateness, period):
+        lateness = max(0, lateness)
+        self.observe('scheduler_jitter_seconds', lateness, loop=loop)
+        if period > 0 and lateness >= period:
+            self.increment('missed_deadlines_total', int(lateness // period), loop=loop)
+
+    # Copy of every metric, callbacks read, that can be pickled and sent to another process
+    def export(self):
+        with self.lock:
+            histograms = copy.deepcopy(self.histograms)
+            counters = dict(self.counters)
+            callbacks = dict(self.callbacks)
+        values = {name: (kind, _read_callback(fn)) for name, (kind, fn) in callbacks.items()}
+        return histograms, counters, values
+
+    # Render what another process exported along with this one's metrics, with labels
+    # added to every metric, e.g. add_remote('Channel 0', exported, channel=0)
+    # Replaces what the source sent before
+    def add_remote(self, source, exported, **labels):
+        with self.lock:
+            self.remote[source] = (tuple(sorted(labels.items())), exported)
+
+    # Every metric in the Prometheus text exposition format
+    def render(self):
+        with self.lock:
+            remote = [self.remote[source] for source in sorted(self.remote)]
+        families = {}       # name -> (kind, [lines])
+        for extra, exported in [((), self.export())] + remote:
+            _render_families(families, exported, extra)
+
+        text = []
+        for name, (kind, lines) in families.items():
+            text.append(f"# HELP {METRICS_PREFIX}{name} {METRIC_HELP.get(name, name)}")
+            text.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+            text += lines
+        return '\n'.join(text) + '\n'
+
+    # Short summary of every metric, for the system log
+    def summary(self):
+        parts = []
+        with self.lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                parts.append(f"{name}{_labels(labels)} n={h.count} avg={_ms(h.sum / h.count)} "
+                             f"p95<={_ms(h.quantile(0.95))} max={_ms(h.max)}")
+            for (name, labels), value in sorted(self.counters.items()):
+                parts.append(f"{name}{_labels(labels)}={value}")
+            callbacks = dict(self.callbacks)
+        for name, (kind, fn) in sorted(callbacks.items()):
+            for labels, value in sorted(_read_callback(fn).items()):
+                parts.append(f"{name}{_labels(labels)}={value}")
+        return "; ".join(parts)
+
+    @staticmethod
+    def get_metrics():
+        if Metrics.metrics == None:
+            Metrics.metrics = Metrics()
+        return Metrics.metrics
+
+
+# Add the exported metrics' lines to families, extra labels added to each
+def _render_families(families, exported, extra):
+    histograms, counters, values = exported
+    for (name, labels), histogram in sorted(histograms.items()):
+        labels = _add_labels(labels, extra)
+        lines = families.setdefault(name, ('histogram', []))[1]
+        cumulative = 0
+        for bucket, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{METRICS_PREFIX}{name}_bucket{_labels(labels + (('le', bucket),))} {cumulative}")
+        lines.append(f"{METRICS_PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+        lines.append(f"{METRICS_PREFIX}{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{METRICS_PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+    for (name, labels), value in sorted(counters.items()):
+        families.setdefault(name, ('counter', []))[1].append(f"{METRICS_PREFIX}{name}{_labels(_add_labels(labels, extra))} {value}")
+    for name, (kind, callback_values) in sorted(values.items()):
+        lines = families.setdefault(name, (kind, []))[1]
+        for labels, value in sorted(callback_values.items()):
+            lines.append(f"{METRICS_PREFIX}{name}{_labels(_add_labels(labels, extra))} {value}")
+
+# Labels already set, e.g. the channel of I2C counters, are kept
+def _add_labels(labels, extra):
+    return tuple(sorted({**dict(extra), **dict(labels)}.items()))
+
+# {name="value",...}, empty without labels
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}ms"
+
+def _read_callback(fn):
+    try:
+        values = fn()
+    except Exception:
+        return {}
+    return values if isinstance(values, dict) else {(): values}
+
+
+###########################################
+# MetricsReporter Class
+# Responsible for:
+#   - Serving the metrics to Prometheus on a localhost port
+#   - Writing a summary of them to the system log periodically
+###########################################
+class MetricsReporter:
+    # port: 0 to only write the summaries, interval: s between summaries, 0 for none
+    def __init__(self, port, interval):
+        self.port = port
+        self.interval = interval
+        self.httpd = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        # Have to do this import here due to circular dependency issue
+        from tools.logger import Logger, Type
+        if self.port:
+            self.httpd = ThreadingHTTPServer((METRICS_HOST, self.port), _MetricsHandler)
+            self.httpd.daemon_threads = True
+            threading.Thread(target=self.httpd.serve_forever, name="Metrics server", daemon=True).start()
+            Logger.get_sys_logger().log(Type.GENERAL, f"Metrics served on http://{METRICS_HOST}:{self.port}/metrics")
+        if self.interval:
+            threading.Thread(target=self._dump, name="Metrics log", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def _dump(self):
+        from tools.logger import Logger, Type
+        while not self.stopped.wait(self.interval):
+            summary = Metrics.get_metrics().summary()
+            if summary:
+                Logger.get_sys_logger().log(Type.GENERAL, f"Metrics of {multiprocessing.current_process().name}: {summary}")
+
+    # Start reporting as configured, returns None if both are disabled or the port is taken
+    # serve: False for channel processes, whose metrics the supervisor serves
+    @staticmethod
+    def start_configured(serve=True):
+        # Have to do this import here due to circular dependency issue
+        from tools.logger import Logger, Type
+        from global_consts import Config
+        port = Config.config[Config.METRICS_PORT_KEY] if serve else 0
+        interval = Config.config[Config.METRICS_LOG_INTERVAL_KEY]
+        if not port and not interval:
+            return None
+        reporter = MetricsReporter(port, interval)
+        try:
+            reporter.start()
+        except OSError as e:
+            Logger.get_sys_logger().log(Type.ERROR, f"Could not start metrics server: {e}")
+            return None
+        return reporter
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = Metrics.get_metrics().render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are not worth a line in the system log
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,129 @@
+from tools.logger import Logger, Type
+from tools.topology import get_channels
+from global_consts import Consts, Config
+from smbus2 import SMBus
+import threading
+import traceback
+
+########################################
+# Constants
+########################################
+PRESENCE_DEBOUNCE = 2   # Sweeps a channel must read the same before its presence changes
+
+###########################################
+# PresenceScanner Class
+# Responsible for:
+#   - Sweeping every channel's LTC2944 from a background thread,
+#     one SMBus session per bus per sweep
+#   - Keeping a presence map so update loops never touch the bus to
+#     find out whether a battery is there
+#   - Publishing connect/disconnect events to subscribers
+###########################################
+class PresenceScanner:
+    presence_scanner = None
+
+    # channels: indices of the channels to sweep, all of them if None
+    def __init__(self, channels=None):
+        self.channels = channels
+        self.lock = threading.Lock()
+        self.present = {}           # channel -> debounced presence, missing until the first sweep
+        self.streaks = {}           # channel -> sweeps in a row that disagreed with present
+        self.subscribers = []
+        self.swept = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Cached presence of a battery on the channel
+    def is_present(self, channel):
+        with self.lock:
+            return self.present.get(channel, False)
+
+    # Debounced presence of a battery on the channel, None until the channel is first swept
+    def presence(self, channel):
+        with self.lock:
+            return self.present.get(channel)
+
+    # Call fn(channel, present) from the scanner thread whenever a battery is connected or removed
+    def subscribe(self, fn):
+        with self.lock:
+            self.subscribers.append(fn)
+
+    def unsubscribe(self, fn):
+        with self.lock:
+            if fn in self.subscribers:
+                self.subscribers.remove(fn)
+
+    # Block until the first sweep is done, so startup sees batteries that are already connected
+    def wait_ready(self, timeout=None):
+        return self.swept.wait(timeout)
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self._sweep()
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR SCANNING CHANNELS: {traceback.format_exc()}")
+            self.swept.set()
+            self.stopped.wait(Config.config[Config.PRESENCE_SCAN_TIME_KEY])
+
+    def _sweep(self):
+        buses = {}
+        for channel in get_channels():
+            if self.channels is None or channel.index in self.channels:
+                buses.setdefault(channel.bus, []).append(channel)
+
+        for bus, channels in buses.items():
+            try:
+                with SMBus(bus) as smbus:
+                    for channel in channels:
+                        self._record(channel.index, PresenceScanner._probe(smbus, channel))
+            except OSError:
+                # The bus itself could not be opened
+                for channel in channels:
+                    self._record(channel.index, False)
+
+    # Lock the bus per channel, so battery reads can slip in between probes
+    @staticmethod
+    def _probe(smbus, channel):
+        try:
+            with channel.lock():
+                channel.select(smbus)
+                # This will return an error if the i2c address is not connected
+                smbus.read_byte_data(Consts.LTC_I2C_ADDRESS, 0)
+                return True
+        except Exception:
+            return False
+
+    def _record(self, channel, present):
+        with self.lock:
+            if channel not in self.present:
+                # First sweep, nothing to debounce against
+                changed = present
+            elif self.present[channel] == present:
+                self.streaks[channel] = 0
+                return
+            else:
+                self.streaks[channel] = self.streaks.get(channel, 0) + 1
+                changed = self.streaks[channel] >= PRESENCE_DEBOUNCE
+                if not changed:
+                    return
+            self.present[channel] = present
+            self.streaks[channel] = 0
+            subscribers = list(self.subscribers)
+
+        if changed:
+            for fn in subscribers:
+                try:
+                    fn(channel, present)
+                except Exception:
+                    Logger.get_sys_logger().log(Type.ERROR, f"ERROR PUBLISHING CHANNEL {channel} PRESENCE: {traceback.format_exc()}")
+
+    @staticmethod
+    def get_scanner():
+        if PresenceScanner.presence_scanner == None:
+            PresenceScanner.presence_scanner = PresenceScanner()
+        return PresenceScanner.presence_scanner
@@ -0,0 +1,126 @@
+from tools.logger import State
+from global_consts import Config
+import threading
+import time
+
+###########################################
+# PowerBudget Class
+# Responsible for:
+#   - Limiting how many channels charge and discharge at once so the
+#     shared supply and loads stay within their configured power budget
+#   - Staggering the start of charge and discharge phases across channels
+###########################################
+class PowerBudget:
+    power_budget = None
+
+    # Config keys of the per channel power and the station budget of each phase
+    PHASE_KEYS = {
+        State.CHARGING:    (Config.CHARGE_POWER_KEY, Config.CHARGE_POWER_BUDGET_KEY),
+        State.DISCHARGING: (Config.DISCHARGE_POWER_KEY, Config.DISCHARGE_POWER_BUDGET_KEY),
+    }
+    # Every config key the budget reads
+    CONFIG_KEYS = [key for keys in PHASE_KEYS.values() for key in keys] + [Config.PHASE_STAGGER_KEY]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}                                  # channel -> state it holds power for
+        self.last_start = {state: 0 for state in PowerBudget.PHASE_KEYS}
+
+    # Try to reserve power for a channel to enter a state
+    # Resting is always allowed. force skips the budget and stagger checks,
+    # for channels that are already running (e.g. resumed from a checkpoint)
+    # Returns True if the channel may enter the state
+    def acquire(self, channel, state, force=False):
+        with self.lock:
+            if state not in PowerBudget.PHASE_KEYS:
+                self.channels.pop(channel, None)
+                return True
+            if self.channels.get(channel) == state:
+                return True
+            if not force and not self._available(state, channel):
+                return False
+            self.channels[channel] = state
+            self.last_start[state] = time.time()
+            return True
+
+    # Take the budget settings from config, for a budget served to other processes
+    # from one that doesn't see the settings being changed
+    def set_config(self, config):
+        with self.lock:
+            Config.config.update({key: config[key] for key in PowerBudget.CONFIG_KEYS})
+
+    # Power in use and the budget of a phase in W, budget is 0 when unlimited
+    def usage(self, state):
+        power_key, budget_key = PowerBudget.PHASE_KEYS[state]
+        with self.lock:
+            in_use = sum(1 for s in self.channels.values() if s == state) * Config.config[power_key]
+        return in_use, Config.config[budget_key]
+
+    def _available(self, state, channel):
+        power_key, budget_key = PowerBudget.PHASE_KEYS[state]
+        if time.time() - self.last_start[state] < Config.config[Config.PHASE_STAGGER_KEY]:
+            return False
+
+        budget = Config.config[budget_key]
+        if budget <= 0:
+            return True
+        others = sum(1 for c, s in self.channels.items() if s == state and c != channel)
+        return (others + 1) * Config.config[power_key] <= budget
+
+    @staticmethod
+    def get_budget():
+        if PowerBudget.power_budget == None:
+            PowerBudget.power_budget = PowerBudget()
+        return PowerBudget.power_budget
+
+
+###########################################
+# TestQueue Class
+# Responsible for:
+#   - Keeping the order in which connected batteries wait for a capacity test
+#   - Starting the next test as soon as the power budget allows a full charge
+###########################################
+class TestQueue:
+    test_queue = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = []
+
+    def add(self, channel):
+        with self.lock:
+            if channel not in self.channels:
+                self.channels.append(channel)
+
+    def remove(self, channel):
+        with self.lock:
+            if channel in self.channels:
+                self.channels.remove(channel)
+
+    # 1 based position of the channel in the queue, 0 if not queued
+    def position(self, channel):
+        with self.lock:
+            return self.channels.index(channel) + 1 if channel in self.channels else 0
+
+    # Tests start in order. A test begins with a full charge, so the channel
+    # at the front starts once it can reserve charge power, which keeps the
+    # channels behind it waiting until the next charge slot frees up
+    # Returns True if the channel left the queue to start its test
+    def try_start(self, channel):
+        with self.lock:
+            if not self.channels or self.channels[0] != channel:
+                return False
+            if not PowerBudget.get_budget().acquire(channel, State.CHARGING):
+                return False
+            self.channels.pop(0)
+            return True
+
+    def __len__(self):
+        with self.lock:
+            return len(self.channels)
+
+    @staticmethod
+    def get_queue():
+        if TestQueue.test_queue == None:
+            TestQueue.test_queue = TestQueue()
+        return TestQueue.test_queue
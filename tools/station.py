@@ -0,0 +1,132 @@
+from tools.channel import ChannelController
+from tools.enrollment import EnrollmentQueue
+from tools.presence import PresenceScanner
+from tools.logger import Logger, Type
+from tools.topology import get_channels
+import queue
+import threading
+import traceback
+
+########################################
+# Constants
+########################################
+# Battery methods that can be run on a channel with Station.command()
+BATTERY_COMMANDS = {'set_action', 'queue_capacity_test', 'set_serial_num', 'toggle_do_logs', 'save_state'}
+
+###########################################
+# Station Class
+# Responsible for:
+#   - Updating every channel of the station from one loop
+#   - Running commands from other threads between updates, so batteries
+#     are only ever touched by the thread running the loop
+#   - Reporting batteries that need a serial number and ones that left
+###########################################
+class Station:
+    # channels: indices of the channels to run, all of them if None
+    # create_rings: False when a supervising process owns the telemetry rings
+    def __init__(self, on_connect=None, on_disconnect=None, channels=None, create_rings=True):
+        if channels is None:
+            channels = range(len(get_channels()))
+        self.controllers = {i: ChannelController(i, create_rings) for i in channels}
+        self.commands = queue.Queue()
+        self.on_connect = on_connect            # Called with a channel index when a new battery needs a SN
+        self.on_disconnect = on_disconnect      # Called with a channel index when a battery is removed
+        self.enrollment = EnrollmentQueue.get_queue()
+        self.wake = threading.Event()           # Set when there is something to do before the next scheduled update
+        self.scanner = PresenceScanner.get_scanner()
+        self.scanner.subscribe(self._on_presence_change)
+
+    # Run fn(controller, *args) on a channel's controller before the next update
+    def post(self, index, fn, *args):
+        self.commands.put((index, fn, args))
+        self.wake.set()
+
+    # Sleep until the timeout, a posted command or a battery being connected or removed
+    # Returns True if woken early
+    def wait(self, timeout):
+        return self.wake.wait(timeout)
+
+    # Set up the battery found on a channel, if it is still there
+    def enroll(self, index, serial_num):
+        self.post(index, self._enroll, serial_num)
+
+    # Run one of the BATTERY_COMMANDS on a channel's battery, if it has one, before the next update
+    def command(self, index, name, *args):
+        if name not in BATTERY_COMMANDS:
+            raise ValueError(f"Unknown battery command: {name}")
+        self.post(index, Station._battery_command, name, args)
+
+    # Checkpoint every battery now, e.g. right before a restart
+    def save_states(self):
+        for controller in self.controllers.values():
+            if controller.battery is not None:
+                controller.battery.save_state()
+
+    # Update every channel once
+    # Returns the channel snapshots
+    def update(self):
+        self.wake.clear()
+        self._run_commands()
+        for controller in self.controllers.values():
+            try:
+                self._update_connection(controller)
+                controller.update()
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR UPDATING CHANNEL {controller.index}: {traceback.format_exc()}")
+        return [self._snapshot(controller) for controller in self.controllers.values()]
+
+    def cleanup(self):
+        self.scanner.unsubscribe(self._on_presence_change)
+        self._run_commands()
+        for controller in self.controllers.values():
+            controller.cleanup()
+
+    def _run_commands(self):
+        while True:
+            try:
+                index, fn, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                fn(self.controllers[index], *args)
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR RUNNING CHANNEL {index} COMMAND: {traceback.format_exc()}")
+
+    @staticmethod
+    def _battery_command(controller, name, args):
+        if controller.connected:
+            getattr(controller.battery, name)(*args)
+
+    def _on_presence_change(self, index, present):
+        self.wake.set()
+
+    def _snapshot(self, controller):
+        snapshot = controller.snapshot()
+        if not snapshot.connected and controller.index in self.enrollment:
+            snapshot = snapshot._replace(awaiting_sn=True)
+        return snapshot
+
+    def _enroll(self, controller, serial_num):
+        self.enrollment.remove(controller.index)
+        if controller.connected:
+            return
+        # Ensure battery did not disconnect while SN is typed in
+        if controller.is_present():
+            controller.connect(serial_num)
+        else:
+            Logger.get_sys_logger().log(Type.GENERAL, f"Battery disconnected at channel {controller.index}")
+
+    # Queue new batteries for enrollment and destroy the battery of removed ones
+    def _update_connection(self, controller):
+        present = controller.is_present()
+        if present and not controller.connected:
+            if self.enrollment.add(controller.index):
+                Logger.get_sys_logger().log(Type.GENERAL, f"Battery connected at channel {controller.index}")
+                if self.on_connect is not None:
+                    self.on_connect(controller.index)
+        elif not present:
+            self.enrollment.remove(controller.index)
+            if controller.connected:
+                controller.disconnect()
+                if self.on_disconnect is not None:
+                    self.on_disconnect(controller.index)
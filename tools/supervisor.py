@@ -0,0 +1,268 @@
+from tools.station import Station, BATTERY_COMMANDS
+from tools.channel import empty_snapshot
+from tools.presence import PresenceScanner
+from tools.scheduler import PowerBudget, TestQueue
+from tools.enrollment import EnrollmentQueue
+from tools.telemetry_ring import TelemetryRing
+from tools.topology import Channel, ProcessBusLock, SharedRoutes, get_channels, get_buses
+from tools.logger import Logger, Type, State
+from tools.metrics import Metrics, MetricsReporter
+from global_consts import Config
+from multiprocessing.managers import BaseManager
+from multiprocessing.connection import wait
+import multiprocessing
+import threading
+import time
+import traceback
+
+########################################
+# Constants
+########################################
+WORKER_TIMEOUT = 60         # s without an update from a worker before it is considered hung
+RESTART_DELAY = 5           # s between restarts of the same worker
+STOP_TIMEOUT = 10           # s to wait for workers to clean up on exit
+PRESENCE_TIMEOUT = 5        # s a new worker waits for its first presence sweep
+METRICS_SEND_INTERVAL = 10  # s between the metrics a worker sends to be served
+
+# IPC protocol, every message is a tuple starting with its type
+# Supervisor -> worker
+ENROLL = 'enroll'           # (ENROLL, serial_num)
+COMMAND = 'command'         # (COMMAND, name, args), name is one of BATTERY_COMMANDS
+SAVE = 'save'               # (SAVE,) checkpoint the battery now
+CONFIG = 'config'           # (CONFIG, config) settings changed in the GUI
+STOP = 'stop'               # (STOP,) clean up and exit
+# Worker -> supervisor
+SNAPSHOT = 'snapshot'       # (SNAPSHOT, ChannelSnapshot) after every update
+METRICS = 'metrics'         # (METRICS, Metrics.export()) every METRICS_SEND_INTERVAL
+
+# Serves the power budget and test queue to every process, as they span channels
+class StationManager(BaseManager):
+    pass
+
+StationManager.register('PowerBudget', PowerBudget.get_budget, exposed=['acquire', 'usage', 'set_config'])
+StationManager.register('TestQueue', TestQueue.get_queue, exposed=['add', 'remove', 'position', 'try_start', '__len__'])
+
+###########################################
+# ChannelWorker Class
+# Responsible for:
+#   - Running one channel's Station in its own process
+#   - Carrying commands to it and snapshots and metrics from it over a pipe
+###########################################
+class ChannelWorker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.snapshot = empty_snapshot(index)
+        self.serial_num = None          # SN of the enrolled battery, to re-enroll it after a restart
+        self.last_message = 0
+        self.last_start = 0
+
+    def start(self, ctx, shared):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(self.index, child_conn, dict(Config.config)) + shared,
+                                   name=f"Channel {self.index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.last_start = self.last_message = time.time()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    # Returns False if the worker is gone
+    def send(self, msg):
+        try:
+            with self.send_lock:
+                self.conn.send(msg)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    # Read every pending message, returns False if the worker is gone
+    def receive(self):
+        try:
+            while self.conn.poll():
+                msg = self.conn.recv()
+                if msg[0] == SNAPSHOT:
+                    self.snapshot = msg[1]
+                    self.last_message = time.time()
+                    if self.snapshot.connected:
+                        self.serial_num = self.snapshot.serial_num
+                    elif not self.snapshot.awaiting_sn:
+                        self.serial_num = None
+                elif msg[0] == METRICS:
+                    Metrics.get_metrics().add_remote(f"Channel {self.index}", msg[1], channel=self.index)
+            return True
+        except (EOFError, OSError):
+            return False
+
+
+###########################################
+# ProcessStation Class
+# Responsible for:
+#   - Running every channel in its own worker process, so a hung bus
+#     call or crash only takes down its own channel
+#   - Restarting crashed and hung workers, re-enrolling their battery
+#   - Offering the same interface as Station to the dashboard
+###########################################
+class ProcessStation:
+    def __init__(self):
+        # Workers are spawned, not forked, as the GUI process runs threads
+        self.ctx = multiprocessing.get_context('spawn')
+        self.manager = StationManager(ctx=self.ctx)
+        self.manager.start()
+        # The GUI shows the same budget and queue the workers use
+        PowerBudget.power_budget = self.manager.PowerBudget()
+        TestQueue.test_queue = self.manager.TestQueue()
+
+        self.bus_locks = {bus: ProcessBusLock(bus) for bus in get_buses()}
+        self.routes = SharedRoutes(self.ctx, get_buses())
+        Channel.share_buses(self.bus_locks, self.routes)
+        self.shared = (self.bus_locks, self.routes, PowerBudget.power_budget, TestQueue.test_queue)
+        self.config = dict(Config.config)   # Settings the manager and workers were last given
+        PowerBudget.power_budget.set_config(self.config)
+        self.enrollment = EnrollmentQueue.get_queue()
+        # Rings outlive their workers, so the GUI keeps its view of a restarted channel
+        self.rings = [TelemetryRing(i, create=True) for i in range(len(get_channels()))]
+
+        self.workers = [ChannelWorker(i) for i in range(len(get_channels()))]
+        for worker in self.workers:
+            worker.start(self.ctx, self.shared)
+        Logger.get_sys_logger().log(Type.GENERAL, f"Started {len(self.workers)} channel workers")
+
+    def enroll(self, index, serial_num):
+        self.workers[index].send((ENROLL, serial_num))
+
+    def command(self, index, name, *args):
+        if name not in BATTERY_COMMANDS:
+            raise ValueError(f"Unknown battery command: {name}")
+        self.workers[index].send((COMMAND, name, args))
+
+    def save_states(self):
+        for worker in self.workers:
+            worker.send((SAVE,))
+
+    # Sleep until the timeout or a running worker sends something
+    # Returns True if woken early
+    def wait(self, timeout):
+        return bool(wait([worker.conn for worker in self.workers if worker.process.is_alive()], timeout))
+
+    # Collect the workers' snapshots and restart the ones that died or hung
+    # Returns the channel snapshots
+    def update(self):
+        # Settings changed in the GUI only change this process's config
+        if Config.config != self.config:
+            self.config = dict(Config.config)
+            PowerBudget.get_budget().set_config(self.config)
+            for worker in self.workers:
+                worker.send((CONFIG, self.config))
+        timeout = max(WORKER_TIMEOUT, 3 * Config.config[Config.UPDATE_TIME_KEY])
+        for worker in self.workers:
+            alive = worker.receive() and worker.process.is_alive()
+            if not alive:
+                self._restart(worker)
+            elif time.time() - worker.last_message > timeout:
+                self._restart(worker, f"sent nothing for {round(time.time() - worker.last_message)} s")
+
+            # The workers own detection, the GUI enrolls from a copy of their queue
+            if worker.snapshot.awaiting_sn:
+                self.enrollment.add(worker.index)
+            else:
+                self.enrollment.remove(worker.index)
+        return [worker.snapshot for worker in self.workers]
+
+    def cleanup(self):
+        for worker in self.workers:
+            worker.send((STOP,))
+        deadline = time.time() + STOP_TIMEOUT
+        for worker in self.workers:
+            worker.process.join(max(0, deadline - time.time()))
+            if worker.process.is_alive():
+                worker.kill()
+        for ring in self.rings:
+            ring.close()
+            ring.unlink()
+        self.manager.shutdown()
+
+    # reason: why a running worker is restarted, None if it exited
+    def _restart(self, worker, reason=None):
+        if time.time() - worker.last_start < RESTART_DELAY:
+            return
+        worker.kill()
+        if reason is None:
+            reason = f"exited with code {worker.process.exitcode}"
+        Logger.get_sys_logger().log(Type.ERROR, f"Channel {worker.index} worker {reason}, restarting")
+
+        # The dead worker may have left its mux half switched, its power reserved
+        # and its place in the test queue taken
+        for bus in get_buses():
+            with Channel.bus_lock(bus):
+                Channel.deselect_all(bus)
+        PowerBudget.get_budget().acquire(worker.index, State.RESTING)
+        TestQueue.get_queue().remove(worker.index)
+        queued = worker.snapshot.queue_position > 0
+
+        worker.snapshot = empty_snapshot(worker.index)
+        worker.start(self.ctx, self.shared)
+        # The battery's checkpoint lets a running test pick up where it left off
+        if worker.serial_num is not None:
+            worker.send((ENROLL, worker.serial_num))
+            if queued:
+                worker.send((COMMAND, 'queue_capacity_test', ()))
+
+
+# Entry point of a channel's worker process
+def _worker_main(index, conn, config, bus_locks, routes, budget, test_queue):
+    Config.config.update(config)
+    # The supervisor rotates the system log every worker writes to
+    Logger.get_sys_logger().do_rotate = False
+    Channel.share_buses(bus_locks, routes)
+    PowerBudget.power_budget = budget
+    TestQueue.test_queue = test_queue
+    PresenceScanner.presence_scanner = PresenceScanner([index])
+    PresenceScanner.presence_scanner.wait_ready(PRESENCE_TIMEOUT)
+
+    station = Station(channels=[index], create_rings=False)
+    # This process's metrics are served by the supervisor
+    reporter = MetricsReporter.start_configured(serve=False)
+    next_update = 0
+    next_metrics = time.time() + METRICS_SEND_INTERVAL
+    save = True
+    try:
+        while True:
+            if conn.poll(max(0, min(next_update - time.time(), 0.1))):
+                msg = conn.recv()
+                if msg[0] == STOP:
+                    save = False
+                    break
+                elif msg[0] == ENROLL:
+                    station.enroll(index, msg[1])
+                elif msg[0] == COMMAND:
+                    station.command(index, msg[1], *msg[2])
+                elif msg[0] == SAVE:
+                    station.save_states()
+                elif msg[0] == CONFIG:
+                    Config.config.update(msg[1])
+            if station.wake.is_set() or time.time() >= next_update:
+                update_time = Config.config[Config.UPDATE_TIME_KEY]
+                if next_update and not station.wake.is_set():
+                    Metrics.get_metrics().tick('channel_process', time.time() - next_update, update_time)
+                next_update = time.time() + update_time
+                conn.send((SNAPSHOT, station.update()[0]))
+            if Config.config[Config.METRICS_PORT_KEY] and time.time() >= next_metrics:
+                next_metrics = time.time() + METRICS_SEND_INTERVAL
+                conn.send((METRICS, Metrics.get_metrics().export()))
+    except (EOFError, OSError, KeyboardInterrupt):
+        # The supervisor is gone, e.g. restarting: keep the test resumable
+        pass
+    except Exception:
+        Logger.get_sys_logger().log(Type.ERROR, f"ERROR IN CHANNEL {index} WORKER: {traceback.format_exc()}")
+    finally:
+        if save:
+            station.save_states()
+        station.cleanup()
+        if reporter is not None:
+            reporter.stop()
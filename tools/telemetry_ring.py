@@ -0,0 +1,176 @@
+from tools.logger import Type, State
+from multiprocessing import shared_memory
+from datetime import datetime
+import numpy as np
+import time
+
+########################################
+# Constants
+########################################
+RING_CAPACITY = 16384           # Records per channel, almost a day at the default update time
+RING_NAME = "battery_station_ch{}"
+RING_MAGIC = 0x42545231         # "BTR1", changes with the layout
+READ_RETRIES = 10               # Attempts at a consistent read while the writer laps the reader
+TYPE_FIELDS = {Type.VOLTAGE: 'voltage', Type.CHARGE: 'charge'}
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('capacity', '<u4'),
+    ('head', '<u8'),            # Records written since the ring was created
+    ('created', '<f8'),         # Time the ring was created
+    ('session_start', '<f8'),   # Start of the current battery's log session
+])
+RECORD_DTYPE = np.dtype([
+    ('seq', '<u8'),             # Odd while the record is being written
+    ('timestamp', '<f8'),       # s since the epoch
+    ('voltage', '<f8'),         # V, NaN if it could not be read
+    ('charge', '<f8'),          # mAh accumulated since the last coulomb counter reset, NaN if unknown
+    ('current', '<f8'),         # mA averaged since the previous record, NaN if unknown
+    ('state', '<i4'),           # State value
+    ('reserved', '<i4'),
+])
+
+###########################################
+# TelemetryRing Class
+# Responsible for:
+#   - Keeping a channel's recent telemetry in shared memory, so other
+#     threads and processes read it without copying it through the GUI
+#     or reparsing the log
+#   - Letting one writer append while readers check each record's
+#     sequence number instead of taking a lock
+###########################################
+class TelemetryRing:
+    # create: make a new, empty ring in place of any left over one, instead of opening the existing one
+    # readonly: map the records read only, for readers
+    def __init__(self, channel, create=False, readonly=False):
+        self.channel = channel
+        name = RING_NAME.format(channel)
+        size = HEADER_DTYPE.itemsize + RING_CAPACITY * RECORD_DTYPE.itemsize
+        if create:
+            try:
+                # A crashed station leaves its rings behind
+                shared_memory.SharedMemory(name).unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+
+        self.header = np.ndarray((1,), HEADER_DTYPE, self.shm.buf, 0)
+        self.records = np.ndarray((RING_CAPACITY,), RECORD_DTYPE, self.shm.buf, HEADER_DTYPE.itemsize)
+        if create:
+            self.records[:] = 0
+            self.header[0] = (RING_MAGIC, RING_CAPACITY, 0, time.time(), 0)
+        elif self.header['magic'][0] != RING_MAGIC or self.header['capacity'][0] != RING_CAPACITY:
+            self.close()
+            raise ValueError(f"Telemetry ring of channel {channel} has an unknown layout")
+        if readonly:
+            self.header.flags.writeable = False
+            self.records.flags.writeable = False
+        self.last_state = None          # State of the last record appended
+        self.base = None                # (timestamp, charge) current can be averaged from, None at a new state
+
+    def close(self):
+        # The views must go before the mapping can be closed
+        self.header = None
+        self.records = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    ################ Writer ################
+    # Only one thread of one process may write to a ring
+
+    # Mark where a new battery's records start
+    # start: when its log session started, earlier than now for a resumed test
+    def start_session(self, start):
+        self.header['session_start'] = start
+        self.last_state = None
+        self.base = None
+
+    def append(self, voltage, charge, state):
+        now = time.time()
+        voltage = np.nan if voltage < 0 else voltage
+        charge = np.nan if charge == -1 else charge
+        # The coulomb counter is reset when the state changes, after the charge of the update
+        # that changed it was read, so only average between later records of the same state
+        current = np.nan
+        same_state = self.last_state == state
+        if same_state and self.base is not None and now > self.base[0]:
+            current = (charge - self.base[1]) / ((now - self.base[0]) / 3600)
+        self.base = (now, charge) if same_state else None
+        self.last_state = state
+
+        head = int(self.header['head'][0])
+        record = self.records[head % RING_CAPACITY:head % RING_CAPACITY + 1]
+        record['seq'] = 2 * head + 1
+        record['timestamp'] = now
+        record['voltage'] = voltage
+        record['charge'] = charge
+        record['current'] = current
+        record['state'] = state.value
+        record['seq'] = 2 * head + 2
+        self.header['head'] = head + 1
+
+    ################ Readers ################
+
+    # Copy of the records of the current session, oldest first
+    # Returns a structured array with RECORD_DTYPE fields
+    def read(self, session_only=True):
+        for attempt in range(READ_RETRIES):
+            head = int(self.header['head'][0])
+            first = max(0, head - RING_CAPACITY)
+            indices = np.arange(first, head, dtype=np.uint64)
+            records = self.records[indices % RING_CAPACITY]     # Fancy indexing copies
+            # Like a seqlock, a record is only valid if it had the sequence number expected at
+            # its place both before and after it was copied, so the writer didn't lap it meanwhile
+            seq_after = self.records['seq'][indices % RING_CAPACITY]
+            valid = (records['seq'] == 2 * indices + 2) & (seq_after == records['seq'])
+            if valid.all() or attempt == READ_RETRIES - 1:
+                records = records[valid]
+                break
+        if session_only:
+            records = records[records['timestamp'] >= self.header['session_start'][0]]
+        return records
+
+    # Whether the ring holds the whole session, so it can be read instead of the log
+    # A session resumed from before the ring was created, or one older than the
+    # oldest record kept, is only complete in the log
+    def covers_session(self):
+        head = int(self.header['head'][0])
+        complete_from = self.header['created'][0]
+        if head > RING_CAPACITY:
+            complete_from = self.records['timestamp'][head % RING_CAPACITY]
+        return bool(complete_from <= self.header['session_start'][0])
+
+    # Same tuple as Logger.get_data() for the session in the ring
+    def get_data(self, type):
+        records = self.read()
+        field = TYPE_FIELDS[type]
+        samples = records[~np.isnan(records[field])]
+        times = [datetime.fromtimestamp(t) for t in samples['timestamp']]
+        data = samples[field].tolist()
+
+        charge_times = []
+        discharge_times = []
+        rest_times = []
+        changes = np.flatnonzero(np.diff(records['state'], prepend=0))
+        for i in changes:
+            t = datetime.fromtimestamp(records['timestamp'][i])
+            state = State(int(records['state'][i]))
+            if state == State.CHARGING:
+                charge_times.append(t)
+            elif state == State.DISCHARGING:
+                discharge_times.append(t)
+            else:
+                rest_times.append(t)
+        return times, data, charge_times, discharge_times, rest_times
+
+    # Open a channel's ring to read it, None if the station has not created it
+    @staticmethod
+    def open(channel):
+        try:
+            return TelemetryRing(channel, readonly=True)
+        except (FileNotFoundError, ValueError):
+            return None
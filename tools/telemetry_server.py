@@ -0,0 +1,225 @@
+from tools.channel import snapshot_to_dict
+from tools.logger import Logger, Type
+from global_consts import Config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from datetime import datetime
+import json
+import threading
+
+########################################
+# Constants
+########################################
+CLIENT_QUEUE_SIZE = 256     # Transitions held for a client before the oldest are dropped
+SEND_TIMEOUT = 10           # s a client may stall a write before it is disconnected
+KEEPALIVE_TIME = 15         # s between comments on an idle event stream
+# Snapshot fields whose changes are published as transitions
+TRANSITION_FIELDS = ('connected', 'awaiting_sn', 'action', 'state', 'warning', 'done')
+
+###########################################
+# Subscription Class
+# Responsible for:
+#   - Buffering what is published for one client until it reads it
+#   - Keeping slow clients from growing the buffer: only the newest
+#     snapshot of each channel is kept, and the oldest transitions are
+#     dropped once CLIENT_QUEUE_SIZE are waiting
+###########################################
+class Subscription:
+    def __init__(self, snapshots):
+        self.cond = threading.Condition()
+        self.snapshots = {s.index: s for s in snapshots}    # Channel -> newest snapshot not yet read
+        self.transitions = deque()
+        self.dropped = 0            # Transitions dropped since the client last read
+        self.closed = False
+
+    def offer(self, snapshot, transitions):
+        with self.cond:
+            self.snapshots[snapshot.index] = snapshot
+            self.transitions.extend(transitions)
+            while len(self.transitions) > CLIENT_QUEUE_SIZE:
+                self.transitions.popleft()
+                self.dropped += 1
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    # Wait for something to send, returns a list of (event, data), empty on timeout
+    # or None once closed
+    def get(self, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed or self.snapshots or self.transitions or self.dropped, timeout)
+            if self.closed:
+                return None
+            events = []
+            if self.dropped:
+                events.append(('dropped', {'transitions': self.dropped}))
+            events += [('transition', t) for t in self.transitions]
+            events += [('snapshot', snapshot_to_dict(s)) for s in self.snapshots.values()]
+            self.snapshots = {}
+            self.transitions.clear()
+            self.dropped = 0
+            return events
+
+
+###########################################
+# TelemetryPublisher Class
+# Responsible for:
+#   - Holding the latest snapshot of every channel, published by whichever
+#     loop updates the channels, so clients never cause bus reads
+#   - Turning snapshot changes into state transition events
+#   - Fanning both out to every subscription
+###########################################
+class TelemetryPublisher:
+    telemetry_publisher = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {}            # Channel -> latest snapshot
+        self.subscriptions = []
+
+    # Thread safe and never blocks on clients
+    def publish(self, snapshots):
+        with self.lock:
+            for snapshot in snapshots:
+                previous = self.latest.get(snapshot.index)
+                if previous == snapshot:
+                    continue
+                self.latest[snapshot.index] = snapshot
+                transitions = TelemetryPublisher._transitions(previous, snapshot)
+                for subscription in self.subscriptions:
+                    subscription.offer(snapshot, transitions)
+
+    # New subscriptions start with the latest snapshot of every channel
+    def subscribe(self):
+        with self.lock:
+            subscription = Subscription(self.latest.values())
+            self.subscriptions.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+        subscription.close()
+
+    # End every client's stream
+    def unsubscribe_all(self):
+        with self.lock:
+            subscriptions = self.subscriptions
+            self.subscriptions = []
+        for subscription in subscriptions:
+            subscription.close()
+
+    def snapshots(self):
+        with self.lock:
+            return [self.latest[i] for i in sorted(self.latest)]
+
+    @staticmethod
+    def _transitions(previous, snapshot):
+        if previous is None:
+            return []
+        time = datetime.now().isoformat(timespec='seconds')
+        old = snapshot_to_dict(previous)
+        new = snapshot_to_dict(snapshot)
+        return [{'index': snapshot.index, 'serial_num': new['serial_num'] or old['serial_num'],
+                 'field': field, 'from': old[field], 'to': new[field], 'time': time}
+                for field in TRANSITION_FIELDS if old[field] != new[field]]
+
+    @staticmethod
+    def get_publisher():
+        if TelemetryPublisher.telemetry_publisher == None:
+            TelemetryPublisher.telemetry_publisher = TelemetryPublisher()
+        return TelemetryPublisher.telemetry_publisher
+
+
+###########################################
+# TelemetryServer Class
+# Responsible for:
+#   - Serving the publisher over HTTP from a background thread
+#       GET /snapshots  latest snapshot of every channel, as JSON
+#       GET /events     Server-Sent Events: snapshot, transition and
+#                       dropped (transitions lost by a slow client)
+###########################################
+class TelemetryServer:
+    def __init__(self, host=None, port=None):
+        self.host = host if host is not None else Config.config[Config.TELEMETRY_HOST_KEY]
+        self.port = port if port is not None else Config.config[Config.TELEMETRY_PORT_KEY]
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), _TelemetryHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.publisher = TelemetryPublisher.get_publisher()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="Telemetry server", daemon=True)
+        self.thread.start()
+        Logger.get_sys_logger().log(Type.GENERAL, f"Telemetry server listening on {self.host}:{self.httpd.server_port}")
+
+    def stop(self):
+        if self.httpd is None:
+            return
+        self.httpd.publisher.unsubscribe_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+
+    # Start the server if a port is configured, returns None otherwise
+    @staticmethod
+    def start_configured():
+        if not Config.config[Config.TELEMETRY_PORT_KEY]:
+            return None
+        server = TelemetryServer()
+        try:
+            server.start()
+        except OSError as e:
+            Logger.get_sys_logger().log(Type.ERROR, f"Could not start telemetry server: {e}")
+            return None
+        return server
+
+
+class _TelemetryHandler(BaseHTTPRequestHandler):
+    timeout = SEND_TIMEOUT
+
+    def do_GET(self):
+        if self.path == '/snapshots':
+            body = json.dumps([snapshot_to_dict(s) for s in self.server.publisher.snapshots()]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/events':
+            self._stream_events()
+        else:
+            self.send_error(404)
+
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = True
+
+        subscription = self.server.publisher.subscribe()
+        try:
+            while True:
+                events = subscription.get(KEEPALIVE_TIME)
+                if events is None:
+                    break
+                if not events:
+                    self.wfile.write(b": keepalive\n\n")
+                for event, data in events:
+                    self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+        except OSError:
+            # Disconnected, or stalled longer than SEND_TIMEOUT
+            pass
+        finally:
+            self.server.publisher.unsubscribe(subscription)
+
+    # Requests are not worth a line in the system log
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,217 @@
+from global_consts import Consts, Config
+import fcntl
+import os
+import tempfile
+import threading
+import time
+
+########################################
+# Constants
+########################################
+MUX_ADDRESSES = range(0x70, 0x78)   # Addresses a TCA9548 can be strapped to
+MUX_CHANNELS = 8
+MUX_SETTLE_TIME = 0.01              # s after switching the mux before talking to the LTC
+
+# Config keys of a channel
+BUS_KEY = 'bus'
+MUX_ADDRESS_KEY = 'mux_address'
+MUX_CHANNEL_KEY = 'mux_channel'
+CHARGE_PIN_KEY = 'charge_pin'
+DISCHARGE_PIN_KEY = 'discharge_pin'
+LED_PIN_KEY = 'led_pin'
+
+###########################################
+# Channel Class
+# Responsible for:
+#   - Holding where a battery channel sits on the I2C buses and GPIO pins
+#   - Routing its bus to the channel's LTC2944 through the TCA9548 muxes
+###########################################
+class Channel:
+    # Mux currently routed on each bus: bus -> (mux address, mux channel)
+    selected = {}
+    bus_locks = {}
+    locks_lock = threading.Lock()
+
+    def __init__(self, index, bus, mux_address, mux_channel, charge_pin, discharge_pin, led_pin):
+        if mux_address not in MUX_ADDRESSES:
+            raise ValueError(f"Channel {index}: mux address {hex(mux_address)} is not a TCA9548 address")
+        if not 0 <= mux_channel < MUX_CHANNELS:
+            raise ValueError(f"Channel {index}: mux channel {mux_channel} out of range")
+        self.index = index
+        self.bus = bus
+        self.mux_address = mux_address
+        self.mux_channel = mux_channel
+        self.charge_pin = charge_pin
+        self.discharge_pin = discharge_pin
+        self.led_pin = led_pin
+
+    def __repr__(self):
+        return f"Channel {self.index} (bus {self.bus}, mux {hex(self.mux_address)}:{self.mux_channel})"
+
+    # Lock held around a mux selection and the transactions that follow it
+    def lock(self):
+        return Channel.bus_lock(self.bus)
+
+    # Route the bus to this channel. Must be called with the bus lock held
+    # Every mux on a bus shares the LTC address, so the previously used mux
+    # (or every other mux, if that is unknown) is switched off first
+    # Nothing is written if the channel is already routed
+    def select(self, smbus):
+        route = (self.mux_address, self.mux_channel)
+        previous = Channel.selected.get(self.bus)
+        if previous == route:
+            return
+        try:
+            Channel.selected.pop(self.bus, None)
+            others = [previous[0]] if previous is not None else _bus_muxes(self.bus)
+            for mux_address in others:
+                if mux_address != self.mux_address:
+                    smbus.write_byte(mux_address, 0)
+            smbus.write_byte(self.mux_address, 1 << self.mux_channel)
+        except:
+            # The mux state is unknown after a failed write
+            Channel.deselect_all(self.bus)
+            raise
+        Channel.selected[self.bus] = route
+        time.sleep(MUX_SETTLE_TIME)
+
+    # Forget the routing of a bus, so the next selection rewrites the mux
+    @staticmethod
+    def deselect_all(bus):
+        Channel.selected.pop(bus, None)
+
+    # Use bus locks and routes shared with other processes driving the same buses
+    @staticmethod
+    def share_buses(bus_locks, routes):
+        with Channel.locks_lock:
+            Channel.bus_locks = bus_locks
+            Channel.selected = routes
+
+    @staticmethod
+    def bus_lock(bus):
+        with Channel.locks_lock:
+            if bus not in Channel.bus_locks:
+                Channel.bus_locks[bus] = threading.RLock()
+            return Channel.bus_locks[bus]
+
+
+###########################################
+# ProcessBusLock Class
+# Responsible for:
+#   - Locking a bus across processes with flock on a lock file, which the
+#     OS releases if the process holding it dies
+#   - Staying reentrant within a process, like the threading.RLock it replaces
+###########################################
+class ProcessBusLock:
+    def __init__(self, bus):
+        self.bus = bus
+        self.path = os.path.join(tempfile.gettempdir(), f"battery_station_bus{bus}.lock")
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    # Each process opens its own lock file descriptor
+    def __reduce__(self):
+        return (ProcessBusLock, (self.bus,))
+
+    def acquire(self):
+        self.lock.acquire()
+        try:
+            if self.depth == 0:
+                if self.fd is None:
+                    self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+        except:
+            self.lock.release()
+            raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+###########################################
+# SharedRoutes Class
+# Responsible for:
+#   - Holding the mux route of each bus in shared memory, in place of
+#     Channel.selected, when channels run in separate processes
+###########################################
+class SharedRoutes:
+    UNKNOWN = -1
+
+    def __init__(self, ctx, buses):
+        # Only read and written with the bus lock held
+        self.routes = {bus: ctx.Value('i', SharedRoutes.UNKNOWN, lock=False) for bus in buses}
+
+    def get(self, bus, default=None):
+        value = self.routes[bus].value
+        return default if value == SharedRoutes.UNKNOWN else (value >> 8, value & 0xFF)
+
+    def pop(self, bus, default=None):
+        route = self.get(bus, default)
+        self.routes[bus].value = SharedRoutes.UNKNOWN
+        return route
+
+    def __setitem__(self, bus, route):
+        self.routes[bus].value = route[0] << 8 | route[1]
+
+
+###########################################
+# Topology functions
+# Responsible for:
+#   - Building the station's channels from the config
+###########################################
+channels = None
+
+# The channels configured for this station, in display order
+def get_channels():
+    global channels
+    if channels is None:
+        channels = [_parse_channel(i, c) for i, c in enumerate(Config.config[Config.CHANNELS_KEY])]
+        _check_unique(channels)
+    return channels
+
+def get_channel(index):
+    return get_channels()[index]
+
+def get_buses():
+    return sorted({c.bus for c in get_channels()})
+
+def _bus_muxes(bus):
+    return sorted({c.mux_address for c in get_channels() if c.bus == bus})
+
+def _parse_channel(index, config):
+    # Addresses can be written as hex strings in config.json
+    mux_address = config.get(MUX_ADDRESS_KEY, Consts.TCA_I2C_ADDRESS)
+    if isinstance(mux_address, str):
+        mux_address = int(mux_address, 0)
+    return Channel(index,
+                   config.get(BUS_KEY, Consts.BUS),
+                   mux_address,
+                   config[MUX_CHANNEL_KEY],
+                   config[CHARGE_PIN_KEY],
+                   config[DISCHARGE_PIN_KEY],
+                   config[LED_PIN_KEY])
+
+def _check_unique(channels):
+    routes = set()
+    pins = set()
+    for channel in channels:
+        route = (channel.bus, channel.mux_address, channel.mux_channel)
+        if route in routes:
+            raise ValueError(f"{channel}: more than one channel uses this mux output")
+        routes.add(route)
+        for pin in (channel.charge_pin, channel.discharge_pin, channel.led_pin):
+            if pin in pins:
+                raise ValueError(f"{channel}: pin {pin} is used by more than one channel")
+            pins.add(pin)
@@ -0,0 +1,208 @@
+from tools.telemetry_server import TelemetryPublisher
+from tools.logger import Logger, Type
+from tools.metrics import Metrics
+from global_consts import Config
+from datetime import datetime
+import json
+import os
+import socket
+import sqlite3
+import threading
+import traceback
+import urllib.request
+import uuid
+
+########################################
+# Constants
+########################################
+UPLINK_INTERVAL = 10        # s between batches sent to the collector
+BATCH_SIZE = 500            # Records per batch
+MAX_BACKOFF = 300           # s between attempts while the collector is unreachable
+SEND_TIMEOUT = 30           # s to wait for the collector to take a batch
+SPOOL_MAX_RECORDS = 200000  # Telemetry beyond this is dropped oldest first, results never are
+
+# Record kinds
+TELEMETRY = 'telemetry'     # Channel snapshot, at most one per channel per UPLINK_INTERVAL
+TRANSITION = 'transition'   # Channel state transition
+SESSION = 'session'         # Battery session started, as in the fleet index
+CAPACITY = 'capacity'       # Capacity test result, as in the fleet index
+
+SPOOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key     TEXT PRIMARY KEY,
+    value   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spool (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind        TEXT NOT NULL,
+    time        TEXT NOT NULL,
+    data        TEXT NOT NULL
+);
+"""
+
+###########################################
+# UplinkSpool Class
+# Responsible for:
+#   - Keeping records for the collector on disk until it has them, so
+#     they survive network outages and restarts
+#   - Taking records from any thread or channel process
+###########################################
+class UplinkSpool:
+    uplink_spool = None
+
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        # Channel processes append to the same file
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript(SPOOL_SCHEMA)
+            # Identifies this spool's record ids, they start over if the file is lost
+            self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('spool_id', ?)", (uuid.uuid4().hex,))
+            self.spool_id = self.conn.execute("SELECT value FROM meta WHERE key = 'spool_id'").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, kind, data):
+        try:
+            with self.lock, self.conn:
+                self.conn.execute("INSERT INTO spool (kind, time, data) VALUES (?, ?, ?)",
+                                  (kind, datetime.now().isoformat(), json.dumps(data)))
+        except:
+            print(f"ERROR SPOOLING {kind.upper()}: {traceback.format_exc()}")
+
+    # Oldest records first, as dicts ready to send
+    def peek(self, limit):
+        with self.lock:
+            rows = self.conn.execute("SELECT id, kind, time, data FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [{'id': id, 'kind': kind, 'time': time, 'data': json.loads(data)} for id, kind, time, data in rows]
+
+    # Forget records the collector acknowledged
+    def remove_until(self, last_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+
+    # Drop the oldest telemetry once the spool is full, returns how many were dropped
+    def trim(self):
+        with self.lock, self.conn:
+            excess = self.conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0] - SPOOL_MAX_RECORDS
+            if excess <= 0:
+                return 0
+            return self.conn.execute("DELETE FROM spool WHERE id IN (SELECT id FROM spool WHERE kind = ? ORDER BY id LIMIT ?)",
+                                     (TELEMETRY, excess)).rowcount
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    # Spool a record if a collector is configured
+    @staticmethod
+    def record(kind, data):
+        if Config.config[Config.COLLECTOR_URL_KEY]:
+            UplinkSpool.get_spool().add(kind, data)
+
+    @staticmethod
+    def get_spool():
+        if UplinkSpool.uplink_spool == None:
+            UplinkSpool.uplink_spool = UplinkSpool(Config.config[Config.UPLINK_SPOOL_KEY])
+        return UplinkSpool.uplink_spool
+
+
+###########################################
+# StationUplink Class
+# Responsible for:
+#   - Sampling the station's telemetry into the spool every UPLINK_INTERVAL
+#   - Sending the spool to the collector in batches from another thread,
+#     backing off while it is unreachable, so sampling never waits on it
+###########################################
+class StationUplink:
+    def __init__(self, url=None, station_id=None):
+        self.url = (url if url is not None else Config.config[Config.COLLECTOR_URL_KEY]).rstrip('/') + '/ingest'
+        self.station_id = station_id or Config.config[Config.STATION_ID_KEY] or socket.gethostname()
+        self.spool = UplinkSpool.get_spool()
+        self.subscription = TelemetryPublisher.get_publisher().subscribe()
+        self.stopped = threading.Event()
+        self.connected = None
+        self.thread = threading.Thread(target=self._run, name="Uplink", daemon=True)
+        self.sampler = threading.Thread(target=self._run_sampler, name="Uplink sampler", daemon=True)
+
+    def start(self):
+        self.sampler.start()
+        self.thread.start()
+        Metrics.get_metrics().add_callback('uplink_spool_records', 'gauge', self.spool.__len__)
+        Logger.get_sys_logger().log(Type.GENERAL, f"Sending station {self.station_id} data to {self.url}")
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+        self.thread.join()
+        TelemetryPublisher.get_publisher().unsubscribe(self.subscription)
+
+    def _run_sampler(self):
+        while not self.stopped.wait(UPLINK_INTERVAL):
+            try:
+                self._sample()
+                dropped = self.spool.trim()
+                if dropped:
+                    Logger.get_sys_logger().log(Type.ERROR, f"Uplink spool full, dropped {dropped} telemetry records")
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR IN UPLINK SAMPLER: {traceback.format_exc()}")
+
+    def _run(self):
+        backoff = UPLINK_INTERVAL
+        while not self.stopped.wait(backoff):
+            try:
+                self._send()
+                backoff = UPLINK_INTERVAL
+                self._set_connected(True)
+            except (OSError, ValueError) as e:
+                backoff = min(2 * backoff, MAX_BACKOFF)
+                self._set_connected(False, e)
+            except Exception:
+                Logger.get_sys_logger().log(Type.ERROR, f"ERROR IN UPLINK: {traceback.format_exc()}")
+
+    # Spool what the publisher got since the last sample, newest snapshot of each channel only
+    def _sample(self):
+        events = self.subscription.get(0)
+        for event, data in events or []:
+            if event == 'snapshot':
+                self.spool.add(TELEMETRY, data)
+            elif event == 'transition':
+                self.spool.add(TRANSITION, data)
+            elif event == 'dropped':
+                Logger.get_sys_logger().log(Type.ERROR, f"Uplink fell behind, {data['transitions']} transitions were not spooled")
+
+    # Send the whole spool, a batch at a time
+    # Raises OSError or ValueError if the collector does not take a batch
+    def _send(self):
+        while not self.stopped.is_set():
+            records = self.spool.peek(BATCH_SIZE)
+            if not records:
+                return
+            body = json.dumps({'station': self.station_id, 'spool_id': self.spool.spool_id, 'records': records}).encode()
+            request = urllib.request.Request(self.url, body, {'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=SEND_TIMEOUT) as response:
+                answer = json.loads(response.read())
+            if not answer.get('ok'):
+                raise ValueError(answer.get('error', "Collector refused the batch"))
+            self.spool.remove_until(answer['last_id'])
+
+    def _set_connected(self, connected, error=None):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            Logger.get_sys_logger().log(Type.GENERAL, f"Collector reachable at {self.url}")
+        else:
+            Logger.get_sys_logger().log(Type.ERROR, f"Collector unreachable, spooling: {error}")
+
+    # Start the uplink if a collector is configured, returns None otherwise
+    @staticmethod
+    def start_configured():
+        if not Config.config[Config.COLLECTOR_URL_KEY]:
+            return None
+        uplink = StationUplink()
+        uplink.start()
+        return uplink
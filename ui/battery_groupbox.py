@@ -1,27 +1,15 @@
-from tools.battery import Battery, Action
-from smbus2 import SMBus
+from tools.battery import Action
+from tools.channel import ChannelController, check_serial_num
+from tools.enrollment import EnrollmentQueue
+from tools.telemetry_server import TelemetryPublisher
 from tools.logger import Logger, Type, State, Warning
 from ui.plot_window import PlotWindow
 from PyQt5.QtWidgets import * 
 from PyQt5.QtGui import * 
 from PyQt5.QtCore import * 
-from global_consts import Consts, Config
+from global_consts import Config
 import datetime
 import time
-import string
-
-########################################
-# Global Variables & Constants
-########################################
-
-BATT_CHARGE_PINS = [21, 23, 24]
-BATT_DISCHARGE_PINS = [22, 26, 27]
-
-LED_PINS = [12, 13, 14]
-
-TCA_RESET_PIN = 6
-
-SAFE_FILE_CHARS = set(string.ascii_letters + string.digits + '~-_.')
 
 ########################################
 # Update Thread Subclass
@@ -48,15 +36,24 @@ class BattUpdateThread(QThread):
 # Battery Group Box Subclass
 ########################################
 class BatteryGroupBox(QGroupBox):
+        presence_changed = pyqtSignal()
  
         def __init__(self, parent = None):
                 QGroupBox.__init__(self, parent)
-                self.battery = None
+                self.controller = None
                 self.battery_connected = False
 
+        @property
+        def battery(self):
+                return self.controller.battery if self.controller is not None else None
+
         def init_components(self, idx):
                 self.idx = idx
                 self.display_idx = idx + 1
+                self.controller = ChannelController(idx)
+                # Handle batteries being connected or removed right away, not on the next tick
+                self.controller.scanner.subscribe(self.on_presence_event)
+                self.presence_changed.connect(self.on_presence_changed)
 
                 vbox = QVBoxLayout()
                 self.setLayout(vbox)
@@ -93,6 +90,7 @@ class BatteryGroupBox(QGroupBox):
                 self.discharge_full_butt = QPushButton("Discharge Full")
                 self.charge_partial_butt = QPushButton("Charge Partial")
                 self.discharge_partial_butt = QPushButton("Discharge Partial")
+                self.recondition_butt = QPushButton("Recondition")
 
                 self.cap_test_butt.clicked.connect(self.on_run_cap_test_action)
                 self.rest_butt.clicked.connect(self.on_rest_action)
@@ -100,6 +98,7 @@ class BatteryGroupBox(QGroupBox):
                 self.discharge_full_butt.clicked.connect(self.on_discharge_full_action)
                 self.charge_partial_butt.clicked.connect(self.on_charge_partial_action)
                 self.discharge_partial_butt.clicked.connect(self.on_discharge_partial_action)
+                self.recondition_butt.clicked.connect(self.on_recondition_action)
 
                 # Allow buttons to stretch when window size is changed
                 self.cap_test_butt.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
@@ -108,6 +107,7 @@ class BatteryGroupBox(QGroupBox):
                 self.discharge_full_butt.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
                 self.charge_partial_butt.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
                 self.discharge_partial_butt.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
+                self.recondition_butt.setSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding)
                 grid.setRowMinimumHeight(0, 50)         # Increase height of Capacity Test button
 
                 advanced_txt_label= QLabel("Advanced")
@@ -118,6 +118,7 @@ class BatteryGroupBox(QGroupBox):
                 grid.addWidget(self.discharge_full_butt, 5, 0)
                 grid.addWidget(self.charge_partial_butt, 4, 1)
                 grid.addWidget(self.discharge_partial_butt, 5, 1)
+                grid.addWidget(self.recondition_butt, 6, 0, 1, 2)
                 
                 vbox.addWidget(butt_widget)
 
@@ -161,7 +162,7 @@ class BatteryGroupBox(QGroupBox):
                 # Ensure battery is connected
                 if self.show_not_connected_error():
                         return
-                self.battery.set_action(Action.CAPACITY_TEST)
+                self.battery.queue_capacity_test()
                 self.update_all()
 
 
@@ -197,6 +198,14 @@ class BatteryGroupBox(QGroupBox):
                 self.update_all()
 
 
+        def on_recondition_action(self):
+                # Ensure battery is connected
+                if self.show_not_connected_error():
+                        return
+                self.battery.set_action(Action.RECONDITION)
+                self.update_all()
+
+
         def check_connection(self):
                connected = self.check_i2c_connection()
                self.show_info(f"Battery {self.display_idx} Connected" if connected else f"Battery {self.display_idx} Not Connected")
@@ -205,11 +214,9 @@ class BatteryGroupBox(QGroupBox):
         def get_sn(self):
                 old_sn = self.battery.serial_num if self.battery_connected else ""
                 sn, status = QInputDialog.getText(self, f"Battery {self.display_idx}: Input SN", f"Enter SN for Battery {self.display_idx}:", text=old_sn)
-                if status and not sn:
-                        self.show_error("Serial number cannot be empty!")
-                        status = False
-                elif status and not set(sn) <= SAFE_FILE_CHARS:
-                        self.show_error(f"Serial number must only consist of letters, numbers, and following characters: '~-_.'")
+                error = check_serial_num(sn)
+                if status and error:
+                        self.show_error(error)
                         status = False
                 return sn, status 
 
@@ -252,7 +259,11 @@ class BatteryGroupBox(QGroupBox):
                         return
 
                 self.plot_window = PlotWindow()
-                x, y, charge_times, discharge_times, rest_times = self.battery.logger.get_data(type)
+                # The ring is read without reparsing the log, unless the session started before it
+                if self.controller.ring.covers_session():
+                        x, y, charge_times, discharge_times, rest_times = self.controller.ring.get_data(type)
+                else:
+                        x, y, charge_times, discharge_times, rest_times = self.battery.logger.get_data(type)
                 self.plot_window.set_battery_data(x, y, charge_times, discharge_times, rest_times, type, self.battery.serial_num)
                 self.plot_window.show()
 
@@ -261,9 +272,9 @@ class BatteryGroupBox(QGroupBox):
                 qApp.quit()
 
         def cleanup(self):
+                self.controller.scanner.unsubscribe(self.on_presence_event)
                 self.update_thread.terminate()
-                if self.battery_connected:
-                        self.battery.cleanup()
+                self.controller.cleanup()
 
         def update_button_event(self):
                 self.update_all()
@@ -274,12 +285,23 @@ class BatteryGroupBox(QGroupBox):
 
                 self.update_battery_object()
                 if self.battery_connected:
-                        self.battery.update()
+                        self.controller.update()
                 self.update_button_states()
                 self.update_labels()
+                TelemetryPublisher.get_publisher().publish([self.controller.snapshot()])
 
                 self.update_thread.resume()
 
+        # Called from the presence scanner thread
+        def on_presence_event(self, channel, present):
+                if channel == self.idx:
+                        self.presence_changed.emit()
+
+        def on_presence_changed(self):
+                # Updates only start once the main window starts the update threads
+                if not self.update_thread.paused:
+                        self.update_all()
+
         # Check if battery is connected or not 
         # and create/destroy battery object accordingly
         def update_battery_object(self):
@@ -287,25 +309,33 @@ class BatteryGroupBox(QGroupBox):
                 batt_connected = self.check_i2c_connection()
                 batt_exists = self.battery is not None
                 if batt_connected and not batt_exists:  
-                    self.on_battery_connection()        # New battery detected: Prompt for SN and create battery object
-                elif not batt_connected and batt_exists:   
-                    self.on_battery_disconnection()     # Battery disconnected: Delete battery object 
+                    self.on_battery_connection()        # New battery detected: Wait for its SN in the enrollment panel
+                elif not batt_connected:
+                    EnrollmentQueue.get_queue().remove(self.idx)
+                    if batt_exists:
+                        self.on_battery_disconnection() # Battery disconnected: Delete battery object
 
+        # The SN is entered in the enrollment panel, so the other channels keep updating meanwhile
         def on_battery_connection(self):
-                Logger.get_sys_logger().log(Type.GENERAL, f"Battery connected at channel {self.idx}")
-                sn, status = self.get_sn()
+                if EnrollmentQueue.get_queue().add(self.idx):
+                        Logger.get_sys_logger().log(Type.GENERAL, f"Battery connected at channel {self.idx}")
+
+        # Create the battery object once its SN is entered
+        def enroll(self, sn):
+                EnrollmentQueue.get_queue().remove(self.idx)
+                if self.battery_connected:
+                        return
                 # Ensure battery did not disconnect while SN is typed in
-                if status and self.check_i2c_connection():
+                if self.check_i2c_connection():
                         self.create_battery_object(sn)
                         self.battery_connected = True
                 else:
                         Logger.get_sys_logger().log(Type.GENERAL, f"Battery disconnected at channel {self.idx}")
+                self.update_all()
 
         def on_battery_disconnection(self):
-                Logger.get_sys_logger().log(Type.GENERAL, f"Battery disconnected at channel {self.idx}")
                 self.battery_connected = False
-                self.battery.cleanup()
-                self.battery = None
+                self.controller.disconnect()
 
         def update_button_states(self):
                 self.rest_butt.setEnabled(self.battery_connected)
@@ -319,10 +349,22 @@ class BatteryGroupBox(QGroupBox):
                 if self.battery_connected and self.battery.run_capacity_test:
                         cap_test_butt_text = "Running Capacity Test..."
                         cap_test_enabled = False
+                elif self.battery_connected and self.battery.queued:
+                        cap_test_butt_text = f"Queued for Capacity Test ({self.battery.queue_position()})..."
+                        cap_test_enabled = False
                         
                 self.cap_test_butt.setText(cap_test_butt_text)
                 self.cap_test_butt.setEnabled(cap_test_enabled)
 
+                recondition_butt_text = "Recondition"
+                recondition_enabled = self.battery_connected
+                if self.battery_connected and self.battery.run_recondition:
+                        recondition_butt_text = "Reconditioning..."
+                        recondition_enabled = False
+
+                self.recondition_butt.setText(recondition_butt_text)
+                self.recondition_butt.setEnabled(recondition_enabled)
+
         def update_labels(self):
                 INVALID = -1
                 UNKNOWN = "Unknown"
@@ -338,13 +380,14 @@ class BatteryGroupBox(QGroupBox):
                         capacity = self.battery.capacity
 
                         # Update the info labels                
-                        status_col = self.set_info_label(status, self.battery.time_since_last_action())
+                        status_col = self.set_info_label(status, self.battery.time_since_last_action(), self.battery.eta)
                         self.set_warning_label(self.battery.warning)
 
-                        self.set_done_label(self.battery.cap_test_done, self.battery.report_folder)
+                        self.set_done_label(self.battery.cap_test_done or self.battery.recondition_done, self.battery.report_folder,
+                                            "Reconditioning done!" if self.battery.recondition_done else "Capacity test done!")
                 else:
                         sn = "---"
-                        status = "NOT CONNECTED"
+                        status = "AWAITING SN" if self.idx in EnrollmentQueue.get_queue() else "NOT CONNECTED"
                         action = "---"
                         voltage = "---"
                         charge = "---"
@@ -361,18 +404,25 @@ class BatteryGroupBox(QGroupBox):
                 self.charge_label.setText(f"Charge: {UNKNOWN}" if charge is INVALID else f"Charge: {charge} mAH")
                 self.capacity_label.setText(f"Capacity: {UNKNOWN}" if capacity is INVALID else f"Capacity: {capacity} mAH")
 
-        def set_info_label(self, state, last_action_time):
+        def set_info_label(self, state, last_action_time, eta):
                 status_col = "black"
+                lines = []
                 if state == State.CHARGING:
                         status_col = "green"
-                        self.info_label.setText(f"Charge Time: {datetime.timedelta(seconds=last_action_time)}")
-                        self.info_label.setVisible(True)
+                        lines.append(f"Charge Time: {datetime.timedelta(seconds=last_action_time)}")
                 elif state == State.DISCHARGING:
                         status_col = "orange"
-                        self.info_label.setText(f"Discharge Time: {datetime.timedelta(seconds=last_action_time)}")
-                        self.info_label.setVisible(True)
-                else:
-                        self.info_label.setVisible(False)
+                        lines.append(f"Discharge Time: {datetime.timedelta(seconds=last_action_time)}")
+
+                phase_eta = eta.phase_eta()
+                test_eta = eta.test_eta()
+                if lines and phase_eta is not None:
+                        lines.append(f"Phase Done: ~{phase_eta:%H:%M}")
+                if test_eta is not None:
+                        lines.append(f"Test Done: ~{test_eta:%a %H:%M}")
+
+                self.info_label.setText("<br>".join(lines))
+                self.info_label.setVisible(bool(lines))
                 return status_col
 
         def set_warning_label(self, warning):
@@ -382,33 +432,20 @@ class BatteryGroupBox(QGroupBox):
                 else:
                         self.warning_label.setVisible(False)
 
-        def set_done_label(self, visible, link):
+        def set_done_label(self, visible, link, text="Capacity test done!"):
                 if visible:
-                        self.done_label.setText(f"<font color='green'>Capacity test done!</font> <a href={link}>View Report</a>")
+                        self.done_label.setText(f"<font color='green'>{text}</font> <a href={link}>View Report</a>")
                         self.done_label.setVisible(True)
                 else:
                         self.done_label.setVisible(False)
 
-        # Check if I2C channel is connected to a device1
+        # Check if I2C channel is connected to a device
         def check_i2c_connection(self):
-                try:
-                        with SMBus(Consts.BUS) as bus:
-                                bus.write_byte(Consts.TCA_I2C_ADDRESS, 1 << self.idx)
-                                time.sleep(0.1)
-                                # This will return an error if the i2c address is not connected
-                                bus.read_byte_data(Consts.LTC_I2C_ADDRESS, 0)    
-                                return True
-                except Exception:
-                        return False
+                return self.controller.is_present()
 
         # Create the battery object
         def create_battery_object(self, sn):
-                self.battery = Battery(sn, 
-                                        BATT_CHARGE_PINS[self.idx], 
-                                        BATT_DISCHARGE_PINS[self.idx],
-                                        LED_PINS[self.idx],
-                                        self.idx)
-                Logger.get_sys_logger().log(Type.GENERAL, f"Battery object created with SN={sn}")
+                self.controller.connect(sn)
 
         def show_not_connected_error(self):
                 if not self.battery_connected:
@@ -451,6 +488,9 @@ class BatteryGroupBox(QGroupBox):
                 if self.battery_connected and self.battery.run_capacity_test:
                         cap_test_butt_text = "Running Capacity Test..."
                         cap_test_enabled = False
+                elif self.battery_connected and self.battery.queued:
+                        cap_test_butt_text = f"Queued for Capacity Test ({self.battery.queue_position()})..."
+                        cap_test_enabled = False
 
                 actions_submenu = menu.addMenu("&Actions")
                 cap_test_action = actions_submenu.addAction(cap_test_butt_text)
@@ -462,6 +502,8 @@ class BatteryGroupBox(QGroupBox):
                 actions_submenu.addSeparator()
                 discharge_full_action = actions_submenu.addAction("&Discharge Full")
                 discharge_partial_action = actions_submenu.addAction("&Discharge Partial")
+                actions_submenu.addSeparator()
+                recondition_action = actions_submenu.addAction("R&econdition")
 
                 rest_action.triggered.connect(self.on_rest_action)
                 cap_test_action.triggered.connect(self.on_run_cap_test_action)
@@ -469,9 +511,11 @@ class BatteryGroupBox(QGroupBox):
                 charge_partial_action.triggered.connect(self.on_charge_partial_action)
                 discharge_full_action.triggered.connect(self.on_discharge_full_action)
                 discharge_partial_action.triggered.connect(self.on_discharge_partial_action)
+                recondition_action.triggered.connect(self.on_recondition_action)
 
                 actions_submenu.setEnabled(self.battery_connected)
                 cap_test_action.setEnabled(cap_test_enabled)
+                recondition_action.setEnabled(self.battery_connected and not self.battery.run_recondition)
 
                 ################ Log Actions Submenu ################
                 log_submenu = menu.addMenu("&Logs")
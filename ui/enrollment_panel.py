@@ -0,0 +1,104 @@
+from tools.enrollment import EnrollmentQueue
+from tools.channel import check_serial_num
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+import datetime
+
+########################################
+# Global Variables & Constants
+########################################
+REFRESH_TIME = 250      # ms between checks of the enrollment queue
+
+########################################
+# Enrollment Panel Subclass
+# Lists the batteries waiting for a SN, without blocking the update loop
+########################################
+class EnrollmentPanel(QGroupBox):
+        enroll_requested = pyqtSignal(int, str)
+
+        def __init__(self, parent=None):
+                super().__init__("Waiting for SN", parent)
+                self.queue = EnrollmentQueue.get_queue()
+                self.version = None
+                self.submitted = set()  # Channels enrolled here that the station has not picked up yet
+
+                self.channel_list = QListWidget()
+                self.channel_list.setMaximumHeight(80)
+                self.channel_list.currentRowChanged.connect(self.on_channel_selected)
+
+                self.sn_edit = QLineEdit()
+                self.sn_edit.setPlaceholderText("Enter or scan SN")
+                self.sn_edit.returnPressed.connect(self.enroll_click)
+                self.enroll_butt = QPushButton("Enroll")
+                self.enroll_butt.clicked.connect(self.enroll_click)
+                self.error_label = QLabel()
+                self.error_label.setStyleSheet("color: red")
+                self.error_label.setVisible(False)
+
+                entry_layout = QHBoxLayout()
+                entry_layout.addWidget(self.sn_edit)
+                entry_layout.addWidget(self.enroll_butt)
+
+                layout = QVBoxLayout()
+                layout.addWidget(self.channel_list)
+                layout.addLayout(entry_layout)
+                layout.addWidget(self.error_label)
+                self.setLayout(layout)
+                self.setVisible(False)
+
+                self.refresh_timer = QTimer(self)
+                self.refresh_timer.timeout.connect(self.refresh)
+                self.refresh_timer.start(REFRESH_TIME)
+
+        # Redraw the list when the queue changed, keeping the selected channel
+        def refresh(self):
+                if self.queue.version == self.version:
+                        return
+                self.version = self.queue.version
+                pending = self.queue.pending()
+                self.submitted &= {channel for channel, detected in pending}
+                pending = [(channel, detected) for channel, detected in pending if channel not in self.submitted]
+
+                selected = self.selected_channel()
+                self.channel_list.blockSignals(True)
+                self.channel_list.clear()
+                for channel, detected in pending:
+                        item = QListWidgetItem(f"Battery {channel + 1} (connected {datetime.datetime.fromtimestamp(detected):%H:%M:%S})")
+                        item.setData(Qt.UserRole, channel)
+                        self.channel_list.addItem(item)
+                channels = [channel for channel, detected in pending]
+                self.channel_list.setCurrentRow(channels.index(selected) if selected in channels else 0)
+                self.channel_list.blockSignals(False)
+
+                was_visible = self.isVisible()
+                self.setVisible(bool(pending))
+                if pending and not was_visible:
+                        self.sn_edit.setFocus()
+
+        def selected_channel(self):
+                item = self.channel_list.currentItem()
+                return item.data(Qt.UserRole) if item is not None else None
+
+        def on_channel_selected(self, row):
+                self.error_label.setVisible(False)
+                self.sn_edit.setFocus()
+
+        # SNs go to the selected battery, the oldest one unless another is picked
+        def enroll_click(self):
+                channel = self.selected_channel()
+                if channel is None:
+                        return
+                sn = self.sn_edit.text().strip()
+                error = check_serial_num(sn)
+                if error:
+                        self.error_label.setText(error)
+                        self.error_label.setVisible(True)
+                        return
+
+                self.error_label.setVisible(False)
+                self.sn_edit.clear()
+                self.submitted.add(channel)
+                self.version = None
+                self.enroll_requested.emit(channel, sn)
+                self.refresh()
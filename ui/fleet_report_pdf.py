@@ -0,0 +1,90 @@
+from ui.report_pdf import PDF
+from datetime import datetime
+
+########################################
+# Constants
+########################################
+ROWS_PER_PAGE = 30
+
+class FleetPDF(PDF):
+    def __init__(self, *args, stats, **kwargs):
+        self.stats = stats
+        super().__init__(*args, data=stats, **kwargs)
+
+    def header(self):
+        self.set_font('Arial', 'I', 11)
+        self.cell(self.WIDTH/2-10, 10, "Fleet Summary", 0, 0, 'L')
+        self.cell(self.WIDTH/2-10, 10, f"{datetime.today().replace(microsecond=0)}", 0, 0, 'R')
+        self.ln(10)
+
+    def add_summary_table(self):
+        self.add_page()
+        self._add_page_title('Battery Fleet Summary Report')
+
+        self.set_font('Arial', '', 12)
+        self.ln()
+        self.cell(self.WIDTH - 20, 10, f"Period: {self.stats['start']} to {self.stats['end']}", 0, align='C')
+        self.ln()
+        self.cell(self.WIDTH - 20, 10, f"Pass Threshold: {self.stats['threshold']} mAh", 0, align='C')
+        self.ln(20)
+
+        # Table caption
+        self.set_font('Arial', 'I', 9)
+        self.cell(self.WIDTH - 20, 10, "Table 1: Capacity test overview", 0, align='C')
+        self.ln()
+
+        rows = [
+            ("Batteries", self.stats['num_batteries']),
+            ("Capacity Tests", self.stats['num_tests']),
+            ("Tests Passed", self.stats['tests_passed']),
+            ("Tests Failed", self.stats['tests_failed']),
+            ("Batteries Passed (latest test)", self.stats['batteries_passed']),
+            ("Batteries Failed (latest test)", self.stats['batteries_failed']),
+            ("Mean Capacity (mAh)", round(self.stats['mean_cap'])),
+            ("Median Capacity (mAh)", round(self.stats['median_cap'])),
+            ("Std. Dev. Capacity (mAh)", round(self.stats['std_cap'])),
+            ("Min Capacity (mAh)", round(self.stats['min_cap'])),
+            ("Max Capacity (mAh)", round(self.stats['max_cap'])),
+            ("Mean Tests per Day", round(self.stats['tests_per_day'].mean(), 1)),
+        ]
+        for label, value in rows:
+            self.cell(25, 6, "", 0, 0)
+            self._set_font(True)
+            self.cell(80, 6, label, 1, 0, 'C')
+            self._set_font(False)
+            self.cell(60, 6, str(value), 1, 0, 'C')
+            self.ln()
+
+    def add_battery_table(self):
+        headers = ["Serial Number", "Tests", "First Capacity", "Latest Capacity", "Change", "Status"]
+        widths = [44, 20, 32, 32, 26, 26]
+        rows = zip(self.stats['batteries'], self.stats['battery_tests'], self.stats['battery_first_cap'],
+                   self.stats['battery_last_cap'], self.stats['battery_passed'])
+
+        for i, (sn, tests, first_cap, last_cap, passed) in enumerate(rows):
+            if i % ROWS_PER_PAGE == 0:
+                self.add_page()
+                self._add_page_title('Per-Battery Results')
+                self.ln(5)
+                self._set_font(True)
+                for j in range(len(headers)):
+                    self.cell(widths[j], 7, headers[j], 1, 0, 'C')
+                self.ln()
+
+            self._set_font(False)
+            self.cell(widths[0], 6, str(sn), 1, 0, 'C')
+            self.cell(widths[1], 6, str(tests), 1, 0, 'C')
+            self.cell(widths[2], 6, str(round(first_cap)), 1, 0, 'C')
+            self.cell(widths[3], 6, str(round(last_cap)), 1, 0, 'C')
+            self.cell(widths[4], 6, f"{round(last_cap - first_cap):+d}", 1, 0, 'C')
+            self.cell(widths[5], 6, "PASS" if passed else "FAIL", 1, 0, 'C')
+            self.ln()
+
+    # Fleet plots are half height, two to a page
+    def add_plots(self, plots):
+        for i in range(0, len(plots), 2):
+            self.add_page()
+            self._add_page_title('Plots')
+            self.image(plots[i], x=15, y=31, w=self.WIDTH - 30)
+            if i + 1 < len(plots):
+                self.image(plots[i + 1], x=15, y=self.HEIGHT / 2 + 11, w=self.WIDTH - 30)
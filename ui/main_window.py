@@ -1,5 +1,12 @@
 from ui.battery_groupbox import BatteryGroupBox
+from ui.station_dashboard import StationDashboard
+from ui.enrollment_panel import EnrollmentPanel
 from ui.settings_window import SettingsWindow
+from tools.scheduler import PowerBudget, TestQueue
+from tools.eta import station_timeline
+from tools.topology import get_channels
+from tools.logger import State
+from global_consts import Config
 from PyQt5.QtWidgets import * 
 from PyQt5.QtGui import * 
 from PyQt5.QtCore import * 
@@ -10,7 +17,10 @@ import time
 ########################################
 # Global Variables & Constants
 ########################################
-NUM_BATTS = 3
+BATTS_PER_ROW = 4
+STATION_STATUS_UPDATE_TIME = 1000  # ms
+TIMELINE_LENGTH = 4                 # Channels listed in the free channel timeline
+TABLE_MIN_CHANNELS = 9              # Stations this large show the table dashboard in 'auto' mode
 
 ########################################
 # Main Window Subclass
@@ -19,23 +29,43 @@ class MainWindow(QMainWindow):
         def __init__(self):
                 super().__init__()
                 self.batt_groupbox = []
+                self.dashboard = None
 
                 top_layout = QVBoxLayout()
-                batts_layout = QHBoxLayout()
                 toolbar_layout = QGridLayout()
                 top_widget = QWidget()
-                batts_widget = QWidget()
                 toolbar_widget = QWidget()
                 
                 top_widget.setLayout(top_layout)
-                batts_widget.setLayout(batts_layout)
                 toolbar_widget.setLayout(toolbar_layout)
 
                 ################ Battery Section ################
-                for i in range(NUM_BATTS):
-                        self.batt_groupbox.append(BatteryGroupBox(f"Battery {i+1}"))
-                        self.batt_groupbox[i].init_components(i)
-                        batts_layout.addWidget(self.batt_groupbox[i])
+                num_channels = len(get_channels())
+                dashboard = Config.config[Config.DASHBOARD_KEY]
+                processes = Config.config[Config.CHANNEL_PROCESSES_KEY]
+                async_engine = Config.config[Config.ASYNC_ENGINE_KEY]
+                if processes or async_engine or dashboard == 'table' or (dashboard == 'auto' and num_channels >= TABLE_MIN_CHANNELS):
+                        # One table row per channel, group boxes stop being readable on large stations
+                        # Channels in worker processes or updated by the async engine are only shown this way
+                        self.dashboard = StationDashboard(num_channels, processes, async_engine)
+                        batts_view = self.dashboard
+                else:
+                        # One group box per configured channel, scrolling once they don't fit
+                        batts_layout = QGridLayout()
+                        batts_widget = QWidget()
+                        batts_widget.setLayout(batts_layout)
+                        for i in range(num_channels):
+                                self.batt_groupbox.append(BatteryGroupBox(f"Battery {i+1}"))
+                                self.batt_groupbox[i].init_components(i)
+                                batts_layout.addWidget(self.batt_groupbox[i], i // BATTS_PER_ROW, i % BATTS_PER_ROW)
+
+                        batts_view = QScrollArea()
+                        batts_view.setWidget(batts_widget)
+                        batts_view.setWidgetResizable(True)
+
+                ################ Enrollment Panel ################
+                self.enrollment_panel = EnrollmentPanel()
+                self.enrollment_panel.enroll_requested.connect(self.enroll)
 
                 ################ Bottom Toolbar ################
                 exit_butt = QPushButton("Exit")
@@ -44,12 +74,22 @@ class MainWindow(QMainWindow):
                 exit_butt.clicked.connect(self.exit_click)
                 restart_butt.clicked.connect(self.restart_click)
 
-                toolbar_layout.addWidget(restart_butt, 0, 0)
-                toolbar_layout.addWidget(exit_butt, 0, 1)
+                self.station_label = QLabel()
+                self.station_label.setAlignment(Qt.AlignCenter)
+
+                toolbar_layout.addWidget(self.station_label, 0, 0, 1, 2)
+                toolbar_layout.addWidget(restart_butt, 1, 0)
+                toolbar_layout.addWidget(exit_butt, 1, 1)
+
+                self.station_timer = QTimer(self)
+                self.station_timer.timeout.connect(self.update_station_label)
+                self.station_timer.start(STATION_STATUS_UPDATE_TIME)
+                self.update_station_label()
 
 
                 ################ Top Layer ################
-                top_layout.addWidget(batts_widget)
+                top_layout.addWidget(batts_view)
+                top_layout.addWidget(self.enrollment_panel)
                 top_layout.addWidget(toolbar_widget)
                 
                 ################ Top Toolbar ################
@@ -72,11 +112,40 @@ class MainWindow(QMainWindow):
                 self.setWindowIcon(QIcon("assets/logo.png"))
                 self.setWindowTitle("Battery Recertification Station")
 
+        # Show the station power use against its budget, the test queue length
+        # and when the next channels become free, so battery swaps can be batched
+        def update_station_label(self):
+                budget = PowerBudget.get_budget()
+                text = []
+                for name, state in (("Charging", State.CHARGING), ("Discharging", State.DISCHARGING)):
+                        in_use, limit = budget.usage(state)
+                        text.append(f"{name}: {in_use} W" + (f" / {limit} W" if limit > 0 else ""))
+                text.append(f"Queued Tests: {len(TestQueue.get_queue())}")
+
+                timeline = station_timeline(self.snapshots())
+                free = [f"Battery {channel + 1} ~{free_at:%H:%M}" for free_at, channel, sn in timeline[:TIMELINE_LENGTH]]
+                self.station_label.setText("    ".join(text) + ("<br>Next Free: " + ", ".join(free) if free else ""))
+
+        def enroll(self, idx, sn):
+                if self.dashboard is not None:
+                        self.dashboard.enroll(idx, sn)
+                else:
+                        self.batt_groupbox[idx].enroll(sn)
+
+        def snapshots(self):
+                if self.dashboard is not None:
+                        return self.dashboard.latest_snapshots
+                return [gb.controller.snapshot() for gb in self.batt_groupbox]
+
         def start_threads(self):
+                if self.dashboard is not None:
+                        self.dashboard.start_threads()
                 for gb in self.batt_groupbox:
                         gb.update_thread.resume()
 
         def cleanup(self):
+                if self.dashboard is not None:
+                        self.dashboard.cleanup()
                 for gb in self.batt_groupbox:
                         gb.cleanup()
 
@@ -113,4 +182,10 @@ class MainWindow(QMainWindow):
                 qApp.quit()
 
         def restart_click(self):
+                # Running tests continue from their checkpoints after the restart
+                if self.dashboard is not None:
+                        self.dashboard.save_states()
+                for gb in self.batt_groupbox:
+                        if gb.battery_connected:
+                                gb.battery.save_state()
                 os.execl(sys.executable, sys.executable, *sys.argv)
\ No newline at end of file
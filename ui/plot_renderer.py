@@ -0,0 +1,215 @@
+import os
+import traceback
+import csv
+import threading
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import blended_transform_factory
+from tools.logger import Type, State
+
+########################################
+# Constants
+########################################
+FIG_WIDTH = 10
+FIG_HEIGHT = 8
+FIG_DPI = 100
+VOLTAGE_YLIM = [17, 32]
+X_LABEL = 'Time'
+
+###########################################
+# PlotTemplate Class
+# Responsible for:
+#   - Holding a preconfigured figure for one data type
+#   - Swapping data into the existing artists between renders
+###########################################
+class PlotTemplate:
+    def __init__(self, type):
+        self.type = type
+        self.fig = Figure(figsize=(FIG_WIDTH, FIG_HEIGHT), dpi=FIG_DPI)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.axes = self.fig.add_subplot(111)
+        self.axes.xaxis_date()
+
+        self.y_label = str(type) + (" (V)" if type == Type.VOLTAGE else " (mAh)")
+        self.line, = self.axes.plot([], [], label=self.y_label)
+
+        # Plot status change lines, x in data coords and y spanning the whole axes
+        trans = blended_transform_factory(self.axes.transData, self.axes.transAxes)
+        self.charge_lines = self.axes.vlines(x=[], ymin=0, ymax=1, label=State.CHARGING, lw=1, color='green', transform=trans)
+        self.discharge_lines = self.axes.vlines(x=[], ymin=0, ymax=1, label=State.DISCHARGING, lw=1, color='red', transform=trans)
+        self.rest_lines = self.axes.vlines(x=[], ymin=0, ymax=1, label=State.RESTING, lw=0.5, color='orange', transform=trans)
+
+        self.axes.set_xlabel(X_LABEL)
+        self.axes.set_ylabel('Value')
+        if type == Type.VOLTAGE:
+            self.axes.set_ylim(VOLTAGE_YLIM)
+            self.axes.set_autoscaley_on(False)
+
+        # Shrink current axis's height by 10% on the bottom
+        box = self.axes.get_position()
+        self.axes.set_position([box.x0, box.y0 + box.height * 0.1,
+                         box.width, box.height * 0.9])
+
+        # Put a legend below current axis
+        self.axes.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15),
+                fancybox=True, shadow=True, ncol=5)
+
+    def set_data(self, x, y, charge_times, discharge_times, rest_times, sn):
+        self.line.set_data(x, y)
+        self.charge_lines.set_segments(self._status_segments(charge_times))
+        self.discharge_lines.set_segments(self._status_segments(discharge_times))
+        self.rest_lines.set_segments(self._status_segments(rest_times))
+        self.axes.set_title(f'BATTERY {self.type} OVER TIME SN-{sn}')
+
+        if len(x) > 0:
+            self.axes.relim()
+            self.axes.autoscale_view()
+
+    def save(self, file_path):
+        self.canvas.print_figure(file_path, dpi=FIG_DPI)
+
+    def _status_segments(self, times):
+        return [[(t, 0), (t, 1)] for t in mdates.date2num(times)] if len(times) > 0 else []
+
+
+###########################################
+# PlotRenderer Class
+# Responsible for:
+#   - Rendering report plots and CSVs without a display
+#   - Sharing one figure template per data type across reports
+###########################################
+class PlotRenderer:
+    templates = {}
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.type = None
+        self.batt_sn = None
+        self.x = []
+        self.y = []
+        self.charge_times = []
+        self.discharge_times = []
+        self.rest_times = []
+
+    def set_battery_data(self, x, y, charge_times, discharge_times, rest_times, type, sn):
+        self.type = type
+        self.batt_sn = sn
+        self.x = x
+        self.y = y
+        self.charge_times = charge_times
+        self.discharge_times = discharge_times
+        self.rest_times = rest_times
+
+    def save_plot(self, path):
+        try:
+            file_name = f"TIME_VS_{self.type}_PLOT.png"
+            file_path = os.path.join(path, file_name)
+            with PlotRenderer.lock:
+                template = PlotRenderer.get_template(self.type)
+                template.set_data(self.x, self.y, self.charge_times, self.discharge_times, self.rest_times, self.batt_sn)
+                template.save(file_path)
+        except:
+            print(f"ERROR SAVING PLOT: {traceback.format_exc()}")
+            return None
+        return file_path
+
+    def save_csv(self, path):
+        try:
+            file_name = f"TIME_VS_{self.type}_DATA.csv"
+            file_path = os.path.join(path, file_name)
+
+            xlabel = "Time"
+            ylabel = "Charge (mAH)" if self.type == Type.CHARGE else "Voltage (V)"
+            data = zip(self.x, self.y)
+
+            with open(file_path, 'w') as csvfile:
+                filewriter = csv.writer(csvfile)
+                filewriter.writerow([xlabel, ylabel])
+                filewriter.writerows(data)
+        except:
+            print(f"ERROR SAVING CSV: {traceback.format_exc()}")
+            return None
+        return file_path
+
+    # Templates are built once per data type and reused for every render
+    @staticmethod
+    def get_template(type):
+        if type not in PlotRenderer.templates:
+            PlotRenderer.templates[type] = PlotTemplate(type)
+        return PlotRenderer.templates[type]
+
+
+###########################################
+# FleetPlotRenderer Class
+# Responsible for:
+#   - Rendering the fleet summary report plots without a display
+###########################################
+class FleetPlotRenderer:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def save_distribution_plot(self, path):
+        fig, axes = FleetPlotRenderer._new_figure()
+        edges = self.stats['hist_edges']
+        axes.bar(edges[:-1], self.stats['hist_counts'], width=edges[1:] - edges[:-1], align='edge', edgecolor='black')
+        axes.axvline(self.stats['threshold'], color='red', lw=1, label='Pass Threshold')
+        axes.set_title('CAPACITY DISTRIBUTION')
+        axes.set_xlabel('Capacity (mAh)')
+        axes.set_ylabel('Tests')
+        axes.legend()
+        return FleetPlotRenderer._save(fig, path, "FLEET_CAPACITY_DISTRIBUTION_PLOT.png")
+
+    def save_trend_plot(self, path):
+        fig, axes = FleetPlotRenderer._new_figure()
+        for sn, (times, capacities) in self.stats['trends'].items():
+            axes.plot(times.astype(object), capacities, marker='o', lw=1, ms=3, label=sn)
+        axes.axhline(self.stats['threshold'], color='red', lw=1)
+        axes.set_title('CAPACITY OVER SUCCESSIVE RECERTIFICATIONS')
+        axes.set_xlabel('Time')
+        axes.set_ylabel('Capacity (mAh)')
+        # A legend is only readable for a handful of batteries
+        if len(self.stats['trends']) <= 10:
+            axes.legend(fontsize='small')
+        fig.autofmt_xdate()
+        return FleetPlotRenderer._save(fig, path, "FLEET_CAPACITY_TREND_PLOT.png")
+
+    def save_throughput_plot(self, path):
+        fig, axes = FleetPlotRenderer._new_figure()
+        axes.bar(self.stats['days'].astype(object), self.stats['tests_per_day'], edgecolor='black')
+        axes.set_title('STATION THROUGHPUT')
+        axes.set_xlabel('Day')
+        axes.set_ylabel('Tests Completed')
+        fig.autofmt_xdate()
+        return FleetPlotRenderer._save(fig, path, "FLEET_THROUGHPUT_PLOT.png")
+
+    @staticmethod
+    def _new_figure():
+        fig = Figure(figsize=(FIG_WIDTH, FIG_HEIGHT / 2), dpi=FIG_DPI)
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot(111)
+
+    @staticmethod
+    def _save(fig, path, file_name):
+        try:
+            file_path = os.path.join(path, file_name)
+            fig.canvas.print_figure(file_path, dpi=FIG_DPI)
+        except:
+            print(f"ERROR SAVING PLOT: {traceback.format_exc()}")
+            return None
+        return file_path
+
+
+class ReconditionPlotRenderer:
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def save_capacity_plot(self, path):
+        fig, axes = FleetPlotRenderer._new_figure()
+        numbers = range(1, len(self.cycles) + 1)
+        axes.bar(numbers, [c['cap'] for c in self.cycles], edgecolor='black')
+        axes.set_title('CAPACITY PER RECONDITION CYCLE')
+        axes.set_xlabel('Cycle')
+        axes.set_ylabel('Capacity (mAh)')
+        axes.set_xticks(numbers)
+        return FleetPlotRenderer._save(fig, path, "RECONDITION_CAPACITY_PLOT.png")
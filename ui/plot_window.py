@@ -1,8 +1,6 @@
 import matplotlib
-import os
-import traceback
-import csv
 from ui.mpl_canvas import MplCanvas
+from ui.plot_renderer import PlotRenderer
 from tools.logger import Type, State
 from PyQt5 import QtWidgets
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
@@ -14,6 +12,7 @@ class PlotWindow(QtWidgets.QWidget):
         super(PlotWindow, self).__init__(*args, **kwargs)
         
         self.sc = MplCanvas(self, width=10, height=8, dpi=100)
+        self.renderer = PlotRenderer()
 
         toolbar = NavigationToolbar(self.sc, self)
 
@@ -27,6 +26,7 @@ class PlotWindow(QtWidgets.QWidget):
         self.batt_sn = sn
         self.x = x
         self.y = y
+        self.renderer.set_battery_data(x, y, charge_times, discharge_times, rest_times, type, sn)
 
         TITLE = f'BATTERY {self.type} OVER TIME SN-{self.batt_sn}'
         X_LABEL = 'Time'
@@ -61,30 +61,9 @@ class PlotWindow(QtWidgets.QWidget):
         self.sc.axes.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15),
                 fancybox=True, shadow=True, ncol=5)
         
+    # Saving is done headlessly so files match the generated reports
     def save_plot(self, path):
-        try:
-            file_name = f"TIME_VS_{self.type}_PLOT.png"
-            file_path = os.path.join(path, file_name)
-            self.sc.fig.savefig(file_path)
-        except:
-            print(f"ERROR SAVING PLOT: {traceback.format_exc()}")
-            return None
-        return file_path
+        return self.renderer.save_plot(path)
     
     def save_csv(self, path):
-        try:
-            file_name = f"TIME_VS_{self.type}_DATA.csv"
-            file_path = os.path.join(path, file_name)
-
-            xlabel = "Time"
-            ylabel = "Charge (mAH)" if self.type == Type.CHARGE else "Voltage (V)"
-            data = zip(self.x, self.y)
-
-            with open(file_path, 'w') as csvfile:
-                filewriter = csv.writer(csvfile)
-                filewriter.writerow([xlabel, ylabel])
-                filewriter.writerows(data)
-        except:
-            print(f"ERROR SAVING CSV: {traceback.format_exc()}")
-            return None
-        return file_path
\ No newline at end of file
+        return self.renderer.save_csv(path)
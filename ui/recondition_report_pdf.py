@@ -0,0 +1,76 @@
+from ui.report_pdf import PDF
+
+########################################
+# Constants
+########################################
+ROWS_PER_PAGE = 30
+
+class ReconditionPDF(PDF):
+    def add_summary_table(self):
+        self.add_page()
+        self._add_page_title('Battery Recondition Report')
+
+        cycles = self.data['cycles']
+        first_cap = cycles[0]['cap']
+        last_cap = cycles[-1]['cap']
+
+        self.set_font('Arial', '', 12)
+        self.ln()
+        self.cell(self.WIDTH - 20, 10, f"Battery Serial Number: {self.data['sn']}", 0, align='C')
+        self.ln()
+        self.cell(self.WIDTH - 20, 10, f"Battery Capacity: {last_cap} mAh", 0, align='C')
+        self.ln(20)
+
+        # Table caption
+        self.set_font('Arial', 'I', 9)
+        self.cell(self.WIDTH - 20, 10, "Table 1: Reconditioning overview", 0, align='C')
+        self.ln()
+
+        rows = [
+            ("Cycles", len(cycles)),
+            ("Stopped", "Capacity converged" if self.data['converged'] else "Max cycles reached"),
+            ("First Cycle Capacity (mAh)", first_cap),
+            ("Last Cycle Capacity (mAh)", last_cap),
+            ("Capacity Gain (mAh)", f"{last_cap - first_cap:+d}"),
+            ("Deep Discharge Voltage (V)", self.data['min_voltage']),
+            ("Start Time", cycles[0]['c_st'].replace(microsecond=0)),
+            ("End Time", self.data['cp_et'].replace(microsecond=0)),
+            ("Duration", self.data['cp_et'].replace(microsecond=0) - cycles[0]['c_st'].replace(microsecond=0)),
+        ]
+        for label, value in rows:
+            self.cell(25, 6, "", 0, 0)
+            self._set_font(True)
+            self.cell(80, 6, label, 1, 0, 'C')
+            self._set_font(False)
+            self.cell(60, 6, str(value), 1, 0, 'C')
+            self.ln()
+
+    def add_cycle_table(self):
+        headers = ["Cycle", "Charge Start", "Discharge End", "Charged (mAh)", "Capacity (mAh)", "Gain (mAh)"]
+        widths = [16, 40, 40, 32, 32, 30]
+
+        prev_cap = None
+        for i, cycle in enumerate(self.data['cycles']):
+            if i % ROWS_PER_PAGE == 0:
+                self.add_page()
+                self._add_page_title('Cycle Results')
+                self.ln(5)
+                self._set_font(True)
+                for j in range(len(headers)):
+                    self.cell(widths[j], 7, headers[j], 1, 0, 'C')
+                self.ln()
+
+            self._set_font(False)
+            self.cell(widths[0], 6, str(i + 1), 1, 0, 'C')
+            self.cell(widths[1], 6, str(cycle['c_st'].replace(microsecond=0)), 1, 0, 'C')
+            self.cell(widths[2], 6, str(cycle['d_et'].replace(microsecond=0)), 1, 0, 'C')
+            self.cell(widths[3], 6, str(cycle['c_c']), 1, 0, 'C')
+            self.cell(widths[4], 6, str(cycle['cap']), 1, 0, 'C')
+            self.cell(widths[5], 6, "---" if prev_cap is None else f"{cycle['cap'] - prev_cap:+d}", 1, 0, 'C')
+            self.ln()
+            prev_cap = cycle['cap']
+
+    def add_cycle_plot(self, plot):
+        self.add_page()
+        self._add_page_title('Capacity per Cycle')
+        self.image(plot, x=15, y=31, w=self.WIDTH - 30)
@@ -31,6 +31,12 @@ class PDF(FPDF):
         self.cell(self.WIDTH - 20, 10, f"Battery Serial Number: {self.data['sn']}", 0, align='C')
         self.ln()
         self.cell(self.WIDTH - 20, 10, f"Battery Capacity: {self.data['cap']} mAh", 0, align='C')
+        if self.data.get('cap_predicted'):
+            # Discharge was stopped early, the capacity is an estimate
+            self.ln()
+            self.set_font('Arial', 'I', 10)
+            low, high = self.data['cap_ci']
+            self.cell(self.WIDTH - 20, 10, f"Predicted from the discharge curve, 95% confidence interval {round(low)} - {round(high)} mAh", 0, align='C')
         self.ln(20)
 
         # Text
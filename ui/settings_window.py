@@ -28,13 +28,58 @@ class SettingsWindow(QDialog):
         self.min_voltage = QDoubleSpinBox(self)
         self.max_charge_time = QSpinBox(self)
         self.max_discharge_time = QSpinBox(self)
+        self.min_rest_time = QSpinBox(self)
+        self.max_rest_time = QSpinBox(self)
+        self.rest_voltage_slope = QDoubleSpinBox(self)
+        self.predictive_discharge = QCheckBox(self)
+        self.prediction_tolerance = QDoubleSpinBox(self)
+        self.recondition_min_voltage = QDoubleSpinBox(self)
+        self.recondition_min_gain = QSpinBox(self)
+        self.recondition_max_cycles = QSpinBox(self)
         self.max_charge_time.setRange(0, 86400)
         self.max_discharge_time.setRange(0, 86400)
+        self.min_rest_time.setRange(0, 86400)
+        self.max_rest_time.setRange(0, 86400)
+        self.rest_voltage_slope.setDecimals(5)
+        self.rest_voltage_slope.setSingleStep(0.00005)
+        self.prediction_tolerance.setRange(0, 100)
+        self.recondition_min_gain.setRange(0, 10000)
+        self.recondition_max_cycles.setRange(1, 100)
         threshold_gbox_layout.addRow("Max Voltage:", self.max_voltage)
         threshold_gbox_layout.addRow("Partial Voltage:", self.partial_voltage)
         threshold_gbox_layout.addRow("Min Voltage:", self.min_voltage)
         threshold_gbox_layout.addRow("Max Charge Time (s):", self.max_charge_time)
         threshold_gbox_layout.addRow("Max Discharge Time (s):", self.max_discharge_time)
+        threshold_gbox_layout.addRow("Min Rest Time (s):", self.min_rest_time)
+        threshold_gbox_layout.addRow("Max Rest Time (s):", self.max_rest_time)
+        threshold_gbox_layout.addRow("Rest Voltage Slope (V/s):", self.rest_voltage_slope)
+        threshold_gbox_layout.addRow("Predict Capacity:", self.predictive_discharge)
+        threshold_gbox_layout.addRow("Prediction Tolerance (%):", self.prediction_tolerance)
+        threshold_gbox_layout.addRow("Recondition Min Voltage:", self.recondition_min_voltage)
+        threshold_gbox_layout.addRow("Recondition Min Gain (mAh):", self.recondition_min_gain)
+        threshold_gbox_layout.addRow("Recondition Max Cycles:", self.recondition_max_cycles)
+
+
+        power_gbox = QGroupBox("Power Budget")
+        power_gbox_layout = QFormLayout(self)
+        power_gbox.setLayout(power_gbox_layout)
+
+        self.charge_power = QDoubleSpinBox(self)
+        self.discharge_power = QDoubleSpinBox(self)
+        self.charge_power_budget = QDoubleSpinBox(self)
+        self.discharge_power_budget = QDoubleSpinBox(self)
+        self.phase_stagger = QSpinBox(self)
+        self.charge_power.setRange(0, 10000)
+        self.discharge_power.setRange(0, 10000)
+        self.charge_power_budget.setRange(0, 100000)
+        self.discharge_power_budget.setRange(0, 100000)
+        self.phase_stagger.setRange(0, 3600)
+        power_gbox_layout.addRow("Charge Power per Channel (W):", self.charge_power)
+        power_gbox_layout.addRow("Discharge Power per Channel (W):", self.discharge_power)
+        power_gbox_layout.addRow("Charge Power Budget (W):", self.charge_power_budget)
+        power_gbox_layout.addRow("Discharge Power Budget (W):", self.discharge_power_budget)
+        power_gbox_layout.addRow("Phase Stagger (s):", self.phase_stagger)
+        power_gbox_layout.addWidget(QLabel("*Budget of 0 W means no limit"))
 
 
         paths_gbox = QGroupBox("Folder Paths")
@@ -53,6 +98,7 @@ class SettingsWindow(QDialog):
         layout.addWidget(general_gbox)
         layout.addWidget(paths_gbox)
         layout.addWidget(thresholds_gbox)
+        layout.addWidget(power_gbox)
         layout.addWidget(buttonBox)
 
         buttonBox.accepted.connect(self.accept)
@@ -70,6 +116,19 @@ class SettingsWindow(QDialog):
         self.min_voltage.setValue(config[Config.MIN_VOLTAGE_KEY])
         self.max_charge_time.setValue(config[Config.MAX_CHARGE_TIME_KEY])
         self.max_discharge_time.setValue(config[Config.MAX_DISCHARGE_TIME_KEY])
+        self.min_rest_time.setValue(config[Config.MIN_REST_TIME_KEY])
+        self.max_rest_time.setValue(config[Config.MAX_REST_TIME_KEY])
+        self.rest_voltage_slope.setValue(config[Config.REST_VOLTAGE_SLOPE_KEY])
+        self.predictive_discharge.setChecked(config[Config.PREDICTIVE_DISCHARGE_KEY])
+        self.prediction_tolerance.setValue(config[Config.PREDICTION_TOLERANCE_KEY] * 100)
+        self.recondition_min_voltage.setValue(config[Config.RECONDITION_MIN_VOLTAGE_KEY])
+        self.recondition_min_gain.setValue(config[Config.RECONDITION_MIN_GAIN_KEY])
+        self.recondition_max_cycles.setValue(config[Config.RECONDITION_MAX_CYCLES_KEY])
+        self.charge_power.setValue(config[Config.CHARGE_POWER_KEY])
+        self.discharge_power.setValue(config[Config.DISCHARGE_POWER_KEY])
+        self.charge_power_budget.setValue(config[Config.CHARGE_POWER_BUDGET_KEY])
+        self.discharge_power_budget.setValue(config[Config.DISCHARGE_POWER_BUDGET_KEY])
+        self.phase_stagger.setValue(config[Config.PHASE_STAGGER_KEY])
     
     def accept(self):
         logs_path = self.logs_folder.text()
@@ -102,6 +161,19 @@ class SettingsWindow(QDialog):
         Config.config[Config.MIN_VOLTAGE_KEY]           = self.min_voltage.value()
         Config.config[Config.MAX_CHARGE_TIME_KEY]       = self.max_charge_time.value()
         Config.config[Config.MAX_DISCHARGE_TIME_KEY]    = self.max_discharge_time.value()
+        Config.config[Config.MIN_REST_TIME_KEY]         = self.min_rest_time.value()
+        Config.config[Config.MAX_REST_TIME_KEY]         = self.max_rest_time.value()
+        Config.config[Config.REST_VOLTAGE_SLOPE_KEY]    = self.rest_voltage_slope.value()
+        Config.config[Config.PREDICTIVE_DISCHARGE_KEY]  = self.predictive_discharge.isChecked()
+        Config.config[Config.PREDICTION_TOLERANCE_KEY]  = self.prediction_tolerance.value() / 100
+        Config.config[Config.RECONDITION_MIN_VOLTAGE_KEY]   = self.recondition_min_voltage.value()
+        Config.config[Config.RECONDITION_MIN_GAIN_KEY]      = self.recondition_min_gain.value()
+        Config.config[Config.RECONDITION_MAX_CYCLES_KEY]    = self.recondition_max_cycles.value()
+        Config.config[Config.CHARGE_POWER_KEY]              = self.charge_power.value()
+        Config.config[Config.DISCHARGE_POWER_KEY]           = self.discharge_power.value()
+        Config.config[Config.CHARGE_POWER_BUDGET_KEY]       = self.charge_power_budget.value()
+        Config.config[Config.DISCHARGE_POWER_BUDGET_KEY]    = self.discharge_power_budget.value()
+        Config.config[Config.PHASE_STAGGER_KEY]             = self.phase_stagger.value()
         Config.config[Config.LOGS_FOLDER_KEY]           = logs_path
         Config.config[Config.REPORTS_FOLDER_KEY]        = reports_path
         Config.save_config()
@@ -0,0 +1,226 @@
+from tools.station import Station
+from tools.supervisor import ProcessStation
+from tools.async_station import AsyncStation
+from tools.channel import check_serial_num
+from tools.logger import Logger, Type, Action
+from tools.telemetry_ring import TelemetryRing
+from tools.telemetry_server import TelemetryPublisher
+from tools.metrics import Metrics
+from ui.station_model import StationTableModel
+from ui.plot_window import PlotWindow
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from global_consts import Config
+import time
+
+########################################
+# Station Update Thread Subclass
+########################################
+class StationUpdateThread(QThread):
+        snapshots = pyqtSignal(list)
+
+        def __init__(self, station, parent=None):
+                super().__init__(parent)
+                self.paused = True
+                self.station = station
+
+        # Every battery is updated from this thread, the GUI thread only posts commands
+        def run(self):
+                scheduled = None        # When the next update was due, None if woken early
+                while not self.isInterruptionRequested():
+                        if self.paused:
+                                scheduled = None
+                                time.sleep(0.1)
+                                continue
+                        start = time.time()
+                        update_time = Config.config[Config.UPDATE_TIME_KEY]
+                        if scheduled is not None:
+                                Metrics.get_metrics().tick('station_thread', start - scheduled, update_time)
+                        snapshots = self.station.update()
+                        TelemetryPublisher.get_publisher().publish(snapshots)
+                        self.snapshots.emit(snapshots)
+                        # Wait out the rest of the update time, waking up early to stop, run posted
+                        # commands or handle a battery being connected or removed
+                        scheduled = start + update_time
+                        while not self.isInterruptionRequested() and time.time() < scheduled:
+                                if self.station.wait(0.1):
+                                        scheduled = None
+                                        break
+
+        def pause(self):
+                self.paused = True
+
+        def resume(self):
+                self.paused = False
+
+        def stop(self):
+                self.requestInterruption()
+                self.wait()
+
+
+########################################
+# Station Dashboard Subclass
+# One table row per channel, for stations with many batteries
+########################################
+class StationDashboard(QWidget):
+        # processes: run each channel in its own worker process
+        # async_engine: update the channels from asyncio coroutines, unless processes is set
+        def __init__(self, num_channels, processes=False, async_engine=False, parent=None):
+                super().__init__(parent)
+                self.latest_snapshots = []
+
+                self.model = StationTableModel(num_channels, self)
+                self.table = QTableView(self)
+                self.table.setModel(self.model)
+                self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+                self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+                self.table.verticalHeader().setVisible(False)
+                self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+                self.table.setContextMenuPolicy(Qt.CustomContextMenu)
+                self.table.customContextMenuRequested.connect(self.show_context_menu)
+                self.table.doubleClicked.connect(self.open_report)
+
+                layout = QVBoxLayout()
+                layout.setContentsMargins(0, 0, 0, 0)
+                layout.addWidget(self.table)
+                self.setLayout(layout)
+
+                if processes:
+                        station = ProcessStation()
+                elif async_engine:
+                        station = AsyncStation()
+                else:
+                        station = Station()
+                self.update_thread = StationUpdateThread(station, self)
+                self.update_thread.snapshots.connect(self.on_snapshots)
+                self.update_thread.start()
+
+        @property
+        def station(self):
+                return self.update_thread.station
+
+        def on_snapshots(self, snapshots):
+                self.latest_snapshots = snapshots
+                self.model.set_snapshots(snapshots)
+
+        # New batteries are queued by the station and get their SN from the enrollment panel
+        def enroll(self, idx, sn):
+                self.station.enroll(idx, sn)
+
+        def start_threads(self):
+                self.update_thread.resume()
+
+        def cleanup(self):
+                self.update_thread.stop()
+                self.station.cleanup()
+
+        # Running tests continue from their checkpoints after a restart
+        def save_states(self):
+                self.station.save_states()
+
+        def selected_rows(self):
+                return sorted({index.row() for index in self.table.selectionModel().selectedRows()})
+
+        # Set an action on every selected battery
+        def set_action(self, action):
+                for row in self.selected_rows():
+                        if action == Action.CAPACITY_TEST:
+                                self.station.command(row, 'queue_capacity_test')
+                        else:
+                                self.station.command(row, 'set_action', action)
+
+        def modify_sn(self, row):
+                snapshot = self.model.snapshot(row)
+                sn, status = QInputDialog.getText(self, f"Battery {row + 1}: Input SN", f"Enter SN for Battery {row + 1}:", text=snapshot.serial_num)
+                error = check_serial_num(sn)
+                if status and error:
+                        self.show_error(row, error)
+                elif status:
+                        self.station.command(row, 'set_serial_num', sn)
+
+        def toggle_logs(self, row):
+                self.station.command(row, 'toggle_do_logs')
+
+        # Logs are read from their files, the battery may live in another process
+        def view_logs(self, row):
+                snapshot = self.model.snapshot(row)
+                if snapshot is not None and snapshot.log_file and Logger.from_file(snapshot.log_file).view():
+                        self.show_error(row, "Could not open log file! Please check to make sure it exists.")
+
+        def plot_data(self, row, type):
+                snapshot = self.model.snapshot(row)
+                if snapshot is None or not snapshot.log_file:
+                        return
+                self.plot_window = PlotWindow()
+                # The ring is read without reparsing the log, unless the session started before it
+                ring = TelemetryRing.open(row)
+                if ring is not None and ring.covers_session():
+                        x, y, charge_times, discharge_times, rest_times = ring.get_data(type)
+                else:
+                        x, y, charge_times, discharge_times, rest_times = Logger.from_file(snapshot.log_file).get_data(type)
+                if ring is not None:
+                        ring.close()
+                self.plot_window.set_battery_data(x, y, charge_times, discharge_times, rest_times, type, snapshot.serial_num)
+                self.plot_window.show()
+
+        def open_report(self, index):
+                snapshot = self.model.snapshot(index.row())
+                if snapshot is not None and snapshot.done and snapshot.report_folder:
+                        QDesktopServices.openUrl(QUrl.fromLocalFile(snapshot.report_folder))
+
+        def show_error(self, idx, err_msg):
+                msg = QMessageBox()
+                msg.setIcon(QMessageBox.Warning)
+                msg.setWindowTitle(f"Battery {idx + 1} Error")
+                msg.setText(err_msg)
+                msg.exec_()
+
+        def show_context_menu(self, pos):
+                rows = self.selected_rows()
+                index = self.table.indexAt(pos)
+                if index.isValid() and index.row() not in rows:
+                        self.table.selectRow(index.row())
+                        rows = [index.row()]
+                if not rows:
+                        return
+                connected = [r for r in rows if self.model.snapshot(r) is not None and self.model.snapshot(r).connected]
+
+                menu = QMenu(self)
+                menu.addSection(f"Battery {rows[0] + 1}" if len(rows) == 1 else f"{len(rows)} Batteries")
+
+                ################ Battery Actions ################
+                actions = [("&Run Capacity Test", Action.CAPACITY_TEST), ("R&econdition", Action.RECONDITION), None,
+                           ("&Rest", Action.REST), ("&Charge Full", Action.CHARGE_FULL), ("Charge &Partial", Action.CHARGE_PARTIAL),
+                           ("&Discharge Full", Action.DISCHARGE_FULL), ("Discharge Pa&rtial", Action.DISCHARGE_PARTIAL)]
+                for item in actions:
+                        if item is None:
+                                menu.addSeparator()
+                                continue
+                        text, action = item
+                        menu_action = menu.addAction(text)
+                        menu_action.triggered.connect(lambda x, action=action: self.set_action(action))
+                        menu_action.setEnabled(bool(connected))
+
+                ################ Single Battery Actions ################
+                menu.addSeparator()
+                single = len(rows) == 1 and bool(connected)
+                row = rows[0]
+                modify_sn_action = menu.addAction("&Modify SN")
+                logging_toggle = menu.addAction("&Logging")
+                view_logs_action = menu.addAction("&View Log")
+                plot_voltage_action = menu.addAction("Plot &Voltage")
+                plot_charge_action = menu.addAction("Plot C&harge")
+
+                logging_toggle.setCheckable(True)
+                if single:
+                        logging_toggle.setChecked(self.model.snapshot(row).do_logs)
+                modify_sn_action.triggered.connect(lambda x: self.modify_sn(row))
+                logging_toggle.triggered.connect(lambda x: self.toggle_logs(row))
+                view_logs_action.triggered.connect(lambda x: self.view_logs(row))
+                plot_voltage_action.triggered.connect(lambda x: self.plot_data(row, Type.VOLTAGE))
+                plot_charge_action.triggered.connect(lambda x: self.plot_data(row, Type.CHARGE))
+                for menu_action in (modify_sn_action, logging_toggle, view_logs_action, plot_voltage_action, plot_charge_action):
+                        menu_action.setEnabled(single)
+
+                menu.exec_(self.table.viewport().mapToGlobal(pos))
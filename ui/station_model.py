@@ -0,0 +1,132 @@
+from tools.logger import State, Warning
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QTimer, Qt
+from PyQt5.QtGui import QColor
+
+########################################
+# Constants
+########################################
+MAX_REFRESH_RATE = 4        # Hz, views are repainted at most this often
+INVALID = -1
+UNKNOWN = "Unknown"
+EMPTY = "---"
+
+HEADERS = ["Battery", "SN", "Status", "Action", "Voltage (V)", "Charge (mAH)", "Capacity (mAH)",
+           "Time", "Phase Done", "Test Done", "Warning"]
+STATUS_COLUMN = 2
+WARNING_COLUMN = 10
+
+STATUS_COLORS = {
+    State.CHARGING: QColor("green"),
+    State.DISCHARGING: QColor("orange"),
+}
+
+###########################################
+# StationTableModel Class
+# Responsible for:
+#   - Presenting one row per station channel from its snapshots
+#   - Notifying views only of the cells whose text changed,
+#     at most MAX_REFRESH_RATE times a second
+###########################################
+class StationTableModel(QAbstractTableModel):
+    def __init__(self, num_channels, parent=None):
+        super().__init__(parent)
+        self.rows = [self._format(None, i) for i in range(num_channels)]
+        self.snapshots = [None] * num_channels
+        self.pending = {}           # Row -> newest snapshot not shown yet
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(int(1000 / MAX_REFRESH_RATE))
+        self.refresh_timer.timeout.connect(self._refresh)
+        self.refresh_timer.start()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.rows[index.row()][index.column()]
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role == Qt.ForegroundRole:
+            snapshot = self.snapshots[index.row()]
+            if snapshot is None or not snapshot.connected:
+                return None
+            if index.column() == STATUS_COLUMN:
+                return STATUS_COLORS.get(snapshot.state)
+            if index.column() == WARNING_COLUMN and snapshot.warning != Warning.NONE:
+                return QColor("orange")
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    # Snapshot currently shown for a row
+    def snapshot(self, row):
+        return self.snapshots[row]
+
+    # Queue new snapshots, they are shown on the next refresh
+    # Only the newest snapshot of each channel is kept
+    def set_snapshots(self, snapshots):
+        for snapshot in snapshots:
+            self.pending[snapshot.index] = snapshot
+
+    def _refresh(self):
+        pending = self.pending
+        self.pending = {}
+        for row, snapshot in pending.items():
+            new_row = self._format(snapshot, row)
+            old_row = self.rows[row]
+            self.rows[row] = new_row
+
+            state_changed = self.snapshots[row] is None or self.snapshots[row].state != snapshot.state
+            self.snapshots[row] = snapshot
+            changed = [c for c in range(len(HEADERS)) if new_row[c] != old_row[c]]
+            if state_changed:
+                changed.append(STATUS_COLUMN)
+            if changed:
+                self.dataChanged.emit(self.index(row, min(changed)), self.index(row, max(changed)))
+
+    @staticmethod
+    def _format(snapshot, row):
+        if snapshot is None or not snapshot.connected:
+            status = "AWAITING SN" if snapshot is not None and snapshot.awaiting_sn else "NOT CONNECTED"
+            return [str(row + 1), EMPTY, status] + [EMPTY] * (len(HEADERS) - 3)
+
+        voltage = UNKNOWN if snapshot.voltage == INVALID else str(snapshot.voltage)
+        charge = UNKNOWN if snapshot.charge == INVALID else str(snapshot.charge)
+        capacity = UNKNOWN if snapshot.capacity == INVALID else str(round(snapshot.capacity))
+        action = str(snapshot.action)
+        if snapshot.queue_position:
+            action += f" (Queued {snapshot.queue_position})"
+        warning = "" if snapshot.warning == Warning.NONE else snapshot.warning.ui_string()
+        if not warning and snapshot.done:
+            warning = "Done"
+
+        running = snapshot.state in (State.CHARGING, State.DISCHARGING)
+        return [
+            str(row + 1),
+            snapshot.serial_num,
+            str(snapshot.state),
+            action,
+            voltage,
+            charge,
+            capacity,
+            StationTableModel._duration(snapshot.elapsed) if running else EMPTY,
+            f"{snapshot.phase_eta:%H:%M}" if snapshot.phase_eta is not None and running else EMPTY,
+            f"{snapshot.test_eta:%a %H:%M}" if snapshot.test_eta is not None else EMPTY,
+            warning,
+        ]
+
+    @staticmethod
+    def _duration(seconds):
+        hours, remainder = divmod(int(seconds), 3600)
+        return f"{hours}:{remainder // 60:02d}:{remainder % 60:02d}"